@@ -0,0 +1,28 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Entry point for serving bird-proxy with gevent. The standard library is
+# patched before anything else imports it, which makes the BIRD sockets and
+# the connection pool cooperative: a request waiting for BIRD only suspends
+# its own greenlet instead of a whole worker.
+from gevent import monkey
+monkey.patch_all()
+
+from gevent.pywsgi import WSGIServer
+
+from bird_proxy import app
+
+if __name__ == "__main__":
+    WSGIServer(('127.0.0.1', 5000), app).serve_forever()
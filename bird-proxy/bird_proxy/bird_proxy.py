@@ -14,14 +14,33 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import functools
+import itertools
+import json
 import sys
+import time
 import traceback
 import re
 
-from flask import Flask, request, jsonify
-from lib import birdtool, config
+from flask import Flask, Response, g, request
+from flask import jsonify as flask_jsonify
+from flask.json import JSONEncoder
+from lib import (
+    aggregate, birdtool, config, metrics, poller, pool, query, records,
+    rib, slowlog, spool)
+
+
+class RouteJSONEncoder(JSONEncoder):
+    """JSON encoder serializing route records in the API format."""
+
+    def default(self, o):
+        if isinstance(o, records.Route):
+            return o.to_dict()
+
+        return super(RouteJSONEncoder, self).default(o)
+
 
 app = Flask(__name__)
+app.json_encoder = RouteJSONEncoder
 
 APPLICATION_NAME = 'bird-proxy'
 
@@ -36,6 +55,96 @@ except config.ConfigError as e:
 
 app.config.from_mapping(CONFIG)
 
+# streamed responses are written in chunks of about this many bytes
+STREAM_CHUNK_SIZE = 16384
+
+
+def jsonify(*args, **kwargs):
+    """`flask.jsonify`, timed for the metrics of the request."""
+    started = time.time()
+    response = flask_jsonify(*args, **kwargs)
+    g.jsonify_time = g.get('jsonify_time', 0.0) + time.time() - started
+
+    return response
+
+
+def get_caller():
+    """Return the address of the client of the request.
+
+    Behind nginx with `proxy_params` the last X-Forwarded-For address is the
+    one nginx received the request from.
+    """
+    if request.access_route:
+        return request.access_route[-1]
+
+    return request.remote_addr
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.time()
+
+    # BIRD commands run for the request are recorded under its endpoint
+    metrics.set_endpoint(request.endpoint)
+    metrics.share(app.config.get('METRICS_FOLDER'))
+
+
+@app.after_request
+def record_request_metrics(response):
+    if request.endpoint is not None:
+        metrics.REQUEST_SECONDS.observe(
+            time.time() - g.request_started, request.endpoint)
+        metrics.JSONIFY_SECONDS.observe(
+            g.get('jsonify_time', 0.0), request.endpoint)
+
+    return response
+
+
+@app.before_request
+def set_deadline():
+    """Set the time past which BIRD is not waited for anymore.
+
+    The deadline defaults to the one of the endpoint; clients may shorten it
+    with the `deadline` parameter, in seconds.
+    """
+    seconds = (app.config.get('REQUEST_DEADLINES') or {}).get(
+        request.endpoint, app.config.get('REQUEST_DEADLINE'))
+    value = request.values.get('deadline')
+
+    if value is not None:
+        try:
+            requested = float(value)
+            if requested <= 0:
+                raise ValueError()
+        except ValueError:
+            data = {
+                'message': "Invalid deadline: {}".format(value),
+                'outcome': False
+            }
+
+            return jsonify(data), 400
+
+        seconds = requested if seconds is None else min(seconds, requested)
+
+    g.deadline = None if seconds is None else g.request_started + seconds
+
+
+@app.errorhandler(pool.PoolRejected)
+def bird_busy(e):
+    # a full wait queue is the caller's cue to slow down, a wait that timed
+    # out means BIRD itself is not keeping up
+    app.logger.warning("BIRD command rejected: %s", e)
+
+    response = jsonify({'message': str(e), 'outcome': False})
+    response.status_code = 429 if isinstance(e, pool.PoolFull) else 503
+    response.headers['Retry-After'] = str(app.config.get(
+        'BIRD_POOL_RETRY_AFTER', pool.DEFAULT_RETRY_AFTER))
+
+    return response
+
+
+FIELD_REGEXP = re.compile(r'\A[a-z0-9_]+\Z')
+
 
 def sanitize(value):
     if value is not None:
@@ -44,6 +153,141 @@ def sanitize(value):
         return value
 
 
+def get_show_route_parameters(form):
+    return {
+        'forwarding_table': form.get('forwarding_table') == 'True',
+        'prefix': sanitize(form.get('prefix')),
+        'table': sanitize(form.get('table')),
+        'fltr': sanitize(form.get('fltr')),
+        'where': sanitize(form.get('where')),
+        'detail': form.get('detail') == 'True',
+        'export_mode': sanitize(form.get('export_mode')),
+        'export_protocol': sanitize(form.get('export_protocol')),
+        'protocol': sanitize(form.get('protocol')),
+    }
+
+
+def get_fields(form):
+    """Return the set of fields requested with the `fields` parameter, a
+    comma separated list, or None if all fields are requested.
+
+    Raises ValueError for invalid field names.
+    """
+    fields = form.get('fields')
+
+    if not fields:
+        return None
+
+    fields = frozenset(field.strip() for field in fields.split(','))
+
+    for field in fields:
+        if not FIELD_REGEXP.match(field):
+            raise ValueError("Invalid field: {}".format(field))
+
+    return fields
+
+
+def get_route_fields(form):
+    """Return the set of route fields requested with the `fields`
+    parameter, see `get_fields`.
+
+    Raises ValueError for invalid or unknown field names.
+    """
+    fields = get_fields(form)
+
+    unknown_fields = fields and fields - records.ROUTE_FIELDS
+    if unknown_fields:
+        raise ValueError(
+            "Invalid field: {}".format(', '.join(sorted(unknown_fields))))
+
+    return fields
+
+
+def get_where_condition(form, ip_version, where):
+    """Return the `where` condition of the show route parameters with the
+    route query of the `query` parameter added to it.
+
+    Raises query.QueryError for invalid queries.
+    """
+    route_query = form.get('query')
+
+    if not route_query:
+        return where
+
+    try:
+        route_query = json.loads(route_query)
+    except ValueError:
+        raise query.QueryError("Invalid query: not a JSON document")
+    except RuntimeError:
+        # the JSON decoder recursion is not limited otherwise
+        raise query.QueryError("Invalid query: nested too deeply")
+
+    # compiled queries are validated, they must not be sanitized
+    condition = query.compile_query(route_query, ip_version)
+
+    if where:
+        condition = "({}) && {}".format(where, condition)
+
+    return condition
+
+
+# streamed and spooled routes are encoded one at a time
+json_encode = RouteJSONEncoder().encode
+
+
+def chunked(pieces):
+    chunk = []
+    chunk_size = 0
+
+    for piece in pieces:
+        chunk.append(piece)
+        chunk_size += len(piece)
+
+        if chunk_size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_size = 0
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def generate_ndjson(routes):
+    try:
+        for route in routes:
+            yield json_encode(route) + '\n'
+
+    except birdtool.BIRDToolError as e:
+        app.logger.exception("failed to retrieve data from bird")
+
+        yield json.dumps({'outcome': False, 'message': str(e)}) + '\n'
+
+
+def generate_json_array(routes):
+    yield '{"message": ['
+
+    separator = ''
+
+    try:
+        for route in routes:
+            yield separator + json_encode(route)
+            separator = ', '
+
+    except birdtool.BIRDToolError as e:
+        app.logger.exception("failed to retrieve data from bird")
+
+        yield '], "outcome": false, "error": {}}}'.format(json.dumps(str(e)))
+        return
+
+    yield '], "outcome": true}'
+
+
+STREAM_FORMATS = {
+    'ndjson': (generate_ndjson, 'application/x-ndjson'),
+    'json-stream': (generate_json_array, 'application/json'),
+}
+
+
 def token_required(f):
     @functools.wraps(f)
     def wrapped(*args, **kwargs):
@@ -78,7 +322,8 @@ def bird_deployconfig():
     ip_version = request.form.get('ip_version')
 
     try:
-        bird = birdtool.BIRDManager(ip_version, app.config)
+        bird = birdtool.BIRDManager(
+            ip_version, app.config, caller=get_caller(), deadline=g.deadline)
         config_out = bird.deploy_config(config_file)
         return jsonify({"message": config_out[1], "outcome": config_out[0]})
     except birdtool.BIRDToolError as e:
@@ -92,13 +337,53 @@ def protocol_info_verbose():
     outcome = False
 
     ip_version = request.form.get('ip_version')
+    summary = request.form.get('summary') == 'True'
+
+    try:
+        fields = get_fields(request.form)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'outcome': False}), 400
+
+    unknown_fields = (
+        fields and fields - birdtool.ProtocolInformationCommand.FIELDS)
+    if unknown_fields:
+        data = {
+            'message': "Invalid field: {}".format(
+                ', '.join(sorted(unknown_fields))),
+            'outcome': False
+        }
+
+        return jsonify(data), 400
 
     # TODO allow wildcard to be specified
     wildcard = '"peer_*"'
 
     try:
-        bird = birdtool.BIRDManager(ip_version, app.config)
-        outcome, message = bird.get_protocol_information_verbose(wildcard=wildcard)
+        bird = birdtool.BIRDManager(
+            ip_version, app.config, caller=get_caller(), deadline=g.deadline)
+
+        session_poller = poller.get_session_poller(
+            ip_version, app.config, wildcard)
+        snapshot = session_poller and session_poller.get_snapshot()
+
+        if snapshot is not None:
+            sessions = snapshot.value
+
+            if summary or fields is not None:
+                sessions = [
+                    dict((key, value) for key, value in session.iteritems()
+                         if not (summary and key == 'route_changes') and
+                         (fields is None or key in fields))
+                    for session in sessions]
+
+            return jsonify({
+                'outcome': True,
+                'message': sessions,
+                'snapshot_age': snapshot.age
+            })
+
+        outcome, message = bird.get_protocol_information_verbose(
+            wildcard=wildcard, summary=summary, fields=fields)
 
     except birdtool.BIRDToolError as e:
         app.logger.exception("failed to retrieve data from bird")
@@ -117,24 +402,294 @@ def routes_info():
     outcome = False
 
     ip_version = request.form.get('ip_version')
+    output_format = request.form.get('format', 'json')
+    parameters = get_show_route_parameters(request.form)
 
-    forwarding_table = True if request.form.get('forwarding_table') == 'True' else False
-    prefix = sanitize(request.form.get('prefix'))
-    table = sanitize(request.form.get('table'))
-    fltr = sanitize(request.form.get('fltr'))
-    where = sanitize(request.form.get('where'))
-    detail = True if request.form.get('detail') == 'True' else False
-    export_mode = sanitize(request.form.get('export_mode'))
-    export_protocol = sanitize(request.form.get('export_protocol'))
-    protocol = sanitize(request.form.get('protocol'))
+    limit = request.form.get('limit')
+    cursor = request.form.get('cursor')
 
     try:
-        bird = birdtool.BIRDManager(ip_version, app.config)
-        outcome, message = bird.get_routes_information(
-            forwarding_table=forwarding_table, prefix=prefix, table=table,
-            fltr=fltr, where=where, detail=detail,
-            export_mode=export_mode, export_protocol=export_protocol,
-            protocol=protocol)
+        parameters['fields'] = get_route_fields(request.form)
+        parameters['where'] = get_where_condition(
+            request.form, ip_version, parameters['where'])
+    except (ValueError, query.QueryError) as e:
+        return jsonify({'message': str(e), 'outcome': False}), 400
+
+    if output_format in STREAM_FORMATS and limit is None and cursor is None:
+        return stream_routes_info(ip_version, parameters, output_format)
+
+    if output_format != 'json':
+        if output_format in STREAM_FORMATS:
+            message = "Pagination is only supported with format json"
+        else:
+            message = "Invalid format: {}".format(output_format)
+
+        return jsonify({'message': message, 'outcome': False}), 400
+
+    if limit is not None or cursor is not None:
+        try:
+            limit = int(limit)
+            if limit <= 0:
+                raise ValueError()
+        except (TypeError, ValueError):
+            data = {
+                'message': "Invalid limit: {}".format(limit),
+                'outcome': False
+            }
+
+            return jsonify(data), 400
+
+        return page_routes_info(ip_version, parameters, limit, cursor)
+
+    try:
+        bird = birdtool.BIRDManager(
+            ip_version, app.config, caller=get_caller(), deadline=g.deadline)
+        outcome, message = bird.get_routes_information(**parameters)
+
+    except birdtool.BIRDToolError as e:
+        app.logger.exception("failed to retrieve data from bird")
+
+        message = str(e)
+
+    return jsonify({
+        'outcome': outcome,
+        'message': message
+    })
+
+
+def stream_routes_info(ip_version, parameters, output_format):
+    generate, mimetype = STREAM_FORMATS[output_format]
+
+    try:
+        bird = birdtool.BIRDManager(
+            ip_version, app.config, caller=get_caller(), deadline=g.deadline)
+        routes = bird.stream_routes_information(**parameters)
+
+        # BIRD reports most errors before sending any route; fetch the first
+        # route so that those still get a regular JSON response
+        first_route = next(routes, None)
+
+    except birdtool.BIRDToolError as e:
+        app.logger.exception("failed to retrieve data from bird")
+
+        return jsonify({
+            'outcome': False,
+            'message': str(e)
+        })
+
+    items = routes
+    if first_route is not None:
+        items = itertools.chain([first_route], routes)
+
+    response = Response(chunked(generate(items)), mimetype=mimetype)
+
+    # when the client goes away the server closes the response; stop reading
+    # the reply, which discards its half read BIRD connection
+    response.call_on_close(routes.close)
+
+    return response
+
+
+def page_routes_info(ip_version, parameters, limit, cursor):
+    result_spool = spool.get_spool(app.config)
+
+    try:
+        if cursor is None:
+            # spool the whole result, later pages are read from the spool
+            bird = birdtool.BIRDManager(
+                ip_version, app.config, caller=get_caller(),
+                deadline=g.deadline)
+            routes = bird.stream_routes_information(**parameters)
+
+            spool_id = result_spool.write(itertools.imap(json_encode, routes))
+            offset = 0
+        else:
+            spool_id, offset = spool.decode_cursor(cursor)
+
+        page, next_offset = result_spool.read(spool_id, offset, limit)
+
+    except (spool.InvalidCursor, spool.CursorExpired) as e:
+        return jsonify({
+            'outcome': False,
+            'message': str(e)
+        }), 400
+
+    except (birdtool.BIRDToolError, spool.SpoolError) as e:
+        app.logger.exception("failed to retrieve data from bird")
+
+        return jsonify({
+            'outcome': False,
+            'message': str(e)
+        })
+
+    if next_offset is None:
+        next_cursor = None
+    else:
+        next_cursor = spool.encode_cursor(spool_id, next_offset)
+
+    # spooled routes are already serialized
+    data = '{{"cursor": {}, "message": [{}], "outcome": true}}'.format(
+        json.dumps(next_cursor), ', '.join(page))
+
+    return Response(data, mimetype='application/json')
+
+
+@app.route('/routes/batch', methods=['POST'])
+@token_required
+def routes_batch():
+    outcome = False
+
+    ip_version = request.form.get('ip_version')
+
+    # prefixes may be given as repeated keys or separated by commas/spaces
+    prefixes = [
+        prefix
+        for value in request.form.getlist('prefixes')
+        for prefix in value.replace(',', ' ').split()]
+
+    max_prefixes = app.config.get('BATCH_MAX_PREFIXES', 500)
+
+    try:
+        fields = get_route_fields(request.form)
+
+        if not prefixes:
+            raise ValueError("Missing prefixes")
+
+        if len(prefixes) > max_prefixes:
+            raise ValueError("Too many prefixes: {} (max {})".format(
+                len(prefixes), max_prefixes))
+
+        if ip_version not in query.FAMILIES:
+            raise ValueError("Invalid IP version: {}".format(ip_version))
+
+        # prefixes go to BIRD as they are, they must be valid
+        for prefix in prefixes:
+            rib.parse_prefix(prefix, ip_version)
+
+    except (ValueError, rib.RIBError) as e:
+        return jsonify({'message': str(e), 'outcome': False}), 400
+
+    try:
+        bird = birdtool.BIRDManager(
+            ip_version, app.config, caller=get_caller(), deadline=g.deadline)
+
+        started = time.time()
+        results = bird.lookup_prefixes(
+            prefixes,
+            table=sanitize(request.form.get('table')),
+            protocol=sanitize(request.form.get('protocol')),
+            detail=request.form.get('detail') == 'True',
+            fields=fields,
+            pipeline_depth=app.config.get('BATCH_PIPELINE_DEPTH', 1))
+        duration = time.time() - started
+
+    except birdtool.BIRDToolError as e:
+        app.logger.exception("failed to retrieve data from bird")
+
+        return jsonify({
+            'outcome': outcome,
+            'message': str(e)
+        })
+
+    return jsonify({
+        'outcome': True,
+        'message': [
+            {'prefix': prefix, 'outcome': prefix_outcome, 'message': message}
+            for prefix, prefix_outcome, message, _ in results
+        ],
+        'metadata': {
+            'duration': duration,
+            'latency': [latency for _, _, _, latency in results],
+        }
+    })
+
+
+@app.route('/routes/fanout', methods=['POST'])
+@token_required
+def routes_fanout():
+    outcome = False
+
+    ip_version = request.form.get('ip_version')
+    parameters = get_show_route_parameters(request.form)
+    kind = request.form.get('fanout')
+
+    # targets may be given as repeated keys or separated by commas/spaces
+    targets = [
+        sanitize(target)
+        for value in request.form.getlist('targets')
+        for target in value.replace(',', ' ').split()]
+
+    try:
+        fields = get_route_fields(request.form)
+        parameters['where'] = get_where_condition(
+            request.form, ip_version, parameters['where'])
+
+        if kind not in birdtool.FANOUT_TARGET_REGEXPS:
+            raise ValueError("Invalid fan-out kind: {}".format(kind))
+
+    except (ValueError, query.QueryError) as e:
+        return jsonify({'message': str(e), 'outcome': False}), 400
+
+    try:
+        bird = birdtool.BIRDManager(
+            ip_version, app.config, caller=get_caller(), deadline=g.deadline)
+
+        if not targets:
+            targets = bird.get_fanout_targets(kind)
+
+        started = time.time()
+        results = bird.fanout_routes_information(
+            targets, kind, fields=fields, **parameters)
+        duration = time.time() - started
+
+    except birdtool.BIRDToolError as e:
+        app.logger.exception("failed to retrieve data from bird")
+
+        return jsonify({
+            'outcome': outcome,
+            'message': str(e)
+        })
+
+    return jsonify({
+        'outcome': True,
+        'message': [
+            {'target': target, 'outcome': target_outcome, 'message': message}
+            for target, target_outcome, message in results
+        ],
+        'metadata': {
+            'duration': duration,
+        }
+    })
+
+
+@app.route('/routes/aggregate', methods=['POST'])
+@token_required
+def routes_aggregate():
+    outcome = False
+
+    ip_version = request.form.get('ip_version')
+    parameters = get_show_route_parameters(request.form)
+    limit = request.form.get('limit')
+
+    try:
+        group_by = aggregate.parse_group_by(request.form.get('group_by'))
+        parameters['where'] = get_where_condition(
+            request.form, ip_version, parameters['where'])
+
+        if limit is not None:
+            if not limit.isdigit() or int(limit) <= 0:
+                raise ValueError("Invalid limit: {}".format(limit))
+
+            limit = int(limit)
+
+    except (ValueError, aggregate.AggregateError, query.QueryError) as e:
+        return jsonify({'message': str(e), 'outcome': False}), 400
+
+    try:
+        bird = birdtool.BIRDManager(
+            ip_version, app.config, caller=get_caller(), deadline=g.deadline)
+        outcome, message = bird.get_routes_aggregate(
+            group_by, limit=limit, **parameters)
 
     except birdtool.BIRDToolError as e:
         app.logger.exception("failed to retrieve data from bird")
@@ -145,3 +700,170 @@ def routes_info():
         'outcome': outcome,
         'message': message
     })
+
+
+def get_rib_snapshot(ip_version):
+    """Return the latest RIB snapshot of a BIRD process, or None and the
+    reason there is none."""
+    if ip_version not in query.FAMILIES:
+        return None, "Invalid IP version: {}".format(ip_version)
+
+    rib_poller = poller.get_rib_poller(ip_version, app.config)
+    if rib_poller is None:
+        return None, "RIB snapshots are disabled"
+
+    snapshot = rib_poller.get_snapshot()
+    if snapshot is None:
+        return None, "RIB snapshot not available yet"
+
+    return snapshot, None
+
+
+def find_rib_routes(find, key):
+    """Respond with the routes `find(rib, table, value)` returns from the
+    RIB snapshot, `value` being that of the `key` request parameter."""
+    ip_version = request.form.get('ip_version')
+
+    snapshot, message = get_rib_snapshot(ip_version)
+    if snapshot is None:
+        return jsonify({'message': message, 'outcome': False})
+
+    value = request.form.get(key)
+    if not value:
+        return jsonify({'message': "Missing {}".format(key),
+                        'outcome': False}), 400
+
+    try:
+        routes = find(snapshot.value, request.form.get('table') or None, value)
+    except rib.RIBError as e:
+        return jsonify({'message': str(e), 'outcome': False}), 400
+
+    return jsonify({
+        'outcome': True,
+        'message': routes,
+        'snapshot_id': snapshot.value.id,
+        'snapshot_age': snapshot.age,
+        'snapshot_duration': snapshot.duration
+    })
+
+
+@app.route('/rib/lookup', methods=['POST'])
+@token_required
+def rib_lookup():
+    match = request.form.get('match', rib.MATCH_LONGEST)
+
+    return find_rib_routes(
+        lambda snapshot, table, prefix: snapshot.lookup(
+            table, prefix, match=match),
+        'prefix')
+
+
+@app.route('/rib/origin', methods=['POST'])
+@token_required
+def rib_origin():
+    return find_rib_routes(rib.RIB.find_origin_as, 'as_number')
+
+
+@app.route('/rib/community', methods=['POST'])
+@token_required
+def rib_community():
+    return find_rib_routes(rib.RIB.find_community, 'community')
+
+
+@app.route('/rib/protocol', methods=['POST'])
+@token_required
+def rib_protocol():
+    return find_rib_routes(rib.RIB.find_protocol, 'protocol')
+
+
+@app.route('/rib/changes', methods=['POST'])
+@token_required
+def rib_changes():
+    ip_version = request.form.get('ip_version')
+
+    snapshot, message = get_rib_snapshot(ip_version)
+    if snapshot is None:
+        return jsonify({'message': message, 'outcome': False})
+
+    try:
+        changes = snapshot.value.get_changes(
+            request.form.get('since') or None,
+            table=request.form.get('table') or None)
+    except rib.UnknownSnapshot as e:
+        # the client has to start over from the complete snapshot
+        return jsonify({
+            'outcome': False,
+            'message': str(e),
+            'resync': True,
+            'snapshot_id': snapshot.value.id
+        })
+    except rib.RIBError as e:
+        return jsonify({'message': str(e), 'outcome': False}), 400
+
+    return jsonify({
+        'outcome': True,
+        'message': changes,
+        'snapshot_id': snapshot.value.id,
+        'snapshot_age': snapshot.age,
+        'snapshot_duration': snapshot.duration
+    })
+
+
+def metrics_token_required(f):
+    """Like `token_required`, also accepting the read-only `METRICS_TOKEN`
+    as a bearer token in the Authorization header, which scrapers can send
+    with GET requests."""
+    @functools.wraps(f)
+    def wrapped(*args, **kwargs):
+        metrics_token = app.config.get('METRICS_TOKEN')
+        authorization = request.headers.get('Authorization', '')
+
+        if (metrics_token and
+                authorization == 'Bearer {}'.format(metrics_token)):
+            return f(*args, **kwargs)
+
+        return token_required(f)(*args, **kwargs)
+    return wrapped
+
+
+@app.route('/metrics', methods=['GET', 'POST'])
+@metrics_token_required
+def prometheus_metrics():
+    return Response(metrics.render(app.config.get('METRICS_FOLDER')),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/slowcommands', methods=['POST'])
+@token_required
+def slow_commands():
+    limit = request.form.get('limit', '10')
+
+    if not limit.isdigit() or int(limit) <= 0:
+        return jsonify({'message': "Invalid limit: {}".format(limit),
+                        'outcome': False}), 400
+
+    slow_log = slowlog.get_slow_log(app.config)
+    if slow_log is None:
+        return jsonify({'message': "Slow command log disabled",
+                        'outcome': False})
+
+    return jsonify({
+        'outcome': True,
+        'message': slow_log.get_slowest(int(limit))
+    })
+
+
+@app.route('/stats', methods=['POST'])
+@token_required
+def stats():
+    message = {}
+
+    for ip_version in ('ipv4', 'ipv6'):
+        bird = birdtool.BIRDManager(ip_version, app.config)
+        message[ip_version] = bird.get_stats()
+        message[ip_version]['pollers'] = poller.get_stats(ip_version)
+
+    return jsonify({
+        'outcome': True,
+        'message': message
+    })
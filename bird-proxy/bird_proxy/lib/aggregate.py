@@ -0,0 +1,128 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import itertools
+
+from bird_proxy.lib import records
+
+
+class AggregateError(Exception):
+    pass
+
+
+def get_origin_as(route):
+    """Return the origin AS of a route as an integer, or None if the route
+    has no AS path or it ends with an AS set."""
+    as_path = route.get('as_path')
+
+    if not as_path:
+        return None
+
+    origin = as_path.rsplit(None, 1)[-1]
+
+    return int(origin) if origin.isdigit() else None
+
+
+def _prefix_length(route):
+    if route.prefix is None or '/' not in route.prefix:
+        return (None,)
+
+    return (int(route.prefix.rsplit('/', 1)[1]),)
+
+
+def _communities(route):
+    # routes are counted once for every community they carry
+    if not route.communities:
+        return (None,)
+
+    return records.unpack_communities(route.communities)
+
+
+# group by key -> (route field it needs, function returning the groups of
+# a route for the key)
+GROUP_KEYS = {
+    'peer': ('peer', lambda route: (route.peer,)),
+    'source': ('source', lambda route: (route.source,)),
+    'interface': ('interface', lambda route: (route.interface,)),
+    'prefix_length': ('prefix', _prefix_length),
+    'origin_as': ('as_path', lambda route: (get_origin_as(route),)),
+    'next_hop': ('next_hop', lambda route: (route.get('next_hop'),)),
+    'community': ('community', _communities),
+}
+
+
+def parse_group_by(value):
+    """Return the tuple of group by keys of a comma separated list."""
+    group_by = tuple(key.strip() for key in (value or '').split(',')
+                     if key.strip())
+
+    if not group_by:
+        raise AggregateError("Missing group by keys")
+
+    for key in group_by:
+        if key not in GROUP_KEYS:
+            raise AggregateError("Invalid group by key: {}".format(key))
+
+    if len(set(group_by)) != len(group_by):
+        raise AggregateError("Duplicate group by keys")
+
+    return group_by
+
+
+def get_fields(group_by):
+    """Return the route fields needed to group routes by some keys."""
+    return frozenset(GROUP_KEYS[key][0] for key in group_by)
+
+
+def needs_detail(group_by):
+    """Whether grouping by some keys needs the BGP attributes of routes."""
+    return bool(get_fields(group_by) - records.SUMMARY_FIELDS)
+
+
+def count_routes(routes, group_by, limit=None):
+    """Count routes per group while iterating over them.
+
+    Only the counters are kept, so memory grows with the number of groups
+    rather than of routes. Returns the total number of routes and a list
+    of groups, largest first, limited to `limit` groups if given.
+    """
+    get_groups = [GROUP_KEYS[key][1] for key in group_by]
+
+    total = 0
+    counters = collections.Counter()
+
+    for route in routes:
+        total += 1
+
+        if len(get_groups) == 1:
+            for group in get_groups[0](route):
+                counters[(group,)] += 1
+        else:
+            for group in itertools.product(
+                    *[get_group(route) for get_group in get_groups]):
+                counters[group] += 1
+
+    groups = []
+
+    for group, count in counters.most_common(limit):
+        group = dict(zip(group_by, group))
+        group['routes'] = count
+        groups.append(group)
+
+    return {
+        'routes': total,
+        'groups': groups,
+    }
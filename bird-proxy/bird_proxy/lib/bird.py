@@ -14,10 +14,12 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import select
 import socket
 import sys
+import time
 
-BUFSIZE = 4096
+BUFSIZE = 65536
 
 SUCCESS_CODES = {
     "0000": "OK",
@@ -84,34 +86,94 @@ ERROR_CODES = {
     "9002": "Invalid symbol type",
 }
 
-END_CODES = ERROR_CODES.keys() + SUCCESS_CODES.keys()
+END_CODES = frozenset(ERROR_CODES.keys() + SUCCESS_CODES.keys())
+
+
+class DeadlineExceeded(socket.timeout):
+    pass
 
 
 class BirdSocket:
 
-    def __init__(self, host="", port="", file="", timeout=10.0):
+    def __init__(self, host="", port="", file="", timeout=10.0,
+                 bufsize=BUFSIZE):
         self.__file = file
         self.__host = host
         self.__port = port
         self.__sock = None
         self.__timeout = timeout
 
-    def __connect(self, timeout=10.0):
+        # receive buffer and the window of bytes received but not consumed
+        self.__buffer = bytearray(bufsize)
+        self.__start = 0
+        self.__end = 0
+
+    @property
+    def file(self):
+        return self.__file
+
+    @property
+    def connected(self):
+        return self.__sock is not None
+
+    def is_healthy(self):
+        """Check whether an idle connection can be reused.
+
+        An idle connection must not have anything to read: if it does, BIRD
+        either closed it or it is out of sync with the commands we sent.
+        """
+        if not self.__sock or self.__start != self.__end:
+            return False
+
+        try:
+            readable, _, _ = select.select([self.__sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return False
+
+        return not readable
+
+    def __connect(self, timeout=10.0, stats=None, deadline=None):
         if self.__sock:
             return
 
-        if not file:
-            self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.__sock.settimeout(timeout)
-            self.__sock.connect((self.__host, self.__port))
-        else:
-            self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-            self.__sock.settimeout(timeout)
-            self.__sock.connect(self.__file)
+        started = time.time()
+        # whether the connection times out at the deadline
+        at_deadline = False
+
+        if deadline is not None:
+            if deadline <= started:
+                raise DeadlineExceeded("deadline exceeded")
+
+            if timeout is None or deadline - started < timeout:
+                timeout = deadline - started
+                at_deadline = True
+
+        try:
+            if not self.__file:
+                self.__sock = socket.socket(
+                    socket.AF_INET, socket.SOCK_STREAM)
+                self.__sock.settimeout(timeout)
+                self.__sock.connect((self.__host, self.__port))
+            else:
+                self.__sock = socket.socket(
+                    socket.AF_UNIX, socket.SOCK_STREAM)
+                self.__sock.settimeout(timeout)
+                self.__sock.connect(self.__file)
+        except socket.timeout:
+            if at_deadline:
+                raise DeadlineExceeded("deadline exceeded")
+            raise
+
+        self.__start = self.__end = 0
 
-        self.__sock.recv(1024)
+        # skip the welcome banner
+        for line in self.__readlines(deadline=deadline):
+            break
         # self.cmd("restrict")
 
+        if stats is not None:
+            stats.connect += time.time() - started
+
     def close(self):
         if self.__sock:
             try:
@@ -120,39 +182,136 @@ class BirdSocket:
                 pass
             self.__sock = None
 
-    def cmd(self, cmd, allow_empty_lines=False):
+    def cmd(self, cmd, allow_empty_lines=False, stats=None, deadline=None):
         try:
-            self.__connect(timeout=self.__timeout)
-            self.__sock.send(cmd + "\n")
-            data = self.__read(allow_empty_lines=allow_empty_lines)
+            self.__connect(
+                timeout=self.__timeout, stats=stats, deadline=deadline)
+            self.__sock.sendall(cmd + "\n")
+            data = self.__read(
+                allow_empty_lines=allow_empty_lines, stats=stats,
+                deadline=deadline)
             return data
         except socket.error:
             why = sys.exc_info()[1]
             self.close()
             return False, "Bird connection problem: %s" % why
 
-    def __read(self, allow_empty_lines=False):
-        code = "7000"  # Not used in bird
-        outcome = True
-        parsed_string = ""
-        lastline = ""
+    def __readlines(self, stats=None, deadline=None):
+        """Yield the lines of a reply as they come off the socket.
+
+        Data is received into a reusable buffer; every chunk is scanned once
+        for its last newline and the complete lines before it are split off
+        in one go. Only a trailing partial line is ever moved within the
+        buffer. Bytes that were received but not consumed are kept for the
+        next call.
+
+        Time spent receiving and the bytes and lines received are added to
+        `stats`, a `metrics.ReplyStats`, if given.
+
+        No data is waited for past `deadline`, a `time.time()` value, if
+        given; `DeadlineExceeded` is raised instead.
+        """
+        buf = self.__buffer
+        start = self.__start
+        end = self.__end
+        scan = start
+        # whether the socket times out at the deadline rather than after
+        # the socket timeout; it may do so a little before the deadline
+        at_deadline = False
+
+        try:
+            while True:
+                newline = buf.rfind(b"\n", scan, end)
+
+                if newline < 0:
+                    if start == end:
+                        start = end = 0
+                    elif end == len(buf):
+                        if start:
+                            # move the partial line to the front of the buffer
+                            buf[:end - start] = buf[start:end]
+                            end -= start
+                            start = 0
+                        else:
+                            # the line does not fit in the buffer
+                            buf.extend(bytearray(len(buf)))
+                            self.__buffer = buf
+
+                    scan = end
+
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise DeadlineExceeded("deadline exceeded")
+
+                        at_deadline = (self.__timeout is None or
+                                       remaining < self.__timeout)
+                        self.__sock.settimeout(
+                            remaining if at_deadline else self.__timeout)
+
+                    if stats is None:
+                        received = self.__sock.recv_into(
+                            memoryview(buf)[end:])
+                    else:
+                        started = time.time()
+                        received = self.__sock.recv_into(
+                            memoryview(buf)[end:])
+
+                        # until the first bytes arrive BIRD is still working
+                        # on the command
+                        if stats.bytes:
+                            stats.read += time.time() - started
+                        else:
+                            stats.wait += time.time() - started
+
+                        stats.bytes += received
+
+                    if not received:
+                        raise socket.error("connection closed by BIRD")
 
-        while code not in END_CODES:
-            data = self.__sock.recv(BUFSIZE)
+                    end += received
+                    continue
 
-            lines = (lastline + data).split("\n")
+                lines = bytes(buf[start:newline]).split(b"\n")
+                scan = newline + 1
 
-            # NOTE: this if-statement has been commented out because BIRD
-            # sometimes returns less bytes than BUFSIZE while more data is
-            # on it's way. in that case we want to continue reading, but the
-            # length check caused reading to stop. why this happens is
-            # currently unclear
-            #if len(data) == BUFSIZE:
-            lastline = lines[-1]
-            lines = lines[:-1]
+                if stats is not None:
+                    stats.lines += len(lines)
+
+                for line in lines:
+                    start += len(line) + 1
+                    yield line
+
+        except socket.timeout:
+            if at_deadline or (deadline is not None and
+                               time.time() >= deadline):
+                raise DeadlineExceeded("deadline exceeded")
+
+            raise
+
+        finally:
+            self.__start = start
+            self.__end = end
+
+            if deadline is not None and self.__sock:
+                self.__sock.settimeout(self.__timeout)
+
+    def __records(self, allow_empty_lines=False, stats=None, deadline=None):
+        """Decode the lines of a reply into (code, text) records.
+
+        Continuation lines carry the code of the line they continue. Records
+        of spontaneous output lines (prefixed with `+`) have code `+` and are
+        not terminated by a newline in the reply text. Error replies are
+        yielded with their description and end the reply.
+        """
+        lines = self.__readlines(stats=stats, deadline=deadline)
+        last_code = None
+
+        try:
+            for line in lines:
+                if not (allow_empty_lines or line.strip()):
+                    continue
 
-            for line in filter(lambda x: x.strip() or
-                               allow_empty_lines, lines):
                 code = line[0:4]
 
                 # if empty lines are allowed the last line will be an empty
@@ -161,25 +320,100 @@ class BirdSocket:
                 # note that code should not be stripped; intermediary empty
                 # lines will consist of a single space
                 if allow_empty_lines and len(code) == 0:
-                    return outcome, parsed_string
+                    return
 
                 if code == "0000":
-                    outcome = True
+                    pass
                 elif code in SUCCESS_CODES:
-                    outcome = True
-                    parsed_string += "{}\n".format(line[5:])
+                    yield code, line[5:]
                 elif code in ERROR_CODES:
-                    outcome = False
-                    parsed_string += "{}: {}\n".format(ERROR_CODES.get(code),
-                                                       line[5:])
-                    return outcome, parsed_string
+                    yield code, "{}: {}".format(ERROR_CODES.get(code),
+                                                line[5:])
+                    return
                 elif code[0] in ["1", "2"]:
-                    parsed_string += line[5:] + "\n"
+                    last_code = code
+                    yield code, line[5:]
                 elif code[0] == " ":
-                    parsed_string += line[1:] + "\n"
+                    yield last_code, line[1:]
                 elif code[0] == "+":
-                    parsed_string += line[1:]
+                    yield "+", line[1:]
                 else:
-                    parsed_string += "<<<unparsable_string(%s)>>>\n" % line
+                    yield None, "<<<unparsable_string(%s)>>>" % line
+
+                # the last line of a reply carries an end code followed by a
+                # space instead of a dash
+                if line[4:5] != "-" and code in END_CODES:
+                    return
+
+        finally:
+            lines.close()
+
+    def send_cmd(self, cmd, stats=None, deadline=None):
+        """Send a command without reading its reply.
+
+        Replies are read in order with `iter_reply`, so several commands can
+        be sent ahead of reading their replies. Connection problems raise
+        `socket.error`.
+        """
+        try:
+            self.__connect(
+                timeout=self.__timeout, stats=stats, deadline=deadline)
+            self.__sock.sendall(cmd + "\n")
+        except socket.error:
+            self.close()
+            raise
+
+    def iter_reply(self, allow_empty_lines=False, stats=None, deadline=None):
+        """Yield the reply of the oldest command whose reply was not read yet
+        as (code, text) records; see `iter_cmd`.
+        """
+        complete = False
+
+        try:
+            for record in self.__records(
+                    allow_empty_lines=allow_empty_lines, stats=stats,
+                    deadline=deadline):
+                yield record
+
+            complete = True
+
+        finally:
+            if not complete:
+                self.close()
+
+    def iter_cmd(self, cmd, allow_empty_lines=False, stats=None,
+                 deadline=None):
+        """Send a command and yield its reply as (code, text) records.
+
+        Records are yielded as soon as they are received. Connection problems
+        and exceeding `deadline` raise `socket.error`. If the reply is not
+        consumed completely the connection is closed, as it would be out of
+        sync with BIRD.
+        """
+        self.send_cmd(cmd, stats=stats, deadline=deadline)
+
+        reply = self.iter_reply(
+            allow_empty_lines=allow_empty_lines, stats=stats,
+            deadline=deadline)
+        try:
+            for record in reply:
+                yield record
+        finally:
+            reply.close()
+
+    def __read(self, allow_empty_lines=False, stats=None, deadline=None):
+        outcome = True
+        parsed = []
+
+        for code, text in self.__records(
+                allow_empty_lines=allow_empty_lines, stats=stats,
+                deadline=deadline):
+            if code in ERROR_CODES:
+                outcome = False
+
+            if code == "+":
+                parsed.append(text)
+            else:
+                parsed.append(text + "\n")
 
-        return outcome, parsed_string
+        return outcome, "".join(parsed)
@@ -16,16 +16,74 @@
 import errno
 import re
 import os
+import socket
+import time
+
+from multiprocessing.pool import ThreadPool
 
 from werkzeug.utils import secure_filename
 
-from bird_proxy.lib import bird
+from bird_proxy.lib import (
+    aggregate, bird, cache, coalesce, metrics, pool, query, records, rib,
+    slowlog)
+
+
+DEFAULT_FANOUT_CONCURRENCY = 4
+DEFAULT_SPLIT_DEPTH = 0
+
+# description of the error BIRD replies with when a reply would exceed its
+# size limit
+REPLY_TOO_LONG = bird.ERROR_CODES['8000']
+
+# fan-out kind -> regexp of its targets in a generated config
+FANOUT_TARGET_REGEXPS = {
+    'protocol': re.compile(r'^\s*protocol\s+bgp\s+(\w+)', re.MULTILINE),
+    'table': re.compile(r'^\s*table\s+(T\d+)\s*;', re.MULTILINE),
+}
+
+
+def halve_prefix_range(prefix_range, bits):
+    """Return the two halves of a prefix range.
+
+    A prefix range is a (key, length, prefixes) tuple standing for
+    `<key>/<length>` and the prefixes within it, plus the (key, length)
+    tuples of `prefixes`; see `rib.parse_prefix`. The prefix of a range
+    that is split goes to its first half, so that the halves of `(0, 0, ())`
+    cover all the routes.
+    """
+    key, length, prefixes = prefix_range
+
+    return [
+        (key, length + 1, prefixes + ((key, length),)),
+        (key | 1 << (bits - length - 1), length + 1, ()),
+    ]
+
+
+def prefix_range_condition(prefix_range, ip_version):
+    """Return the `where` condition matching the routes of a prefix range,
+    see `halve_prefix_range`."""
+    key, length, prefixes = prefix_range
+
+    # prefixes of the set match exactly, <prefix>+ matches the prefix and
+    # the ones within it
+    items = [rib.format_prefix(k, l, ip_version) for k, l in prefixes]
+    items.append(rib.format_prefix(key, length, ip_version) + '+')
+
+    return "net ~ [{}]".format(', '.join(items))
 
 
 class BIRDToolError(Exception):
     pass
 
 
+class BIRDCommandError(BIRDToolError):
+
+    def __init__(self, message, code=None):
+        super(BIRDCommandError, self).__init__(message)
+        # BIRD reply code, None for connection problems
+        self.code = code
+
+
 class MissingCommandArgument(Exception):
     pass
 
@@ -34,36 +92,100 @@ class BIRDCommand(object):
 
     ALLOW_EMPTY_LINES = False
 
-    def __init__(self, bird_connection):
-        self.bird_connection = bird_connection
+    # results of read-only commands may be cached, and identical read-only
+    # commands running at the same time share one execution
+    READ_ONLY = False
 
-    def parse_result(self, result):
-        return result
+    # cost class of the command when waiting for a pooled connection
+    COST = pool.COST_CHEAP
 
-    def execute(self, **kwargs):
+    def __init__(self, bird_connection, cache=None, observer=None,
+                 deadline=None):
+        self.bird_connection = bird_connection
+        self.cache = cache
+        # called as observer(bird_command, command, stats, duration) after
+        # the command ran, see `observe`
+        self.observer = observer
+        # time.time() value past which the reply is not waited for anymore;
+        # coalesced executions share the deadline of the first one
+        self.deadline = deadline
+
+    def build(self, **kwargs):
         try:
-            command = re.sub(' +', ' ', self.COMMAND_TEMPLATE.format(**kwargs))
+            return re.sub(' +', ' ', self.COMMAND_TEMPLATE.format(**kwargs))
         except KeyError as e:
             raise MissingCommandArgument("argument {} not specified".format(e))
+
+    def result_key(self, command):
+        """Key identifying the parsed result of a command, shared by cached
+        and coalesced executions."""
+        return type(self).__name__, command
+
+    def parse_result(self, result):
+        return result
+
+    def cost(self, command):
+        return self.COST
+
+    def observe(self, command, stats, duration):
+        """Record the phases of a command that ran, `stats` being its
+        `metrics.ReplyStats`."""
+        metrics.observe_command(type(self).__name__, stats, duration)
+
+        if self.observer is not None:
+            self.observer(self, command, stats, duration)
+
+    def run(self, command):
+        stats = metrics.ReplyStats()
+        started = time.time()
+
         result = self.bird_connection.cmd(
             command,
-            allow_empty_lines=self.ALLOW_EMPTY_LINES)
+            allow_empty_lines=self.ALLOW_EMPTY_LINES,
+            stats=stats,
+            cost=self.cost(command),
+            deadline=self.deadline)
+        result = self.parse_result(result)
 
-        return self.parse_result(result)
+        self.observe(command, stats, time.time() - started)
 
+        return result
 
-class ValidateConfigCommand(BIRDCommand):
-    COMMAND_TEMPLATE = 'configure check "{config_filename}"'
+    def execute(self, **kwargs):
+        command = self.build(**kwargs)
 
+        if not self.READ_ONLY:
+            return self.run(command)
 
-class ConfigureCommand(BIRDCommand):
-    COMMAND_TEMPLATE = 'configure "{config_filename}"'
+        key = self.result_key(command)
 
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                return result
 
-class ProtocolInformationCommand(BIRDCommand):
-    COMMAND_TEMPLATE = 'show protocols all {wildcard}'
+        coalescer = coalesce.get_coalescer(self.bird_connection.file)
+        try:
+            result = coalescer.run(
+                key, self.run, command, deadline=self.deadline)
+        except coalesce.DeadlineExceeded as e:
+            return False, "Bird connection problem: {}".format(e)
 
-    ALLOW_EMPTY_LINES = True
+        if self.cache is not None and result[0] is True:
+            self.cache.put(key, result)
+
+        return result
+
+
+class StreamingBIRDCommand(BIRDCommand):
+    """Command whose reply is parsed while it is being received.
+
+    Subclasses implement `parse_lines`, a generator consuming the lines of
+    the reply text and yielding one parsed item at a time.
+    """
+
+    def parse_lines(self, lines):
+        raise NotImplementedError()
 
     def parse_result(self, data):
         success, lines = data
@@ -71,19 +193,250 @@ class ProtocolInformationCommand(BIRDCommand):
         if not success:
             return success, lines
 
-        results = []
+        return True, list(self.parse_lines(lines.splitlines()))
+
+    def iter_lines(self, command, stats=None):
+        """Yield the lines of the reply text of a command.
+
+        BIRD errors and connection problems raise `BIRDCommandError`, a
+        command not admitted to the socket raises `pool.PoolRejected`.
+        """
+        return self.iter_record_lines(self.bird_connection.iter_cmd(
+            command, allow_empty_lines=self.ALLOW_EMPTY_LINES, stats=stats,
+            cost=self.cost(command), deadline=self.deadline))
+
+    def iter_items(self, command, stats=None):
+        """Yield the parsed items of the reply of a command, recording the
+        time taken by every phase of the command in the metrics.
+
+        The time the consumer takes between items is not counted.
+        """
+        if stats is None:
+            stats = metrics.ReplyStats()
+
+        started = time.time()
+
+        try:
+            for item in self.parse_lines(self.iter_lines(command, stats)):
+                paused = time.time()
+                yield item
+                started += time.time() - paused
+        finally:
+            self.observe(command, stats, time.time() - started)
+
+    def iter_record_lines(self, records):
+        """Yield the lines of the reply text of a command from the (code,
+        text) records of its reply; see `iter_lines`.
+        """
+        # spontaneous output is not newline terminated in the reply text, so
+        # it is prepended to the line that follows it
+        partial = ""
+        error = None
+
+        try:
+            for code, text in records:
+                if code in bird.ERROR_CODES:
+                    # the error ends the reply; let the connection finish
+                    # reading it so that it can be reused
+                    error = BIRDCommandError(text, code=code)
+                    continue
+
+                if code == "+":
+                    partial += text
+                    continue
+
+                yield partial + text
+                partial = ""
+
+        except socket.error as e:
+            raise BIRDCommandError("Bird connection problem: {}".format(e))
+
+        if error is not None:
+            raise error
+
+        if partial:
+            yield partial
+
+    def stream(self, **kwargs):
+        """Execute the command, returning a generator of parsed items."""
+        command = self.build(**kwargs)
+
+        return self.iter_items(command)
+
+    def run(self, command):
+        try:
+            return True, list(self.iter_items(command))
+        except BIRDCommandError as e:
+            if e.code is None:
+                return False, str(e)
+
+            return False, "{}\n".format(e)
+
+
+class ValidateConfigCommand(BIRDCommand):
+    COMMAND_TEMPLATE = 'configure check "{config_filename}"'
+
+
+class ConfigureCommand(BIRDCommand):
+    COMMAND_TEMPLATE = 'configure "{config_filename}"'
+
+
+SESSION_NAME_REGEXP = re.compile(r'^\s*(?P<session_name>peer_[^ ]+)')
+
+DESCRIPTION_REGEXP = re.compile(r'\s+(?P<description>.*)$')
+
+ROUTES_REGEXP = re.compile(
+    r'\s+'
+    '(?P<imported>\d+) imported, '
+    '(?P<exported>\d+) exported, '
+    '(?P<preferred>\d+) preferred$')
+
+BGP_STATE_REGEXP = re.compile(r'\s+(?P<bgp_state>\w+)$')
+
+NEIGHBOR_ADDRESS_REGEXP = re.compile(r'\s+(?P<ip_address>\S+)$')
+
+NEIGHBOR_AS_REGEXP = re.compile(r'\s+(?P<as_number>\d+)$')
+
+# columns of the route change statistics table, "---" marks a counter that
+# doesn't apply
+ROUTE_CHANGE_COLUMNS = (
+    'received', 'rejected', 'filtered', 'ignored', 'accepted')
+
+
+def _parse_description(result, value):
+    match = DESCRIPTION_REGEXP.match(value)
+    if match is not None:
+        result['description'] = match.group('description')
+
+
+def _parse_routes(result, value):
+    match = ROUTES_REGEXP.match(value)
+    if match is not None:
+        result['prefixes'] = {
+            'imported': int(match.group('imported')),
+            'exported': int(match.group('exported')),
+            'preferred': int(match.group('preferred')),
+        }
+
+
+def _parse_bgp_state(result, value):
+    match = BGP_STATE_REGEXP.match(value)
+    if match is not None:
+        result['bgp_state'] = match.group('bgp_state')
+
+
+def _parse_neighbor_address(result, value):
+    match = NEIGHBOR_ADDRESS_REGEXP.match(value)
+    if match is not None:
+        result['ip_address'] = match.group('ip_address')
+
+
+def _parse_neighbor_as(result, value):
+    match = NEIGHBOR_AS_REGEXP.match(value)
+    if match is not None:
+        result['as_number'] = int(match.group('as_number'))
+
+
+def _route_change_parser(name):
+    def parse(result, value):
+        counters = value.split()
+        if len(counters) != len(ROUTE_CHANGE_COLUMNS):
+            return
+
+        result.setdefault('route_changes', {})[name] = dict(
+            (column, None if counter == '---' else int(counter))
+            for column, counter in zip(ROUTE_CHANGE_COLUMNS, counters))
+
+    return parse
+
+
+class ProtocolInformationCommand(StreamingBIRDCommand):
+    COMMAND_TEMPLATE = 'show protocols all {wildcard}'
+
+    ALLOW_EMPTY_LINES = True
+    READ_ONLY = True
+
+    # line keyword (the text before the first colon) -> function extracting
+    # its value into the session result
+    SUMMARY_LINE_PARSERS = {
+        'Description': _parse_description,
+        'Routes': _parse_routes,
+        'BGP state': _parse_bgp_state,
+        'Neighbor address': _parse_neighbor_address,
+        'Neighbor AS': _parse_neighbor_as,
+    }
+
+    LINE_PARSERS = dict(SUMMARY_LINE_PARSERS, **{
+        'Import updates': _route_change_parser('import_updates'),
+        'Import withdraws': _route_change_parser('import_withdraws'),
+        'Export updates': _route_change_parser('export_updates'),
+        'Export withdraws': _route_change_parser('export_withdraws'),
+    })
+
+    # line keyword -> session field it sets
+    LINE_FIELDS = {
+        'Description': 'description',
+        'Routes': 'prefixes',
+        'BGP state': 'bgp_state',
+        'Neighbor address': 'ip_address',
+        'Neighbor AS': 'as_number',
+        'Import updates': 'route_changes',
+        'Import withdraws': 'route_changes',
+        'Export updates': 'route_changes',
+        'Export withdraws': 'route_changes',
+    }
+
+    FIELDS = frozenset(LINE_FIELDS.values() + ['session_name'])
+
+    def __init__(self, bird_connection, cache=None, summary=False,
+                 fields=None, observer=None, deadline=None):
+        super(ProtocolInformationCommand, self).__init__(
+            bird_connection, cache=cache, observer=observer,
+            deadline=deadline)
+
+        # summary results leave out the route change statistics
+        self.summary = summary
+        # session fields to return, None for all of them; lines of fields
+        # that are not returned are not parsed
+        self.fields = fields
+
+    def result_key(self, command):
+        return super(ProtocolInformationCommand, self).result_key(
+            command) + (self.summary, self.fields)
+
+    def get_line_parsers(self):
+        line_parsers = (self.SUMMARY_LINE_PARSERS if self.summary
+                        else self.LINE_PARSERS)
+
+        if self.fields is None:
+            return line_parsers
+
+        return dict((keyword, parser)
+                    for keyword, parser in line_parsers.iteritems()
+                    if self.LINE_FIELDS[keyword] in self.fields)
+
+    def parse_lines(self, lines):
+        line_parsers = self.get_line_parsers()
+        fields = self.fields
+
         current_result = None
 
-        for line in lines.splitlines():
+        for line in lines:
             # an empty line indicates the end of the previous result
             if line == '':
                 if current_result is not None:
-                    results.append(current_result)
+                    if fields is not None:
+                        current_result = dict(
+                            (field, value)
+                            for field, value in current_result.iteritems()
+                            if field in fields)
+
+                    yield current_result
 
                 current_result = None
                 continue
 
-            new_peer = re.match(r'^\s*(?P<session_name>peer_[^ ]+)', line)
+            new_peer = SESSION_NAME_REGEXP.match(line)
             if new_peer is not None:
                 current_result = {
                     'session_name': new_peer.group('session_name'),
@@ -102,116 +455,165 @@ class ProtocolInformationCommand(BIRDCommand):
                 # we cannot continue processing if we didn't find a peer to process
                 continue
 
-            description = re.match(r'^\s*Description:\s+(?P<description>.*)$', line)
-            if description is not None:
-                current_result['description'] = description.group('description')
-
-            routes = re.match(
-                r'^\s*Routes:\s+'
-                '(?P<imported>\d+) imported, '
-                '(?P<exported>\d+) exported, '
-                '(?P<preferred>\d+) preferred$', line)
-            if routes is not None:
-                current_result['prefixes'] = {
-                    'imported': int(routes.group('imported')),
-                    'exported': int(routes.group('exported')),
-                    'preferred': int(routes.group('preferred')),
-                }
+            keyword, _, value = line.lstrip().partition(':')
+
+            parser = line_parsers.get(keyword)
+            if parser is not None:
+                parser(current_result, value)
+
+
+# route lines as printed by `show route`, e.g.
+# 193.0.0.0/21  via 193.239.116.14 on eth1 [peer_x 2017-09-01 10:11:12] * (100)
+# lines of further routes to the same prefix start with "via"
+ROUTE_LINE_REGEXP = re.compile(
+    r"(?:(?P<prefix>[a-f0-9\.:\/]+)\s+)?"
+    r"via\s+(?P<peer>[^\s]+) on (?P<interface>[^\s]+)\s*"
+    r"\[(?P<source>[^\s]+) (?P<date>[^\s]+) (?P<time>[^\]\s]+)"
+    r"(?: from (?P<peer2>[^\s]+))?\]"
+)
+
+# more lenient versions of the above, for route lines it does not match
+ROUTE_PREFIX_REGEXP = re.compile(r"(?P<prefix>[a-f0-9\.:\/]+)?\s+")
+
+ROUTE_SUMMARY_REGEXP = re.compile(
+    r"(?:.*via\s+(?P<peer>[^\s]+) on (?P<interface>[^\s]+)|(?:\w+)?)?\s*"
+    r"\[(?P<source>[^\s]+) (?P<date>[^\s]+) (?P<time>[^\]\s]+)"
+    r"(?: from (?P<peer2>[^\s]+))?\]"
+)
 
-            bgp_state = re.match(r'^\s*BGP state:\s+(?P<bgp_state>\w+)$', line)
-            if bgp_state is not None:
-                current_result['bgp_state'] = bgp_state.group('bgp_state')
 
-            ip_address = re.match(
-                r'^\s*Neighbor address:\s+'
-                '(?P<ip_address>\S+)$', line)
-            if ip_address is not None:
-                current_result['ip_address'] = ip_address.group('ip_address')
+def _parse_route_line(line):
+    """Return the (prefix, peer, interface, source, date, time, peer2) fields
+    of a route line not matched by ROUTE_LINE_REGEXP."""
+    prefix_match = ROUTE_PREFIX_REGEXP.match(line)
+    prefix = prefix_match.group('prefix') if prefix_match else None
 
-            as_number = re.match(r'^\s*Neighbor AS:\s+(?P<as_number>\d+)$', line)
-            if as_number is not None:
-                current_result['as_number'] = int(as_number.group('as_number'))
+    summary_match = ROUTE_SUMMARY_REGEXP.match(line)
+    if summary_match is None:
+        return prefix, None, None, None, None, None, None
 
-        return True, results
+    return (prefix,) + summary_match.group(
+        'peer', 'interface', 'source', 'date', 'time', 'peer2')
 
 
-class ShowRouteCommand(BIRDCommand):
+# commands showing the routes of a single prefix, cheap compared to dumps
+ROUTE_LOOKUP_REGEXP = re.compile(
+    r"^show route (?:for )?[0-9a-fA-F]*[.:][0-9a-fA-F.:]*(?:/\d+)?(?: |$)")
+
+
+class ShowRouteCommand(StreamingBIRDCommand):
 
     COMMAND_TEMPLATE = 'show route {prefix} {table} {cond} {detail} {export} {protocol}'
 
-    def parse_result(self, data):
+    READ_ONLY = True
 
-        def _format_communities(line):
-            return line.replace("(", "").replace(")", "").replace(
-                ",", ":").split()
+    COST = pool.COST_EXPENSIVE
 
-        prefix_regexp = re.compile(r"(?P<prefix>[a-f0-9\.:\/]+)?\s+")
+    def __init__(self, bird_connection, cache=None, fields=None,
+                 observer=None, deadline=None):
+        super(ShowRouteCommand, self).__init__(
+            bird_connection, cache=cache, observer=observer,
+            deadline=deadline)
 
-        route_summary_regexp = re.compile(
-            r"(?:.*via\s+(?P<peer>[^\s]+) on (?P<interface>[^\s]+)|(?:\w+)?)?\s*"
-            r"\[(?P<source>[^\s]+) (?P<date>[^\s]+) (?P<time>[^\]\s]+)(?: from (?P<peer2>[^\s]+))?\]"
-        )
+        # route fields to return, None for all of them; BGP attributes that
+        # are not returned are not parsed
+        self.fields = fields
 
-        success, lines = data
+    def result_key(self, command):
+        return super(ShowRouteCommand, self).result_key(
+            command) + (self.fields,)
 
-        if not success:
-            return success, lines
+    def cost(self, command):
+        if ROUTE_LOOKUP_REGEXP.match(command):
+            return pool.COST_CHEAP
 
-        ret = []
+        return self.COST
 
-        current_prefix = None
-        route_data = {}
+    def parse_lines(self, lines):
+        """Parse routes in a single pass, dispatching on the start of each
+        line: BGP attributes, community continuation lines and route lines.
+
+        Routes are yielded as `records.Route` objects.
+        """
+        fields = self.fields
+        if fields is None:
+            parse_attributes = parse_communities = True
+        else:
+            parse_attributes = bool(fields - records.SUMMARY_FIELDS)
+            parse_communities = 'community' in fields
 
-        for line in lines.splitlines():
+        route_match = ROUTE_LINE_REGEXP.match
+        builder = records.RouteBuilder(fields)
+        attribute = builder.attribute
+
+        current_prefix = None
+        # fields of the route being parsed, None before the first route line
+        summary = None
+        attributes = []
+        communities = None
 
+        for line in lines:
             line = line.strip()
 
-            if 'via' in line:
-                if route_data:
-                    ret.append(route_data)
-                    route_data = {}
+            if line[:4] == 'BGP.':
+                if not parse_attributes:
+                    continue
 
-                prefix_match = prefix_regexp.match(line)
-                if prefix_match:
-                    current_prefix = prefix_match.group('prefix')
+                values = line[4:].split(": ")
+                key = values[0]
 
-                route_data = {"prefix": current_prefix}
-                route_summary_match = route_summary_regexp.match(line)
-                route_summary = route_summary_match.groupdict()
-                if not route_summary['peer']:
-                    route_summary['peer'] = route_summary.pop('peer2')
+                if fields is not None and key not in fields:
+                    continue
+
+                value = values[1] if len(values) == 2 else None
+
+                if key == 'community' and value is not None:
+                    communities = value
+                elif key == 'as_path':
+                    # paths differ on most routes, sharing them gains nothing
+                    attributes.append((key, value))
                 else:
-                    del route_summary['peer2']
-                route_data.update(route_summary)
-
-            if 'BGP.' in line:
-                line_body = line[4:]
-                line_values = line_body.split(": ")
-                key = line_values[0]
-                if len(line_values) == 2:
-                    value = line_values[1]
+                    attributes.append(attribute(key, value))
+
+            elif line[:1] == '(':
+                if not parse_communities:
+                    continue
+
+                if communities is None:
+                    communities = line
                 else:
-                    value = None
-                if key == 'community':
-                    value = _format_communities(value)
-                route_data.update({key: value})
-
-            if line.startswith('('):
-                communities = route_data.get('community', [])
-                extra_communities = _format_communities(line)
-                route_data.update({'community': communities + extra_communities})
-            else:
-                continue
+                    communities += ' ' + line
+
+            elif 'via' in line:
+                if summary is not None:
+                    yield builder.route(*summary, attributes=attributes,
+                                        communities=communities)
+
+                match = route_match(line)
+                if match is not None:
+                    (prefix, peer, interface,
+                     source, date, time, peer2) = match.groups()
+                else:
+                    (prefix, peer, interface,
+                     source, date, time, peer2) = _parse_route_line(line)
+
+                if prefix is not None:
+                    current_prefix = prefix
 
-        if route_data and route_data not in ret:
-            ret.append(route_data)
+                summary = (current_prefix, peer or peer2, interface,
+                           source, date, time)
+                attributes = []
+                communities = None
 
-        return True, ret
+        if summary is not None:
+            yield builder.route(*summary, attributes=attributes,
+                                communities=communities)
 
 
 class BIRDManager(object):
 
-    def __init__(self, ip_version, bird_proxy_config):
+    def __init__(self, ip_version, bird_proxy_config, caller=None,
+                 deadline=None):
 
         if ip_version == 'ipv4':
             self.bird_socket_file = bird_proxy_config["BIRD_SOCKET"]
@@ -225,11 +627,78 @@ class BIRDManager(object):
         self.ip_version = ip_version
         self.base_config_folder = bird_proxy_config.get('BIRD_CONFIG_FOLDER')
         self.bird_socket_timeout = bird_proxy_config.get('BIRD_SOCKET_TIMEOUT')
+        self.fanout_concurrency = bird_proxy_config.get(
+            'FANOUT_CONCURRENCY', DEFAULT_FANOUT_CONCURRENCY)
+        self.split_depth = bird_proxy_config.get(
+            'ROUTES_SPLIT_DEPTH', DEFAULT_SPLIT_DEPTH)
+        self.pool = pool.get_pool(self.bird_socket_file, bird_proxy_config)
+        self.cache = cache.get_cache(self.bird_socket_file, bird_proxy_config)
+
+        # address of the client the commands are run for, if any
+        self.caller = caller
+        # time.time() value past which commands give up waiting for BIRD;
+        # configuration changes are not bound by it, BIRD would apply them
+        # anyway
+        self.deadline = deadline
+        self.slow_log = slowlog.get_slow_log(bird_proxy_config)
 
     def connect(self):
-        return bird.BirdSocket(
-            file=self.bird_socket_file,
-            timeout=self.bird_socket_timeout)
+        # the pool hands out a persistent connection for every command
+        return self.pool
+
+    def observe_command(self, bird_command, command, stats, duration):
+        """Log commands that took too long, see `BIRDCommand.observe`."""
+        if self.slow_log is None:
+            return
+
+        self.slow_log.record({
+            'timestamp': time.time(),
+            'command': command,
+            'command_class': type(bird_command).__name__,
+            'ip_version': self.ip_version,
+            'caller': self.caller,
+            'endpoint': metrics.get_endpoint(),
+            'duration': duration,
+            'bytes': stats.bytes,
+            'lines': stats.lines,
+            'phases': {
+                'connect': stats.connect,
+                'wait': stats.wait,
+                'read': stats.read,
+                'parse': max(0.0, duration - stats.connect - stats.wait -
+                             stats.read),
+            },
+        })
+
+    def get_stats(self):
+        return {
+            'pool': self.pool.get_stats(),
+            'coalescing': coalesce.get_coalescer(
+                self.bird_socket_file).get_stats(),
+            'cache': self.cache.get_stats(),
+        }
+
+    def latest_config_path(self):
+        latest_filename = 'bird-{}-latest.conf'.format(self.ip_version)
+        return os.path.join(self.base_config_folder, latest_filename)
+
+    def validate_cache(self):
+        """Flush cached results if a config was deployed since they were
+        cached, possibly by another worker process.
+
+        Deployments replace the symlink to the latest config file, so its
+        inode and modification time identify the running configuration.
+        """
+        generation = None
+
+        if self.base_config_folder:
+            try:
+                stat = os.lstat(self.latest_config_path())
+                generation = (stat.st_ino, stat.st_mtime)
+            except OSError:
+                pass
+
+        self.cache.check_generation(generation)
 
     def store_config_file(self, bird_config_file):
         bird_config_filename = os.path.join(
@@ -247,13 +716,15 @@ class BIRDManager(object):
 
         bird_config_filename = self.store_config_file(bird_config_file)
         conn = self.connect()
-        validation_out = ValidateConfigCommand(conn).execute(
+        validation_out = ValidateConfigCommand(
+            conn, observer=self.observe_command).execute(
             config_filename=bird_config_filename)
         if validation_out[0] is not True:
             os.remove(bird_config_filename)
             return validation_out
 
-        configure_out = ConfigureCommand(conn).execute(
+        configure_out = ConfigureCommand(
+            conn, observer=self.observe_command).execute(
             config_filename=bird_config_filename)
 
         # create symlink to the latest config file to keep track of what file
@@ -262,13 +733,12 @@ class BIRDManager(object):
         # succesfully
         if configure_out[0] is True:
             self.symlink_latest_config_file(bird_config_filename)
+            self.cache.flush()
 
         return configure_out
 
     def symlink_latest_config_file(self, bird_config_filename):
-        latest_filename = 'bird-{}-latest.conf'.format(self.ip_version)
-        latest_bird_config_path = os.path.join(self.base_config_folder,
-                                               latest_filename)
+        latest_bird_config_path = self.latest_config_path()
 
         try:
             os.symlink(bird_config_filename, latest_bird_config_path)
@@ -283,18 +753,27 @@ class BIRDManager(object):
             else:
                 raise
 
-    def get_protocol_information_verbose(self, wildcard=None):
+    def get_protocol_information_verbose(self, wildcard=None, use_cache=True,
+                                         summary=False, fields=None):
         conn = self.connect()
 
         if wildcard is None:
             wildcard = ''
 
-        command = ProtocolInformationCommand(conn)
+        if use_cache:
+            self.validate_cache()
+            command = ProtocolInformationCommand(
+                conn, cache=self.cache, summary=summary, fields=fields,
+                observer=self.observe_command, deadline=self.deadline)
+        else:
+            command = ProtocolInformationCommand(
+                conn, summary=summary, fields=fields,
+                observer=self.observe_command, deadline=self.deadline)
         result = command.execute(wildcard=wildcard)
 
         return result
 
-    def get_routes_information(
+    def _show_route_arguments(
             self,
             forwarding_table=False, prefix=None,
             table=None,
@@ -303,8 +782,6 @@ class BIRDManager(object):
             export_mode=None, export_protocol=None,
             protocol=None):
 
-        conn = self.connect()
-
         if prefix and forwarding_table:
             prefix = "for {}".format(prefix)
         elif not prefix:
@@ -341,10 +818,283 @@ class BIRDManager(object):
         else:
             protocol = ""
 
-        command = ShowRouteCommand(conn)
-        result = command.execute(
-            prefix=prefix, table=table,
-            cond=cond, detail=detail, export=export,
-            protocol=protocol)
+        return {
+            'prefix': prefix,
+            'table': table,
+            'cond': cond,
+            'detail': detail,
+            'export': export,
+            'protocol': protocol,
+        }
+
+    def get_routes_information(self, fields=None, split_depth=None,
+                               **kwargs):
+        """Run `show route`, returning an (outcome, routes or error message)
+        tuple.
+
+        A query BIRD refuses as too long is split in prefix ranges, halving
+        them up to `split_depth` times (`ROUTES_SPLIT_DEPTH` by default), see
+        `split_routes_information`.
+        """
+        arguments = self._show_route_arguments(**kwargs)
+
+        self.validate_cache()
+
+        command = ShowRouteCommand(
+            self.connect(), cache=self.cache, fields=fields,
+            observer=self.observe_command, deadline=self.deadline)
+        result = command.execute(**arguments)
+
+        if split_depth is None:
+            split_depth = self.split_depth
+
+        # a prefix or a filter can't be combined with a prefix range
+        if (split_depth > 0 and result[0] is not True and
+                result[1].startswith(REPLY_TOO_LONG) and
+                not kwargs.get('prefix') and not kwargs.get('fltr')):
+            result = self.split_routes_information(
+                (0, 0, ()), split_depth, fields=fields, **kwargs)
+
+            if result[0] is True and self.cache is not None:
+                self.cache.put(command.result_key(
+                    command.build(**arguments)), result)
 
         return result
+
+    def stream_routes_information(self, fields=None, **kwargs):
+        """Return a generator of the routes as they are parsed.
+
+        Invalid arguments are reported straight away; BIRD errors raise
+        BIRDCommandError while iterating.
+        """
+        arguments = self._show_route_arguments(**kwargs)
+
+        command = ShowRouteCommand(
+            self.connect(), fields=fields, observer=self.observe_command,
+            deadline=self.deadline)
+        return command.stream(**arguments)
+
+    def lookup_prefixes(self, prefixes, table=None, protocol=None,
+                        detail=False, fields=None, pipeline_depth=1):
+        """Run `show route for <prefix>` for every prefix back to back over
+        a single pooled connection.
+
+        Up to `pipeline_depth` commands are sent before their replies are
+        read. Returns a list of (prefix, outcome, routes or error message,
+        seconds spent on the prefix) tuples.
+        """
+        command = ShowRouteCommand(
+            None, fields=fields, observer=self.observe_command)
+        commands = [
+            command.build(**self._show_route_arguments(
+                forwarding_table=True, prefix=prefix, table=table,
+                detail=detail, protocol=protocol))
+            for prefix in prefixes]
+
+        # nothing would be sent before waiting for the first reply
+        pipeline_depth = max(1, pipeline_depth)
+        results = []
+
+        try:
+            # the connection is kept for the whole batch
+            with self.pool.connection(
+                    pool.COST_EXPENSIVE, self.deadline) as conn:
+                sent = 0
+
+                for prefix in prefixes:
+                    stats = metrics.ReplyStats()
+                    started = time.time()
+
+                    # commands sent ahead of the reply read next
+                    ahead = min(len(commands), len(results) + pipeline_depth)
+                    while sent < ahead:
+                        conn.send_cmd(
+                            commands[sent], deadline=self.deadline)
+                        sent += 1
+
+                    lines = command.iter_record_lines(conn.iter_reply(
+                        allow_empty_lines=command.ALLOW_EMPTY_LINES,
+                        stats=stats, deadline=self.deadline))
+
+                    try:
+                        outcome = True
+                        message = list(command.parse_lines(lines))
+                    except BIRDCommandError as e:
+                        if e.code is None:
+                            # the connection is lost, and the replies of the
+                            # commands sent ahead with it
+                            raise
+
+                        # as returned by `run`
+                        outcome, message = False, "{}\n".format(e)
+
+                    duration = time.time() - started
+                    command.observe(commands[len(results)], stats, duration)
+
+                    results.append((prefix, outcome, message, duration))
+
+        except socket.error as e:
+            error = "Bird connection problem: {}".format(e)
+        except BIRDCommandError as e:
+            error = str(e)
+
+        # prefixes left over after losing the connection
+        for prefix in prefixes[len(results):]:
+            results.append((prefix, False, error, 0.0))
+
+        return results
+
+    def get_fanout_targets(self, kind):
+        """Return the BGP protocols or the `T<asn>` tables, by `kind`, of
+        the latest deployed config in the order they are defined."""
+        try:
+            regexp = FANOUT_TARGET_REGEXPS[kind]
+        except KeyError:
+            raise BIRDToolError("Invalid fan-out kind: {}".format(kind))
+
+        try:
+            with open(self.latest_config_path()) as bird_config_file:
+                config_text = bird_config_file.read()
+        except (IOError, TypeError) as e:
+            raise BIRDToolError("Unable to read latest config: {}".format(e))
+
+        targets = []
+
+        for target in regexp.findall(config_text):
+            # tables are also named in the protocols importing into them
+            if target not in targets:
+                targets.append(target)
+
+        return targets
+
+    def _map_concurrently(self, func, items, cost=pool.COST_EXPENSIVE):
+        """Return the list of `func(item)` for every item, calling it from
+        up to `fanout_concurrency` threads at a time.
+
+        More threads than commands of the `cost` class the pool lets run at
+        once would only wait for one, and possibly time out.
+        """
+        workers = max(1, min(
+            self.fanout_concurrency, self.pool.get_size(cost), len(items)))
+
+        if workers == 1:
+            return [func(item) for item in items]
+
+        # metrics of the commands go to the endpoint of the caller
+        endpoint = metrics.get_endpoint()
+
+        def call(item):
+            metrics.set_endpoint(endpoint)
+            return func(item)
+
+        thread_pool = ThreadPool(workers)
+
+        try:
+            return thread_pool.map(call, items)
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+
+    def fanout_routes_information(self, targets, kind, fields=None,
+                                  **kwargs):
+        """Run `show route` once for every protocol or table in `targets`,
+        concurrently, see `get_fanout_targets`.
+
+        Protocols are shown with `protocol <target>`, or with `<export mode>
+        <target>` if an export mode is given. Returns a list of (target,
+        outcome, routes or error message) tuples in the order of `targets`.
+        """
+        if kind == 'table':
+            argument = 'table'
+        elif kind == 'protocol':
+            argument = ('export_protocol' if kwargs.get('export_mode')
+                        else 'protocol')
+        else:
+            raise BIRDToolError("Invalid fan-out kind: {}".format(kind))
+
+        def show_route(target):
+            arguments = dict(kwargs)
+            # the table argument is the whole clause, see /routesinfo
+            arguments[argument] = ('table {}'.format(target)
+                                   if kind == 'table' else target)
+
+            try:
+                outcome, message = self.get_routes_information(
+                    fields=fields, **arguments)
+            except (BIRDToolError, pool.PoolRejected) as e:
+                # a busy BIRD fails the target, not the whole fan-out
+                outcome, message = False, str(e)
+
+            return target, outcome, message
+
+        return self._map_concurrently(show_route, targets)
+
+    def split_routes_information(self, prefix_range, split_depth, fields=None,
+                                 **kwargs):
+        """Run `show route` for the two halves of a prefix range,
+        concurrently, and merge their routes.
+
+        Halves BIRD still refuses as too long are split again, up to
+        `split_depth` times, a level at a time so that no more parts run at
+        once than `_map_concurrently` allows. See `halve_prefix_range`.
+        """
+        bits = query.FAMILIES[self.ip_version][1]
+
+        def show_route(part):
+            condition = prefix_range_condition(part, self.ip_version)
+
+            arguments = dict(kwargs)
+            if kwargs.get('where'):
+                arguments['where'] = "({}) && {}".format(
+                    kwargs['where'], condition)
+            else:
+                arguments['where'] = condition
+
+            try:
+                return self.get_routes_information(
+                    fields=fields, split_depth=0, **arguments)
+            except pool.PoolRejected as e:
+                return False, str(e)
+
+        parts = halve_prefix_range(prefix_range, bits)
+        results = []
+
+        for depth in range(split_depth, 0, -1):
+            halves = []
+
+            for part, (outcome, message) in zip(
+                    parts, self._map_concurrently(show_route, parts)):
+                if (outcome is not True and depth > 1 and
+                        message.startswith(REPLY_TOO_LONG) and
+                        part[1] < bits):
+                    halves.extend(halve_prefix_range(part, bits))
+                elif outcome is not True:
+                    return outcome, message
+                else:
+                    results.append((part, message))
+
+            parts = halves
+
+        # parts don't overlap, in address order the routes come grouped by
+        # prefix range as from the recursive splits
+        routes = []
+
+        for _, message in sorted(results, key=lambda result: result[0][:2]):
+            routes.extend(message)
+
+        return True, routes
+
+    def get_routes_aggregate(self, group_by, limit=None, **kwargs):
+        """Count routes per group of the `aggregate.GROUP_KEYS` in
+        `group_by`, parsing only the fields the keys need.
+        """
+        kwargs['detail'] = (kwargs.get('detail') or
+                            aggregate.needs_detail(group_by))
+
+        routes = self.stream_routes_information(
+            fields=aggregate.get_fields(group_by), **kwargs)
+
+        try:
+            return True, aggregate.count_routes(routes, group_by, limit=limit)
+        except BIRDCommandError as e:
+            return False, str(e)
@@ -0,0 +1,172 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import threading
+import time
+
+DEFAULT_CACHE_SIZE = 32
+DEFAULT_CACHE_ITEMS = 100000
+
+# caches are shared by all BIRDManager instances of a process, one per BIRD
+# socket so that deploying a config flushes only its own address family
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+_UNKNOWN_GENERATION = object()
+
+
+def _result_items(result):
+    """Return the number of items (routes, sessions) of a result."""
+    _, value = result
+
+    return len(value) if isinstance(value, (list, dict)) else 1
+
+
+class ResultCache(object):
+    """Size bounded LRU cache of parsed command results with per-class TTL.
+
+    Keys are (command class name, command string) tuples; results of command
+    classes without a TTL are not cached. The cache holds at most `size`
+    results and `max_items` items of results in total; larger results are
+    not cached.
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE, ttls=None,
+                 max_items=DEFAULT_CACHE_ITEMS):
+        self.size = size
+        self.ttls = ttls or {}
+        self.max_items = max_items
+
+        # key -> (expiry time, result, items), least recently used first
+        self._entries = collections.OrderedDict()
+        self._items = 0
+        self._lock = threading.Lock()
+        self._generation = _UNKNOWN_GENERATION
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'flushes': 0,
+            'too_large': 0,
+        }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self._items -= entry[2]
+
+        return entry
+
+    def get(self, key):
+        if not self.ttls.get(key[0]):
+            return None
+
+        with self._lock:
+            entry = self._remove(key)
+
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            if entry[0] <= time.time():
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+
+            # re-insert to mark the entry as most recently used
+            self._entries[key] = entry
+            self._items += entry[2]
+            self.stats['hits'] += 1
+
+            return entry[1]
+
+    def put(self, key, result):
+        ttl = self.ttls.get(key[0])
+        if not ttl or not self.size:
+            return
+
+        items = _result_items(result)
+        now = time.time()
+
+        with self._lock:
+            if self.max_items is not None and items > self.max_items:
+                self.stats['too_large'] += 1
+                return
+
+            # drop expired entries so they don't hold on to large results
+            for expired_key, (expires, _, _) in self._entries.items():
+                if expires <= now:
+                    self._remove(expired_key)
+                    self.stats['expirations'] += 1
+
+            self._remove(key)
+            self._entries[key] = (now + ttl, result, items)
+            self._items += items
+
+            while (len(self._entries) > self.size or
+                   (self.max_items is not None and
+                    self._items > self.max_items)):
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+
+    def flush(self):
+        with self._lock:
+            self._entries.clear()
+            self._items = 0
+            self.stats['flushes'] += 1
+
+    def check_generation(self, generation):
+        """Flush the cache if the BIRD configuration generation changed.
+
+        This lets every worker process notice a config deployed by another
+        one.
+        """
+        with self._lock:
+            changed = (self._generation is not _UNKNOWN_GENERATION and
+                       generation != self._generation)
+            self._generation = generation
+
+        if changed:
+            self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['size'] = self.size
+            stats['items'] = self._items
+            stats['max_items'] = self.max_items
+
+        return stats
+
+
+def get_cache(socket_file, bird_proxy_config):
+    with _CACHES_LOCK:
+        cache = _CACHES.get(socket_file)
+
+        if cache is None:
+            cache = ResultCache(
+                size=bird_proxy_config.get(
+                    'RESULT_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+                ttls=bird_proxy_config.get('RESULT_CACHE_TTL'),
+                max_items=bird_proxy_config.get(
+                    'RESULT_CACHE_MAX_ITEMS', DEFAULT_CACHE_ITEMS))
+            _CACHES[socket_file] = cache
+
+        return cache
@@ -0,0 +1,114 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+# coalescers are shared by all BIRDManager instances of a process, one per
+# BIRD socket
+_COALESCERS = {}
+_COALESCERS_LOCK = threading.Lock()
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Coalescer(object):
+    """Share the result of identical commands that run at the same time.
+
+    The first caller of a key executes the function; callers arriving with
+    the same key while it runs wait for it and get the same result (or
+    exception) instead of executing the function again. Waiting callers
+    give up at their own `deadline`, a `time.time()` value, if given.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'executions': 0,
+            'coalesced': 0,
+            'timeouts': 0,
+        }
+
+    def run(self, key, func, *args, **kwargs):
+        deadline = kwargs.pop('deadline', None)
+
+        with self._lock:
+            call = self._calls.get(key)
+
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.stats['executions'] += 1
+            else:
+                leader = False
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.time())
+
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.stats['timeouts'] += 1
+
+                raise DeadlineExceeded("deadline exceeded")
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = func(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+        return call.result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls)
+
+        return stats
+
+
+def get_coalescer(socket_file):
+    with _COALESCERS_LOCK:
+        coalescer = _COALESCERS.get(socket_file)
+
+        if coalescer is None:
+            coalescer = _COALESCERS[socket_file] = Coalescer()
+
+        return coalescer
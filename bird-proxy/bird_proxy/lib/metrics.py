@@ -0,0 +1,449 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import contextlib
+import errno
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the buckets of timing histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# endpoint label of the commands run outside of a request, by pollers
+BACKGROUND_ENDPOINT = 'background'
+
+# seconds between writes of the metrics of a process to the shared folder
+DEFAULT_WRITE_INTERVAL = 1.0
+
+# metrics of the worker processes that exited, merged by the other workers
+EXITED_NAME = 'exited'
+METRICS_FILE_SUFFIX = '.json'
+
+# endpoint of the request handled by the current thread
+_context = threading.local()
+
+# writer of the metrics of this process, started on first use so that it
+# doesn't get lost when gunicorn forks its workers
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def set_endpoint(endpoint):
+    _context.endpoint = endpoint
+
+
+def get_endpoint():
+    return getattr(_context, 'endpoint', None) or BACKGROUND_ENDPOINT
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _format_labels(names, values, extra=()):
+    labels = ['{}="{}"'.format(name, _escape(value))
+              for name, value in zip(names, values) + list(extra)]
+
+    return '{{{}}}'.format(','.join(labels)) if labels else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    """Metric of this process with a value per combination of label values.
+    """
+
+    TYPE = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_values(self):
+        """Return a copy of the values by label values."""
+        with self._lock:
+            return dict((key, list(value))
+                        for key, value in self._values.iteritems())
+
+    def render(self, values=None):
+        """Return the lines of the metric in Prometheus text format, of
+        `values` (see `get_values`) if given."""
+        if values is None:
+            values = self.get_values()
+        values = sorted(values.iteritems())
+
+        lines = [
+            '# HELP {} {}'.format(self.name, self.description),
+            '# TYPE {} {}'.format(self.name, self.TYPE),
+        ]
+
+        for label_values, value in values:
+            lines.extend(self._render_value(label_values, value))
+
+        return lines
+
+    def _render_value(self, label_values, value):
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            value = self._values.get(label_values)
+            if value is None:
+                value = self._values[label_values] = [0]
+
+            value[0] += amount
+
+    def _render_value(self, label_values, value):
+        return ['{}{} {}'.format(
+            self.name, _format_labels(self.labels, label_values),
+            _format_value(value[0]))]
+
+
+class Histogram(Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount, *label_values):
+        # observations per bucket (the last one is +Inf), sum of observations
+        index = bisect.bisect_left(self.buckets, amount)
+
+        with self._lock:
+            value = self._values.get(label_values)
+            if value is None:
+                value = self._values[label_values] = (
+                    [0] * (len(self.buckets) + 1) + [0.0])
+
+            value[index] += 1
+            value[-1] += amount
+
+    def _render_value(self, label_values, value):
+        lines = []
+        count = 0
+
+        for bound, observations in zip(
+                self.buckets + ('+Inf',), value[:-1]):
+            count += observations
+            lines.append('{}_bucket{} {}'.format(
+                self.name,
+                _format_labels(self.labels, label_values,
+                               [('le', _format_value(bound))]),
+                count))
+
+        labels = _format_labels(self.labels, label_values)
+        lines.append('{}_sum{} {}'.format(
+            self.name, labels, _format_value(value[-1])))
+        lines.append('{}_count{} {}'.format(self.name, labels, count))
+
+        return lines
+
+
+class ReplyStats(object):
+    """Phases and size of a BIRD command, filled in by `bird.BirdSocket`
+    and `pool.BirdSocketPool` while the command runs.
+
+    `connect` holds the time spent waiting for a pooled connection and
+    connecting to BIRD, `wait` the time from sending the command to
+    receiving the first bytes of the reply and `read` the time spent
+    receiving the rest of it.
+    """
+
+    __slots__ = ('connect', 'wait', 'read', 'bytes', 'lines')
+
+    def __init__(self):
+        self.connect = 0.0
+        self.wait = 0.0
+        self.read = 0.0
+        self.bytes = 0
+        self.lines = 0
+
+
+REQUEST_SECONDS = Histogram(
+    'bird_proxy_request_seconds',
+    "Time taken to handle requests, until their response is ready to be "
+    "sent.",
+    labels=('endpoint',))
+
+JSONIFY_SECONDS = Histogram(
+    'bird_proxy_jsonify_seconds',
+    "Time taken to serialize JSON responses.",
+    labels=('endpoint',))
+
+COMMAND_SECONDS = Histogram(
+    'bird_proxy_command_seconds',
+    "Time taken by BIRD commands per phase: connect, wait (for the first "
+    "byte), read, parse and total.",
+    labels=('endpoint', 'command', 'phase'))
+
+RECEIVED_BYTES = Counter(
+    'bird_proxy_received_bytes_total',
+    "Bytes received from BIRD.",
+    labels=('endpoint', 'command'))
+
+RECEIVED_LINES = Counter(
+    'bird_proxy_received_lines_total',
+    "Lines received from BIRD.",
+    labels=('endpoint', 'command'))
+
+METRICS = [
+    REQUEST_SECONDS,
+    JSONIFY_SECONDS,
+    COMMAND_SECONDS,
+    RECEIVED_BYTES,
+    RECEIVED_LINES,
+]
+
+
+def observe_command(command, stats, duration):
+    """Record the phases of a BIRD command that took `duration` seconds,
+    `command` being the name of its class."""
+    endpoint = get_endpoint()
+
+    # time not spent on the socket went to parsing the reply
+    parse = max(0.0, duration - stats.connect - stats.wait - stats.read)
+
+    for phase, seconds in (('connect', stats.connect),
+                           ('wait', stats.wait),
+                           ('read', stats.read),
+                           ('parse', parse),
+                           ('total', duration)):
+        COMMAND_SECONDS.observe(seconds, endpoint, command, phase)
+
+    RECEIVED_BYTES.inc(stats.bytes, endpoint, command)
+    RECEIVED_LINES.inc(stats.lines, endpoint, command)
+
+
+def get_values():
+    """Return the values of the metrics of this process by metric name."""
+    return dict((metric.name, metric.get_values()) for metric in METRICS)
+
+
+def merge_values(values, other):
+    """Add the metric values `other` to `values`, both as returned by
+    `get_values`. Counter and histogram values are summed one by one."""
+    for name, metric_values in other.iteritems():
+        merged = values.setdefault(name, {})
+
+        for label_values, value in metric_values.iteritems():
+            current = merged.get(label_values)
+            if current is None or len(current) != len(value):
+                merged[label_values] = list(value)
+            else:
+                merged[label_values] = [a + b for a, b in zip(current, value)]
+
+
+def _encode(values):
+    return json.dumps(dict(
+        (name, [[list(label_values), value]
+                for label_values, value in metric_values.iteritems()])
+        for name, metric_values in values.iteritems()))
+
+
+def _decode(data):
+    return dict(
+        (name, dict((tuple(label_values), value)
+                    for label_values, value in metric_values))
+        for name, metric_values in json.loads(data).iteritems())
+
+
+class MetricsFolder(object):
+    """Folder where every worker process writes its metrics, so that any
+    of them can render those of all of them.
+
+    A process writes its metrics to `<pid>.json`. The files of the processes
+    that exited are merged into `exited.json`, so that counters never go
+    down; the merge holds an exclusive lock on `exited.lock`, and reading
+    the files a shared one.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def _path(self, name):
+        return os.path.join(self.folder, name + METRICS_FILE_SUFFIX)
+
+    def _read(self, path):
+        try:
+            with open(path) as metrics_file:
+                return _decode(metrics_file.read())
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return {}
+            raise
+        except ValueError:
+            logger.warning("Ignoring invalid metrics file %s", path)
+            return {}
+
+    def _write(self, name, values):
+        path = self._path(name)
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(temporary_path, 'w') as metrics_file:
+            metrics_file.write(_encode(values))
+
+        # replaced at once, so that readers never see part of it
+        os.rename(temporary_path, path)
+
+    def _pids(self):
+        pids = []
+
+        for filename in os.listdir(self.folder):
+            name, suffix = os.path.splitext(filename)
+            if suffix == METRICS_FILE_SUFFIX and name.isdigit():
+                pids.append(int(name))
+
+        return pids
+
+    @contextlib.contextmanager
+    def _locked(self, operation):
+        with open(os.path.join(self.folder, EXITED_NAME + '.lock'),
+                  'a') as lock_file:
+            fcntl.flock(lock_file, operation)
+            yield
+
+    def write(self, values):
+        """Write the metric values of this process, and merge those of
+        the processes that exited."""
+        try:
+            os.makedirs(self.folder)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self._write(str(os.getpid()), values)
+
+        with self._locked(fcntl.LOCK_EX):
+            exited = [pid for pid in self._pids() if not _is_running(pid)]
+            if not exited:
+                return
+
+            merged = self._read(self._path(EXITED_NAME))
+            for pid in exited:
+                merge_values(merged, self._read(self._path(str(pid))))
+
+            self._write(EXITED_NAME, merged)
+
+            for pid in exited:
+                os.remove(self._path(str(pid)))
+
+    def read(self, values):
+        """Return the metric values of all processes, `values` being the
+        current ones of this process."""
+        merged = {}
+        merge_values(merged, values)
+
+        if not os.path.isdir(self.folder):
+            return merged
+
+        with self._locked(fcntl.LOCK_SH):
+            merge_values(merged, self._read(self._path(EXITED_NAME)))
+
+            for pid in self._pids():
+                # the file of this process is older than `values`
+                if pid != os.getpid():
+                    merge_values(merged, self._read(self._path(str(pid))))
+
+        return merged
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+
+    return True
+
+
+class MetricsWriter(threading.Thread):
+    """Background thread writing the metrics of this process to a
+    `MetricsFolder` at a fixed interval."""
+
+    def __init__(self, metrics_folder, interval=DEFAULT_WRITE_INTERVAL):
+        super(MetricsWriter, self).__init__()
+        self.daemon = True
+        self.name = 'metrics-writer'
+
+        self.metrics_folder = metrics_folder
+        self.interval = interval
+        self.pid = os.getpid()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                self.metrics_folder.write(get_values())
+            except (IOError, OSError) as e:
+                logger.warning("Unable to write metrics: %s", e)
+
+
+def share(folder):
+    """Start writing the metrics of this process to `folder`, if not done
+    yet. Does nothing without a folder."""
+    global _WRITER
+
+    if not folder:
+        return
+
+    with _WRITER_LOCK:
+        # a writer started before a fork stays in the parent process
+        if _WRITER is None or _WRITER.pid != os.getpid():
+            _WRITER = MetricsWriter(MetricsFolder(folder))
+            _WRITER.start()
+
+
+def render(folder=None):
+    """Return the metrics in Prometheus text format: those of all
+    processes sharing `folder` (see `share`), or of this process without
+    one."""
+    values = get_values()
+
+    if folder:
+        try:
+            values = MetricsFolder(folder).read(values)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to read shared metrics: %s", e)
+
+    lines = []
+
+    for metric in METRICS:
+        lines.extend(metric.render(values.get(metric.name, {})))
+
+    return '\n'.join(lines) + '\n'
+
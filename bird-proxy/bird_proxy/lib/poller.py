@@ -0,0 +1,378 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import cPickle
+import errno
+import fcntl
+import itertools
+import logging
+import os
+import threading
+import time
+
+from bird_proxy.lib import birdtool, pool, rib
+
+logger = logging.getLogger(__name__)
+
+# pollers run in the worker process that started them; they are started on
+# first use so that they don't get lost when gunicorn forks its workers
+_POLLERS = {}
+_POLLERS_LOCK = threading.Lock()
+
+DEFAULT_SNAPSHOT_FOLDER = '/var/lib/bird-proxy/rib'
+
+# seconds between checks for a newer stored snapshot by the pollers that
+# don't read from BIRD
+FOLLOW_INTERVAL = 1
+
+
+class PollerError(Exception):
+    pass
+
+
+class Snapshot(object):
+
+    def __init__(self, value, duration):
+        self.value = value
+        self.timestamp = time.time()
+        # seconds it took to build the snapshot
+        self.duration = duration
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+
+class Poller(threading.Thread):
+    """Background thread keeping a snapshot refreshed at a fixed interval.
+
+    Subclasses implement `refresh`, which returns the new snapshot value or
+    raises `birdtool.BIRDToolError`. A failed refresh keeps the previous
+    snapshot. Subclasses getting their snapshots elsewhere override
+    `take_snapshot` instead.
+    """
+
+    def __init__(self, interval):
+        super(Poller, self).__init__()
+        self.daemon = True
+        self.interval = interval
+
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'refreshes': 0,
+            'errors': 0,
+            'last_error': None,
+        }
+
+    def refresh(self):
+        raise NotImplementedError()
+
+    def take_snapshot(self):
+        """Return a new `Snapshot`, or None if there is none."""
+        started = time.time()
+        value = self.refresh()
+
+        return Snapshot(value, time.time() - started)
+
+    def get_interval(self):
+        """Return the seconds from the start of a refresh to the next."""
+        return self.interval
+
+    def run(self):
+        while True:
+            started = time.time()
+
+            try:
+                snapshot = self.take_snapshot()
+            except (birdtool.BIRDToolError, pool.PoolRejected,
+                    PollerError) as e:
+                logger.warning("%s refresh failed: %s", self.name, e)
+
+                with self._lock:
+                    self.stats['errors'] += 1
+                    self.stats['last_error'] = str(e)
+            except Exception:
+                logger.exception("%s refresh failed", self.name)
+
+                with self._lock:
+                    self.stats['errors'] += 1
+                    self.stats['last_error'] = "internal error"
+            else:
+                if snapshot is not None:
+                    with self._lock:
+                        self._snapshot = snapshot
+                        self.stats['refreshes'] += 1
+
+            time.sleep(max(0, started + self.get_interval() - time.time()))
+
+    def get_snapshot(self):
+        with self._lock:
+            return self._snapshot
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            snapshot = self._snapshot
+
+        stats['interval'] = self.interval
+
+        if snapshot is not None:
+            stats['snapshot_age'] = snapshot.age
+            stats['snapshot_duration'] = snapshot.duration
+
+        return stats
+
+
+class SessionPoller(Poller):
+    """Keeps the parsed `show protocols all` output of a BIRD process."""
+
+    KIND = 'sessions'
+
+    def __init__(self, ip_version, bird_proxy_config, wildcard):
+        super(SessionPoller, self).__init__(
+            bird_proxy_config['SESSION_POLL_INTERVAL'])
+        self.name = 'session-poller-{}'.format(ip_version)
+
+        self.ip_version = ip_version
+        self.bird_proxy_config = bird_proxy_config
+        self.wildcard = wildcard
+
+    def refresh(self):
+        bird = birdtool.BIRDManager(self.ip_version, self.bird_proxy_config)
+        outcome, message = bird.get_protocol_information_verbose(
+            wildcard=self.wildcard, use_cache=False)
+
+        if not outcome:
+            raise birdtool.BIRDToolError(message)
+
+        return message
+
+
+class RIBPoller(Poller):
+    """Keeps the routes of some BIRD tables indexed by prefix, see
+    `rib.RIB`.
+
+    Only the poller holding the lock file in the snapshot folder reads the
+    routes from BIRD, one per host. It stores every snapshot in the folder,
+    and the pollers of the other worker processes load it from there, so
+    that all of them serve the same snapshot ids. Another poller takes over
+    when the worker process holding the lock exits.
+    """
+
+    KIND = 'rib'
+
+    DEFAULT_TABLES = ['master']
+
+    def __init__(self, ip_version, bird_proxy_config):
+        super(RIBPoller, self).__init__(
+            bird_proxy_config['RIB_SNAPSHOT_INTERVAL'])
+        self.name = 'rib-poller-{}'.format(ip_version)
+
+        self.ip_version = ip_version
+        self.bird_proxy_config = bird_proxy_config
+        self.tables = (bird_proxy_config.get('RIB_SNAPSHOT_TABLES') or
+                       self.DEFAULT_TABLES)
+        self.history_size = max(1, bird_proxy_config.get(
+            'RIB_DIFF_HISTORY', rib.DEFAULT_DIFF_HISTORY))
+
+        self.folder = bird_proxy_config.get(
+            'RIB_SNAPSHOT_FOLDER', DEFAULT_SNAPSHOT_FOLDER)
+
+        # snapshot ids are unique to the process the poller reads BIRD in
+        self._token = binascii.hexlify(os.urandom(8))
+        self._sequence = itertools.count(1)
+
+        # open while this poller reads from BIRD
+        self._lock_file = None
+        self.stats['store_errors'] = 0
+
+    def _path(self, suffix):
+        return os.path.join(
+            self.folder, 'rib-{}{}'.format(self.ip_version, suffix))
+
+    def _lead(self):
+        """Return whether this poller reads from BIRD, trying to take the
+        lock file if no poller holds it."""
+        if self._lock_file is not None:
+            return True
+
+        try:
+            os.makedirs(self.folder)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise PollerError(
+                    "Unable to create snapshot folder: {}".format(e))
+
+        try:
+            lock_file = open(self._path('.lock'), 'a')
+        except IOError as e:
+            raise PollerError("Unable to open snapshot lock: {}".format(e))
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            lock_file.close()
+
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise PollerError("Unable to lock snapshot lock: {}".format(e))
+
+        # kept until the process exits, which releases the lock
+        self._lock_file = lock_file
+        logger.info("%s reads the routes from BIRD", self.name)
+
+        return True
+
+    def _store(self, snapshot):
+        path = self._path('.pickle')
+        temporary_path = '{}.{}'.format(path, os.getpid())
+
+        try:
+            with open(temporary_path, 'wb') as snapshot_file:
+                # the id comes first, so that a snapshot already loaded is
+                # not read again
+                cPickle.dump(snapshot.value.id, snapshot_file,
+                             cPickle.HIGHEST_PROTOCOL)
+                cPickle.dump(snapshot, snapshot_file, cPickle.HIGHEST_PROTOCOL)
+
+            # replaced at once, so that other pollers never load part of it
+            os.rename(temporary_path, path)
+        except (IOError, OSError) as e:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+
+            raise PollerError("Unable to store snapshot: {}".format(e))
+
+    def _load(self):
+        """Return the stored snapshot, or None if there is none or it is the
+        current one."""
+        current = self.get_snapshot()
+
+        try:
+            with open(self._path('.pickle'), 'rb') as snapshot_file:
+                snapshot_id = cPickle.load(snapshot_file)
+
+                if current is not None and snapshot_id == current.value.id:
+                    return None
+
+                return cPickle.load(snapshot_file)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise PollerError("Unable to load snapshot: {}".format(e))
+        except (EOFError, cPickle.UnpicklingError) as e:
+            raise PollerError("Unable to load snapshot: {}".format(e))
+
+    def take_snapshot(self):
+        if not self._lead():
+            return self._load()
+
+        snapshot = super(RIBPoller, self).take_snapshot()
+
+        try:
+            self._store(snapshot)
+        except PollerError as e:
+            # this worker keeps serving its snapshot, the others their last
+            # one until a snapshot can be stored again
+            logger.warning("%s: %s", self.name, e)
+
+            with self._lock:
+                self.stats['store_errors'] += 1
+                self.stats['last_error'] = str(e)
+
+        return snapshot
+
+    def get_interval(self):
+        if self._lock_file is None:
+            return min(self.interval, FOLLOW_INTERVAL)
+
+        return self.interval
+
+    def refresh(self):
+        bird = birdtool.BIRDManager(self.ip_version, self.bird_proxy_config)
+
+        previous = self.get_snapshot()
+        snapshot = rib.RIB(
+            self.ip_version,
+            snapshot_id='{}-{}'.format(self._token, next(self._sequence)),
+            previous=previous and previous.value,
+            history_size=self.history_size)
+
+        for table in self.tables:
+            snapshot.add_routes(table, bird.stream_routes_information(
+                table='table {}'.format(table), detail=True))
+
+        snapshot.complete()
+
+        return snapshot
+
+    def get_stats(self):
+        stats = super(RIBPoller, self).get_stats()
+        stats['leader'] = self._lock_file is not None
+
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            stats.update(snapshot.value.get_stats())
+
+        return stats
+
+
+def get_poller(name, factory):
+    """Return the poller registered under `name`, starting it if needed."""
+    with _POLLERS_LOCK:
+        poller = _POLLERS.get(name)
+
+        if poller is None:
+            poller = _POLLERS[name] = factory()
+            poller.start()
+
+        return poller
+
+
+def get_session_poller(ip_version, bird_proxy_config, wildcard):
+    """Return the running session poller for an IP version, or None if
+    session polling is disabled.
+    """
+    if not bird_proxy_config.get('SESSION_POLL_INTERVAL'):
+        return None
+
+    return get_poller(
+        (SessionPoller.KIND, ip_version, wildcard),
+        lambda: SessionPoller(ip_version, bird_proxy_config, wildcard))
+
+
+def get_rib_poller(ip_version, bird_proxy_config):
+    """Return the running RIB poller for an IP version, or None if RIB
+    snapshots are disabled.
+    """
+    if not bird_proxy_config.get('RIB_SNAPSHOT_INTERVAL'):
+        return None
+
+    return get_poller(
+        (RIBPoller.KIND, ip_version),
+        lambda: RIBPoller(ip_version, bird_proxy_config))
+
+
+def get_stats(ip_version):
+    with _POLLERS_LOCK:
+        pollers = [poller for poller in _POLLERS.values()
+                   if poller.ip_version == ip_version]
+
+    return dict((poller.KIND, poller.get_stats()) for poller in pollers)
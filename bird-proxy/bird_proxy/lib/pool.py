@@ -0,0 +1,463 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import contextlib
+import errno
+import fcntl
+import heapq
+import itertools
+import os
+import socket
+import threading
+import time
+
+from bird_proxy.lib import bird
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 60.0
+DEFAULT_RETRY_AFTER = 5
+
+# seconds between attempts to take a slot held by another process
+SLOT_POLL_INTERVAL = 0.01
+
+# cost classes of commands; cheaper commands are served first when callers
+# wait for a connection
+COST_CHEAP = 0
+COST_EXPENSIVE = 1
+
+# pools are shared by all BIRDManager instances of a process, one per socket
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class PoolRejected(Exception):
+    """A command was not admitted to the BIRD socket."""
+    pass
+
+
+class PoolTimeout(PoolRejected):
+    pass
+
+
+class PoolFull(PoolRejected):
+    pass
+
+
+class SocketSlots(object):
+    """Limits of a BIRD socket shared by all worker processes of a host.
+
+    A command holds one of `size` run slots while it runs, and a caller
+    waiting for a run slot holds one of `queue_size` queue slots. Slots are
+    files in `folder` locked with `fcntl.flock`, which the system releases
+    when the process holding them exits. Expensive commands may hold all but
+    one run slot, which is kept for cheap commands.
+    """
+
+    def __init__(self, folder, name, size, queue_size=None):
+        self.folder = folder
+        self.name = name
+        self.size = size
+        self.queue_size = queue_size
+
+        try:
+            os.makedirs(folder)
+        except OSError:
+            # it exists, or opening the slot files will fail
+            pass
+
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'rejections': 0,
+        }
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def _lock(self, kind, count):
+        """Return the file of the first free slot of a kind, locked, or None
+        if all of them are held."""
+        for index in range(count):
+            path = os.path.join(
+                self.folder, '{}.{}.{}'.format(self.name, kind, index))
+
+            try:
+                # every attempt opens the file again: locks of the same open
+                # file don't exclude each other
+                slot = open(path, 'a')
+            except IOError as e:
+                raise socket.error("Unable to open slot file: {}".format(e))
+
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                slot.close()
+
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise socket.error(
+                        "Unable to lock slot file: {}".format(e))
+                continue
+
+            return slot
+
+        return None
+
+    def get_size(self, cost=COST_CHEAP):
+        """Return the number of run slots commands of a cost class may
+        hold."""
+        if cost > COST_CHEAP and self.size > 1:
+            return self.size - 1
+
+        return self.size
+
+    def acquire(self, cost=COST_CHEAP, give_up=None):
+        """Return a locked run slot file, waiting until `give_up`, a
+        `time.time()` value, if given."""
+        count = self.get_size(cost)
+
+        slot = self._lock('run', count)
+        if slot is not None:
+            return slot
+
+        queued = None
+        if self.queue_size is not None:
+            queued = self._lock('queue', self.queue_size)
+            if queued is None:
+                self._count('rejections')
+                raise PoolFull("{} callers already waiting for {}".format(
+                    self.queue_size, self.name))
+
+        waited_since = time.time()
+        self._count('waits')
+
+        try:
+            while True:
+                now = time.time()
+                if give_up is not None and now >= give_up:
+                    self._count('timeouts')
+                    raise PoolTimeout(
+                        "no free slot for {} within {:.3g}s".format(
+                            self.name, now - waited_since))
+
+                wait = SLOT_POLL_INTERVAL
+                if give_up is not None:
+                    wait = min(wait, give_up - now)
+                time.sleep(wait)
+
+                slot = self._lock('run', count)
+                if slot is not None:
+                    return slot
+        finally:
+            self._count('wait_time', time.time() - waited_since)
+            if queued is not None:
+                queued.close()
+
+    def release(self, slot):
+        # closing the only descriptor of the file releases its lock
+        slot.close()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+
+        stats['size'] = self.size
+        stats['queue_size'] = self.queue_size
+
+        return stats
+
+
+class BirdSocketPool(object):
+    """Pool of persistent connections to a single BIRD control socket.
+
+    The pool exposes the same `cmd` method as `bird.BirdSocket` so it can be
+    handed to a `BIRDCommand` in place of a single connection.
+
+    At most `size` commands run on the socket at once. Callers beyond that
+    wait in a queue of at most `queue_size` entries, cheapest cost class
+    first, then in order of arrival. With `slots`, a `SocketSlots`, a
+    command also needs one of its slots, so that the limits hold across
+    the worker processes as well.
+    """
+
+    def __init__(self, socket_file, size=DEFAULT_POOL_SIZE, timeout=10.0,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, wait_timeout=None,
+                 queue_size=None, bufsize=bird.BUFSIZE, slots=None):
+        self.file = socket_file
+        self.size = size
+        self.timeout = timeout
+        self.bufsize = bufsize
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = timeout if wait_timeout is None else wait_timeout
+        self.queue_size = queue_size
+        self.slots = slots
+
+        # slot files held by the connections in use
+        self._held = {}
+
+        # idle connections as (connection, release time) tuples; the most
+        # recently released connection is on the right
+        self._idle = collections.deque()
+        self._open = 0
+        self._cond = threading.Condition()
+
+        # waiting callers as (cost, arrival) tuples
+        self._waiters = []
+        self._arrivals = itertools.count()
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'rejections': 0,
+            'evictions': 0,
+            'discarded': 0,
+        }
+
+    def _new_connection(self):
+        # BirdSocket connects lazily on its first command, so no I/O is done
+        # while holding the pool lock
+        return bird.BirdSocket(
+            file=self.file, timeout=self.timeout, bufsize=self.bufsize)
+
+    def _discard(self, conn):
+        conn.close()
+        self._open -= 1
+        self.stats['discarded'] += 1
+
+    def _evict_idle(self):
+        expire_before = time.time() - self.idle_timeout
+
+        while self._idle and self._idle[0][1] < expire_before:
+            conn, _ = self._idle.popleft()
+            conn.close()
+            self._open -= 1
+            self.stats['evictions'] += 1
+
+    def _take(self):
+        while self._idle:
+            conn, _ = self._idle.pop()
+            if conn.is_healthy():
+                self.stats['hits'] += 1
+                return conn
+
+            self._discard(conn)
+
+        if self._open < self.size:
+            self._open += 1
+            self.stats['misses'] += 1
+            return self._new_connection()
+
+        return None
+
+    def get_size(self, cost=COST_CHEAP):
+        """Return the number of commands of a cost class that may run at
+        once."""
+        if self.slots is None:
+            return self.size
+
+        return min(self.size, self.slots.get_size(cost))
+
+    def _give_up(self, now, deadline):
+        give_up = None
+
+        if self.wait_timeout is not None:
+            give_up = now + self.wait_timeout
+        if deadline is not None:
+            give_up = min(give_up or deadline, deadline)
+
+        return give_up
+
+    def acquire(self, cost=COST_CHEAP, deadline=None):
+        """Return a connection, waiting at most `wait_timeout` seconds and
+        not past `deadline`, a `time.time()` value, if given."""
+        give_up = self._give_up(time.time(), deadline)
+        conn = self._acquire_connection(cost, give_up)
+
+        if self.slots is None:
+            return conn
+
+        try:
+            slot = self.slots.acquire(cost, give_up)
+        except:
+            self.release(conn)
+            raise
+
+        with self._cond:
+            self._held[conn] = slot
+
+        return conn
+
+    def _acquire_connection(self, cost, give_up):
+        waiter = None
+        waited_since = None
+
+        with self._cond:
+            try:
+                while True:
+                    self._evict_idle()
+
+                    # only the first caller in the queue may take a
+                    # connection, so later arrivals can't jump it
+                    if not self._waiters or self._waiters[0] is waiter:
+                        conn = self._take()
+                        if conn is not None:
+                            return conn
+
+                    now = time.time()
+                    if waiter is None:
+                        if (self.queue_size is not None and
+                                len(self._waiters) >= self.queue_size):
+                            self.stats['rejections'] += 1
+                            raise PoolFull(
+                                "{} callers already waiting for {}".format(
+                                    len(self._waiters), self.file))
+
+                        waiter = (cost, next(self._arrivals))
+                        heapq.heappush(self._waiters, waiter)
+                        waited_since = now
+                        self.stats['waits'] += 1
+
+                        continue
+
+                    if give_up is None:
+                        remaining = None
+                    else:
+                        remaining = give_up - now
+                        if remaining <= 0:
+                            self.stats['timeouts'] += 1
+                            raise PoolTimeout(
+                                "no free connection to {} within {:.3g}s"
+                                .format(self.file,
+                                        max(give_up - waited_since, 0)))
+
+                    self._cond.wait(remaining)
+                    self.stats['wait_time'] += time.time() - now
+            finally:
+                if waiter is not None:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    # the next caller in the queue may take a connection now
+                    self._cond.notify_all()
+
+    def release(self, conn):
+        with self._cond:
+            slot = self._held.pop(conn, None)
+            if slot is not None:
+                self.slots.release(slot)
+
+            # connections closed after an error are dropped; a new one will
+            # be opened when it is needed
+            if conn.connected:
+                self._idle.append((conn, time.time()))
+            else:
+                self._open -= 1
+                self.stats['discarded'] += 1
+
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def connection(self, cost=COST_CHEAP, deadline=None):
+        conn = self.acquire(cost, deadline)
+        try:
+            yield conn
+        except:
+            # the state of the reply stream is unknown; don't reuse it
+            conn.close()
+            raise
+        finally:
+            self.release(conn)
+
+    def cmd(self, cmd, allow_empty_lines=False, stats=None, cost=COST_CHEAP,
+            deadline=None):
+        started = time.time()
+
+        with self.connection(cost, deadline) as conn:
+            if stats is not None:
+                stats.connect += time.time() - started
+
+            return conn.cmd(
+                cmd, allow_empty_lines=allow_empty_lines, stats=stats,
+                deadline=deadline)
+
+    def iter_cmd(self, cmd, allow_empty_lines=False, stats=None,
+                 cost=COST_CHEAP, deadline=None):
+        started = time.time()
+
+        with self.connection(cost, deadline) as conn:
+            if stats is not None:
+                stats.connect += time.time() - started
+
+            for record in conn.iter_cmd(
+                    cmd, allow_empty_lines=allow_empty_lines, stats=stats,
+                    deadline=deadline):
+                yield record
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update({
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'queued': len(self._waiters),
+                'queue_size': self.queue_size,
+            })
+
+        if self.slots is not None:
+            stats['slots'] = self.slots.get_stats()
+
+        return stats
+
+
+def get_slots(socket_file, bird_proxy_config):
+    """Return the `SocketSlots` of a BIRD socket, or None if the limits are
+    per worker process."""
+    folder = bird_proxy_config.get('BIRD_SLOT_FOLDER')
+    if not folder:
+        return None
+
+    return SocketSlots(
+        folder, os.path.basename(socket_file),
+        bird_proxy_config.get('BIRD_POOL_SIZE', DEFAULT_POOL_SIZE),
+        queue_size=bird_proxy_config.get('BIRD_POOL_QUEUE_SIZE'))
+
+
+def get_pool(socket_file, bird_proxy_config):
+    with _POOLS_LOCK:
+        pool = _POOLS.get(socket_file)
+
+        if pool is None:
+            pool = BirdSocketPool(
+                socket_file,
+                size=bird_proxy_config.get(
+                    'BIRD_POOL_SIZE', DEFAULT_POOL_SIZE),
+                timeout=bird_proxy_config.get('BIRD_SOCKET_TIMEOUT'),
+                idle_timeout=bird_proxy_config.get(
+                    'BIRD_POOL_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT),
+                wait_timeout=bird_proxy_config.get('BIRD_POOL_WAIT_TIMEOUT'),
+                queue_size=bird_proxy_config.get('BIRD_POOL_QUEUE_SIZE'),
+                bufsize=bird_proxy_config.get(
+                    'BIRD_SOCKET_BUFSIZE', bird.BUFSIZE),
+                slots=get_slots(socket_file, bird_proxy_config))
+            _POOLS[socket_file] = pool
+
+        return pool
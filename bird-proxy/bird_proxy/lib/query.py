@@ -0,0 +1,265 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Route queries are JSON objects compiled to BIRD `where` conditions, see the
+# readme for their format. Every value is validated, so the compiled condition
+# can be passed to BIRD as it is.
+
+import json
+import re
+import socket
+
+# ip version -> (address family, address length)
+FAMILIES = {
+    'ipv4': (socket.AF_INET, 32),
+    'ipv6': (socket.AF_INET6, 128),
+}
+
+MAX_AS_NUMBER = 2 ** 32 - 1
+MAX_COMMUNITY_VALUE = 2 ** 16 - 1
+
+# deepest nesting of `and`, `or` and `not` queries
+MAX_QUERY_DEPTH = 32
+
+# community as a string
+COMMUNITY_REGEXP = re.compile(r'\A(?P<asn>\d{1,5}):(?P<value>\d{1,5})\Z')
+
+# prefix set item: prefix and optional pattern suffix
+PREFIX_SET_ITEM_REGEXP = re.compile(
+    r'\A(?P<address>[0-9a-fA-F.:]+)/(?P<length>\d{1,3})'
+    r'(?P<pattern>\+|-|\{(?P<low>\d{1,3}),(?P<high>\d{1,3})\})?\Z')
+
+
+class QueryError(Exception):
+    pass
+
+
+def _error(name, value):
+    return QueryError("Invalid {}: {}".format(name, json.dumps(value)))
+
+
+def _is_integer(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _integer(value, name, maximum):
+    if not _is_integer(value) or not 0 <= value <= maximum:
+        raise _error(name, value)
+
+    return value
+
+
+def _address(value, family):
+    try:
+        return socket.inet_ntop(family, socket.inet_pton(family, value))
+    except (socket.error, TypeError, ValueError, UnicodeError):
+        raise _error('address', value)
+
+
+def _any(conditions):
+    if len(conditions) == 1:
+        return conditions[0]
+
+    return '({})'.format(' || '.join(conditions))
+
+
+def _all(conditions):
+    if len(conditions) == 1:
+        return conditions[0]
+
+    return '({})'.format(' && '.join(conditions))
+
+
+def _origin_as(value, ip_version):
+    return _any([
+        '(bgp_path.last = {})'.format(
+            _integer(asn, 'origin AS', MAX_AS_NUMBER))
+        for asn in _as_list(value)])
+
+
+def _community(value, ip_version):
+    # a single community may be given as an [asn, value] pair
+    if (isinstance(value, list) and len(value) == 2 and
+            all(_is_integer(part) for part in value)):
+        value = [value]
+
+    conditions = []
+
+    for community in _as_list(value):
+        if isinstance(community, basestring):
+            match = COMMUNITY_REGEXP.match(community)
+            if match is None:
+                raise _error('community', community)
+
+            community = [int(match.group('asn')), int(match.group('value'))]
+
+        if not isinstance(community, list) or len(community) != 2:
+            raise _error('community', community)
+
+        conditions.append('(({},{}) ~ bgp_community)'.format(
+            _integer(community[0], 'community', MAX_COMMUNITY_VALUE),
+            _integer(community[1], 'community', MAX_COMMUNITY_VALUE)))
+
+    return _all(conditions)
+
+
+def _prefix_length(value, ip_version):
+    max_length = FAMILIES[ip_version][1]
+
+    if _is_integer(value):
+        return '(net.len = {})'.format(
+            _integer(value, 'prefix length', max_length))
+
+    if not isinstance(value, dict) or not value or set(value) - {'min', 'max'}:
+        raise _error('prefix length', value)
+
+    conditions = []
+
+    if 'min' in value:
+        conditions.append('net.len >= {}'.format(
+            _integer(value['min'], 'prefix length', max_length)))
+
+    if 'max' in value:
+        conditions.append('net.len <= {}'.format(
+            _integer(value['max'], 'prefix length', max_length)))
+
+    return '({})'.format(' && '.join(conditions))
+
+
+def _peer(value, ip_version):
+    family = FAMILIES[ip_version][0]
+
+    return _any([
+        '(from = {})'.format(_address(address, family))
+        for address in _as_list(value)])
+
+
+def _prefix_set_item(item, ip_version):
+    family, max_length = FAMILIES[ip_version]
+
+    match = (PREFIX_SET_ITEM_REGEXP.match(item)
+             if isinstance(item, basestring) else None)
+    if match is None:
+        raise _error('prefix set item', item)
+
+    address = _address(match.group('address'), family)
+    length = int(match.group('length'))
+
+    if length > max_length:
+        raise _error('prefix set item', item)
+
+    # BIRD rejects prefixes with host bits set
+    packed = socket.inet_pton(family, address)
+    host_mask = (1 << (max_length - length)) - 1
+    if int(packed.encode('hex'), 16) & host_mask:
+        raise _error('prefix set item', item)
+
+    pattern = match.group('pattern') or ''
+
+    if match.group('low') is not None:
+        low, high = int(match.group('low')), int(match.group('high'))
+
+        if not length <= low <= high <= max_length:
+            raise _error('prefix set item', item)
+
+        pattern = '{{{},{}}}'.format(low, high)
+
+    return '{}/{}{}'.format(address, length, pattern)
+
+
+def _prefix_in(value, ip_version):
+    if not isinstance(value, list) or not value:
+        raise _error('prefix set', value)
+
+    return '(net ~ [ {} ])'.format(', '.join(
+        _prefix_set_item(item, ip_version) for item in value))
+
+
+def _and(value, ip_version, depth):
+    if not isinstance(value, list) or not value:
+        raise _error('and', value)
+
+    return _all([_compile(query, ip_version, depth) for query in value])
+
+
+def _or(value, ip_version, depth):
+    if not isinstance(value, list) or not value:
+        raise _error('or', value)
+
+    return _any([_compile(query, ip_version, depth) for query in value])
+
+
+def _not(value, ip_version, depth):
+    return '(! {})'.format(_compile(value, ip_version, depth))
+
+
+# query key -> function compiling its value
+CONDITIONS = {
+    'origin_as': _origin_as,
+    'community': _community,
+    'prefix_length': _prefix_length,
+    'peer': _peer,
+    'prefix_in': _prefix_in,
+}
+
+# query key -> function compiling its value of nested queries
+OPERATORS = {
+    'and': _and,
+    'or': _or,
+    'not': _not,
+}
+
+
+def _compile(query, ip_version, depth=0):
+    if not isinstance(query, dict) or not query:
+        raise _error('query', query)
+
+    if depth > MAX_QUERY_DEPTH:
+        raise QueryError(
+            "Invalid query: nested deeper than {} levels".format(
+                MAX_QUERY_DEPTH))
+
+    conditions = []
+
+    # sorted so that equal queries compile to the same condition
+    for key in sorted(query):
+        if key in OPERATORS:
+            conditions.append(
+                OPERATORS[key](query[key], ip_version, depth + 1))
+            continue
+
+        try:
+            compile_condition = CONDITIONS[key]
+        except KeyError:
+            raise QueryError("Unknown query condition: {}".format(key))
+
+        conditions.append(compile_condition(query[key], ip_version))
+
+    return _all(conditions)
+
+
+def compile_query(query, ip_version):
+    """Return the BIRD `where` condition matching the routes of a query.
+
+    Raises QueryError if the query is not valid.
+    """
+    if ip_version not in FAMILIES:
+        raise QueryError("Invalid IP version: {}".format(ip_version))
+
+    return _compile(query, ip_version)
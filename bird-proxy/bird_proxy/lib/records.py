@@ -0,0 +1,214 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+
+# standard communities are packed as (asn << 16) | value in 32 bit items
+COMMUNITY_TYPECODE = 'I'
+
+
+def format_communities(text):
+    return text.replace("(", "").replace(")", "").replace(",", ":").split()
+
+
+def pack_communities(text):
+    """Return the communities in BIRD's text format packed in an array, or
+    a tuple of strings if they can't be packed without loss."""
+    communities = format_communities(text)
+
+    try:
+        packed = array.array(COMMUNITY_TYPECODE, [
+            (int(asn) << 16) | int(value)
+            for asn, value in (community.split(':') for community in communities)
+        ])
+    except (ValueError, OverflowError):
+        return tuple(communities)
+
+    # values out of range or not in their canonical form
+    if unpack_communities(packed) != communities:
+        return tuple(communities)
+
+    return packed
+
+
+def pack_community(community):
+    """Return an `asn:value` community as found in packed communities, or
+    None if it is not a valid community."""
+    try:
+        asn, value = [int(part) for part in community.split(':')]
+    except ValueError:
+        return None
+
+    if not (0 <= asn <= 0xffff and 0 <= value <= 0xffff):
+        return None
+
+    return (asn << 16) | value
+
+
+def unpack_communities(communities):
+    if isinstance(communities, array.array):
+        return ['{}:{}'.format(community >> 16, community & 0xffff)
+                for community in communities]
+
+    return list(communities)
+
+
+# fields of the route line, all other fields are BGP attributes
+SUMMARY_FIELDS = frozenset(
+    ['prefix', 'peer', 'interface', 'source', 'date', 'time'])
+
+# BGP attributes of `show route all`, as named by BIRD
+BGP_ATTRIBUTES = frozenset(
+    ['origin', 'as_path', 'next_hop', 'med', 'local_pref', 'atomic_aggr',
+     'aggregator', 'community', 'originator_id', 'cluster_list',
+     'ext_community', 'large_community', 'as4_path', 'as4_aggregator'])
+
+ROUTE_FIELDS = SUMMARY_FIELDS | BGP_ATTRIBUTES
+
+# values of each kind a `RouteBuilder` shares at most
+DEFAULT_INTERN_SIZE = 4096
+
+
+class Route(object):
+    """Compact record of a route parsed from `show route` output.
+
+    BGP attributes other than the communities are kept as a tuple of
+    (name, value) pairs. Records are converted to the dict returned by the
+    API only when they are serialized.
+    """
+
+    __slots__ = ('prefix', 'peer', 'interface', 'source', 'date', 'time',
+                 'attributes', 'communities', 'fields')
+
+    def __init__(self, prefix, peer, interface, source, date, time,
+                 attributes=(), communities=None, fields=None):
+        self.prefix = prefix
+        self.peer = peer
+        self.interface = interface
+        self.source = source
+        self.date = date
+        self.time = time
+        self.attributes = attributes
+        # packed communities, None if the route has no community attribute
+        self.communities = communities
+        # fields to serialize, None for all of them
+        self.fields = fields
+
+    def get(self, name, default=None):
+        """Return the value of a BGP attribute as found in the API output."""
+        if name == 'community' and self.communities is not None:
+            return unpack_communities(self.communities)
+
+        for attribute, value in self.attributes:
+            if attribute == name:
+                return value
+
+        return default
+
+    def to_dict(self):
+        route = {
+            'prefix': self.prefix,
+            'peer': self.peer,
+            'interface': self.interface,
+            'source': self.source,
+            'date': self.date,
+            'time': self.time,
+        }
+        route.update(self.attributes)
+
+        if self.communities is not None:
+            route['community'] = unpack_communities(self.communities)
+
+        if self.fields is not None:
+            for name in SUMMARY_FIELDS.difference(self.fields):
+                del route[name]
+
+        return route
+
+    def __getstate__(self):
+        # a tuple pickles smaller and faster than the default slots dict
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, Route):
+            return NotImplemented
+
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Route({!r})'.format(self.to_dict())
+
+
+class RouteBuilder(object):
+    """Creates `Route` records sharing equal field values.
+
+    Peers, interfaces, sources and dates, attribute (name, value) pairs and
+    community lists repeat over most routes of a reply; a builder keeps one
+    copy of each for the records it creates. At most `intern_size` values of
+    each kind are kept, so that values unique to a route don't make a
+    streamed reply hold memory growing with its size.
+    """
+
+    def __init__(self, fields=None, intern_size=DEFAULT_INTERN_SIZE):
+        self.fields = fields
+        self.intern_size = intern_size
+
+        self._strings = {}
+        self._attributes = {}
+        self._communities = {}
+
+    def _intern(self, values, value):
+        interned = values.get(value)
+        if interned is not None:
+            return interned
+
+        if len(values) < self.intern_size:
+            values[value] = value
+
+        return value
+
+    def string(self, value):
+        return self._intern(self._strings, value)
+
+    def attribute(self, name, value):
+        return self._intern(self._attributes, (name, value))
+
+    def communities(self, text):
+        communities = self._communities.get(text)
+
+        if communities is None:
+            communities = pack_communities(text)
+
+            if len(self._communities) < self.intern_size:
+                self._communities[text] = communities
+
+        return communities
+
+    def route(self, prefix, peer, interface, source, date, time,
+              attributes=(), communities=None):
+        string = self.string
+
+        return Route(
+            prefix, string(peer), string(interface), string(source),
+            string(date), time, tuple(attributes),
+            None if communities is None else self.communities(communities),
+            self.fields)
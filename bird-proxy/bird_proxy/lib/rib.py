@@ -0,0 +1,533 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import hashlib
+import socket
+
+from bird_proxy.lib import aggregate, query, records
+
+MATCH_EXACT = 'exact'
+MATCH_LONGEST = 'longest'
+MATCH_COVERING = 'covering'
+MATCH_COVERED = 'covered'
+
+MATCH_TYPES = (MATCH_EXACT, MATCH_LONGEST, MATCH_COVERING, MATCH_COVERED)
+
+
+DEFAULT_DIFF_HISTORY = 10
+
+
+class RIBError(Exception):
+    pass
+
+
+class UnknownSnapshot(RIBError):
+    pass
+
+
+class _Node(object):
+    """Node of a `PrefixTrie`: a prefix, the value stored for it (None for
+    nodes that only join two branches) and the branches of the prefixes
+    below it whose next bit is 0 (left) or 1 (right)."""
+
+    __slots__ = ('key', 'length', 'value', 'left', 'right')
+
+    def __init__(self, key, length, value=None):
+        self.key = key
+        self.length = length
+        self.value = value
+        self.left = None
+        self.right = None
+
+    def __getstate__(self):
+        return (self.key, self.length, self.value, self.left, self.right)
+
+    def __setstate__(self, state):
+        self.key, self.length, self.value, self.left, self.right = state
+
+
+class PrefixTrie(object):
+    """Path compressed binary trie of the prefixes of an address family.
+
+    Prefixes are (key, length) tuples where key is the network address as
+    an integer. Nodes exist only for stored prefixes and where two branches
+    split, so lookups take at most one step per stored prefix level rather
+    than one per bit.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.size = 0
+        self._root = None
+
+    def _bit(self, key, index):
+        return (key >> (self.bits - 1 - index)) & 1
+
+    def _common_length(self, key, other, limit):
+        """Number of leading bits, at most `limit`, two keys share."""
+        diff = (key ^ other) >> (self.bits - limit)
+        return limit - diff.bit_length() if diff else limit
+
+    def _mask(self, key, length):
+        return (key >> (self.bits - length)) << (self.bits - length)
+
+    def _covers(self, node, key, length):
+        return (node.length <= length and
+                self._common_length(node.key, key, node.length) == node.length)
+
+    def _set_child(self, parent, bit, node):
+        if parent is None:
+            self._root = node
+        elif bit:
+            parent.right = node
+        else:
+            parent.left = node
+
+    def _child(self, node, bit):
+        return node.right if bit else node.left
+
+    def setdefault(self, key, length, default):
+        """Return the value of a prefix, storing `default` for it first if
+        it has none."""
+        bits = self.bits
+        parent = None
+        bit = 0
+        node = self._root
+
+        # the bit operations of the helpers are inlined in the loop below,
+        # it runs once per trie level for every route of a snapshot
+        while node is not None:
+            node_length = node.length
+
+            if (node_length > length or
+                    (node.key ^ key) >> (bits - node_length)):
+                break
+
+            if node_length == length:
+                if node.value is None:
+                    node.value = default
+                    self.size += 1
+
+                return node.value
+
+            parent = node
+            bit = (key >> (bits - 1 - node_length)) & 1
+            node = node.right if bit else node.left
+
+        new = _Node(key, length, default)
+        self.size += 1
+
+        if node is None:
+            self._set_child(parent, bit, new)
+            return default
+
+        common = self._common_length(node.key, key, min(node.length, length))
+
+        if common == length:
+            # the new prefix covers the node
+            self._set_child(new, self._bit(node.key, length), node)
+            self._set_child(parent, bit, new)
+        else:
+            # the new prefix and the node split after their common bits
+            glue = _Node(self._mask(key, common), common)
+            self._set_child(glue, self._bit(key, common), new)
+            self._set_child(glue, self._bit(node.key, common), node)
+            self._set_child(parent, bit, glue)
+
+        return default
+
+    def _covering_nodes(self, key, length):
+        """Return the nodes whose prefix covers a prefix, least specific
+        first."""
+        bits = self.bits
+        nodes = []
+        node = self._root
+
+        while node is not None and node.length <= length:
+            if (node.key ^ key) >> (bits - node.length):
+                break
+
+            nodes.append(node)
+
+            if node.length == length:
+                break
+
+            if (key >> (bits - 1 - node.length)) & 1:
+                node = node.right
+            else:
+                node = node.left
+
+        return nodes
+
+    def exact(self, key, length):
+        nodes = self._covering_nodes(key, length)
+
+        if nodes and nodes[-1].length == length:
+            return nodes[-1].value
+
+        return None
+
+    def longest_match(self, key, length):
+        """Return the value of the most specific prefix covering a prefix."""
+        for node in reversed(self._covering_nodes(key, length)):
+            if node.value is not None:
+                return node.value
+
+        return None
+
+    def covering(self, key, length):
+        """Return the values of the prefixes covering a prefix, least
+        specific first."""
+        return [node.value for node in self._covering_nodes(key, length)
+                if node.value is not None]
+
+    def covered(self, key, length):
+        """Return the values of the prefixes a prefix covers, itself
+        included."""
+        node = self._root
+
+        # find the top of the branch under the prefix
+        while node is not None and node.length < length:
+            if not self._covers(node, key, length):
+                return []
+
+            node = self._child(node, self._bit(key, node.length))
+
+        if node is None or self._common_length(node.key, key, length) < length:
+            return []
+
+        values = []
+        stack = [node]
+
+        while stack:
+            node = stack.pop()
+
+            if node.value is not None:
+                values.append(node.value)
+
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+
+        return values
+
+
+def parse_prefix(prefix, ip_version):
+    """Return the (key, length) tuple of a prefix or address in text form.
+
+    Host bits are cleared. Raises RIBError for invalid prefixes.
+    """
+    family, bits = query.FAMILIES[ip_version]
+
+    address, _, length = prefix.partition('/')
+
+    try:
+        key = int(binascii.hexlify(socket.inet_pton(family, address)), 16)
+        length = int(length) if length else bits
+    except (socket.error, TypeError, ValueError, UnicodeError):
+        raise RIBError("Invalid prefix: {}".format(prefix))
+
+    if not 0 <= length <= bits:
+        raise RIBError("Invalid prefix: {}".format(prefix))
+
+    return (key >> (bits - length)) << (bits - length), length
+
+
+def format_prefix(key, length, ip_version):
+    """Return the text form of a prefix given as a (key, length) tuple, see
+    `parse_prefix`."""
+    family, bits = query.FAMILIES[ip_version]
+
+    address = socket.inet_ntop(
+        family, binascii.unhexlify('{:0{}x}'.format(key, bits // 4)))
+
+    return '{}/{}'.format(address, length)
+
+
+def route_hash(route):
+    """Return a digest of the route fields that make a route change; the
+    date and time of a route are left out.
+
+    Unlike `hash`, the digest is the same in every process, as snapshots are
+    built by one worker process and compared by the others.
+    """
+    communities = route.communities
+    if communities is not None:
+        communities = tuple(communities)
+
+    return hashlib.md5(repr((route.source, route.interface,
+                             route.attributes, communities))).digest()[:8]
+
+
+class RIBTable(object):
+    """Routes of a BIRD table indexed by prefix, origin AS, community and
+    protocol.
+
+    Tables also keep the `route_hash` of every route by (prefix, peer), and
+    the changes from the table of the previous snapshot as (old hash, new
+    hash, new route) tuples by (prefix, peer), with None for the hash of a
+    route that didn't or doesn't exist anymore.
+    """
+
+    def __init__(self, bits, previous=None):
+        self.prefixes = PrefixTrie(bits)
+        # origin AS -> routes
+        self.origins = {}
+        # community, packed as in `records.Route` -> routes
+        self.communities = {}
+        # protocol (the route source) -> routes
+        self.protocols = {}
+
+        self.hashes = {}
+        self.changes = {}
+        # hashes of the previous snapshot, only until the table is complete
+        self._previous_hashes = previous.hashes if previous else None
+
+    def add_route(self, prefix_routes, route):
+        prefix_routes.append(route)
+
+        origin_as = aggregate.get_origin_as(route)
+        if origin_as is not None:
+            self.origins.setdefault(origin_as, []).append(route)
+
+        if route.communities:
+            # a route is indexed once per community even if it repeats
+            for community in set(route.communities):
+                self.communities.setdefault(community, []).append(route)
+
+        self.protocols.setdefault(route.source, []).append(route)
+
+        key = (route.prefix, route.peer)
+        new_hash = self.hashes[key] = route_hash(route)
+
+        if self._previous_hashes is not None:
+            old_hash = self._previous_hashes.get(key)
+            if old_hash != new_hash:
+                self.changes[key] = (old_hash, new_hash, route)
+
+    def get_routes(self):
+        return [route for routes in self.prefixes.covered(0, 0)
+                for route in routes]
+
+    def complete(self):
+        """Record the routes of the previous snapshot that are gone."""
+        if self._previous_hashes is not None:
+            for key, old_hash in self._previous_hashes.iteritems():
+                if key not in self.hashes:
+                    self.changes[key] = (old_hash, None, None)
+
+        self._previous_hashes = None
+
+
+class RIB(object):
+    """Routes of some BIRD tables, see `RIBTable`.
+
+    A RIB built from the `previous` one keeps the changes of its tables from
+    it, and those of up to `history_size - 1` snapshots before, so that the
+    changes since any of them can be composed.
+    """
+
+    def __init__(self, ip_version, snapshot_id=None, previous=None,
+                 history_size=DEFAULT_DIFF_HISTORY):
+        if ip_version not in query.FAMILIES:
+            raise RIBError("Invalid IP version: {}".format(ip_version))
+
+        self.ip_version = ip_version
+        self.id = snapshot_id
+        self.tables = {}
+        # table of lookups that don't name one: the first table added
+        self.default_table = None
+        self.routes = 0
+
+        self._previous = previous
+        # (snapshot id, {table: changes to the next snapshot}) tuples, oldest
+        # first
+        self.history = []
+
+        if previous is not None:
+            self.history = previous.history + [(previous.id, {})]
+            self.history = self.history[-history_size:]
+
+    def add_routes(self, table, routes):
+        """Index the routes of a table, as `records.Route` objects."""
+        rib_table = self.tables.get(table)
+        if rib_table is None:
+            previous = self._previous and self._previous.tables.get(table)
+            rib_table = self.tables[table] = RIBTable(
+                query.FAMILIES[self.ip_version][1], previous=previous)
+
+        if self.default_table is None:
+            self.default_table = table
+
+        # routes to the same prefix come one after the other
+        last_prefix = None
+        prefix_routes = None
+
+        for route in routes:
+            if route.prefix != last_prefix:
+                last_prefix = route.prefix
+
+                try:
+                    key, length = parse_prefix(route.prefix, self.ip_version)
+                except RIBError:
+                    prefix_routes = None
+                    continue
+
+                prefix_routes = rib_table.prefixes.setdefault(key, length, [])
+
+            if prefix_routes is not None:
+                rib_table.add_route(prefix_routes, route)
+                self.routes += 1
+
+        rib_table.complete()
+
+        if self.history:
+            self.history[-1][1][table] = rib_table.changes
+
+    def complete(self):
+        """Drop the reference to the previous snapshot once all tables are
+        added, so that it can be freed."""
+        self._previous = None
+
+    def get_table(self, table):
+        """Return a `RIBTable`. A `table` of None returns the default
+        table."""
+        if table is None:
+            table = self.default_table
+
+        try:
+            return self.tables[table]
+        except KeyError:
+            raise RIBError("Unknown table: {}".format(table))
+
+    def lookup(self, table, prefix, match=MATCH_LONGEST):
+        """Return the routes of a table matching a prefix."""
+        trie = self.get_table(table).prefixes
+
+        if match not in MATCH_TYPES:
+            raise RIBError("Invalid match type: {}".format(match))
+
+        key, length = parse_prefix(prefix, self.ip_version)
+
+        if match == MATCH_EXACT:
+            return list(trie.exact(key, length) or [])
+
+        if match == MATCH_LONGEST:
+            return list(trie.longest_match(key, length) or [])
+
+        if match == MATCH_COVERING:
+            prefixes = trie.covering(key, length)
+        else:
+            prefixes = trie.covered(key, length)
+
+        return [route for routes in prefixes for route in routes]
+
+    def find_origin_as(self, table, origin_as):
+        """Return the routes of a table originated by an AS number."""
+        if not origin_as.isdigit():
+            raise RIBError("Invalid origin AS: {}".format(origin_as))
+
+        return list(self.get_table(table).origins.get(int(origin_as), []))
+
+    def find_community(self, table, community):
+        """Return the routes of a table carrying an `asn:value`
+        community."""
+        key = records.pack_community(community)
+        if key is None:
+            raise RIBError("Invalid community: {}".format(community))
+
+        return list(self.get_table(table).communities.get(key, []))
+
+    def find_protocol(self, table, protocol):
+        """Return the routes of a table received from a protocol."""
+        return list(self.get_table(table).protocols.get(protocol, []))
+
+    def get_changes(self, since, table=None):
+        """Return the changes of the routes since the snapshot with id
+        `since`, for every table or just one, as {table: {'added': routes,
+        'removed': [{'prefix': prefix, 'peer': peer}, ...], 'changed':
+        routes}}.
+
+        With `since` None all routes are added. Raises UnknownSnapshot if
+        the changes since the snapshot are not known.
+        """
+        tables = self.tables if table is None else {
+            table: self.get_table(table)}
+
+        if since is None:
+            return dict(
+                (name, {
+                    'added': rib_table.get_routes(),
+                    'removed': [],
+                    'changed': [],
+                })
+                for name, rib_table in tables.iteritems())
+
+        snapshot_ids = [snapshot_id for snapshot_id, _ in self.history]
+
+        if since != self.id and since not in snapshot_ids:
+            raise UnknownSnapshot("Unknown snapshot id: {}".format(since))
+
+        history = []
+        if since != self.id:
+            history = self.history[snapshot_ids.index(since):]
+
+        changes = {}
+
+        for name in tables:
+            # the first old hash and the last new hash and route of a route
+            # make its change over the whole history
+            composed = {}
+
+            for _, table_changes in history:
+                for key, (old_hash, new_hash, route) in table_changes.get(
+                        name, {}).iteritems():
+                    if key in composed:
+                        old_hash = composed[key][0]
+
+                    composed[key] = (old_hash, new_hash, route)
+
+            added = []
+            removed = []
+            changed = []
+
+            for (prefix, peer), (old_hash, new_hash, route) in \
+                    composed.iteritems():
+                if old_hash == new_hash:
+                    continue
+                elif old_hash is None:
+                    added.append(route)
+                elif new_hash is None:
+                    removed.append({'prefix': prefix, 'peer': peer})
+                else:
+                    changed.append(route)
+
+            changes[name] = {
+                'added': added,
+                'removed': removed,
+                'changed': changed,
+            }
+
+        return changes
+
+    def get_stats(self):
+        return {
+            'routes': self.routes,
+            'prefixes': dict(
+                (name, table.prefixes.size)
+                for name, table in self.tables.iteritems()),
+        }
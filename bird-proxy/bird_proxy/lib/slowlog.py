@@ -0,0 +1,143 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import errno
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 100
+
+# bytes read at a time from the end of the log file
+TAIL_BLOCK_SIZE = 8192
+
+_SLOW_LOG = None
+_SLOW_LOG_LOCK = threading.Lock()
+
+
+def tail_lines(path, count):
+    """Return the last `count` complete lines of a file, oldest first."""
+    with open(path, 'rb') as log_file:
+        log_file.seek(0, os.SEEK_END)
+        position = log_file.tell()
+        data = ''
+
+        # one more newline than lines: the one ending the line before them
+        while position > 0 and data.count('\n') <= count:
+            size = min(TAIL_BLOCK_SIZE, position)
+            position -= size
+            log_file.seek(position)
+            data = log_file.read(size) + data
+
+    lines = data.split('\n')
+    # a line still being appended has no newline yet
+    lines.pop()
+    if position > 0:
+        # the first line may have been read in part
+        lines.pop(0)
+
+    return lines[-count:] if count else []
+
+
+class SlowCommandLog(object):
+    """Log of the BIRD commands that took at least `threshold` seconds.
+
+    Entries are dicts, appended to the file at `path` as JSON lines if
+    given, and kept in memory for the last `size` slow commands. With a
+    file, the slowest commands are those of all worker processes writing
+    to it, read back from its last `size` lines.
+    """
+
+    def __init__(self, threshold, path=None, size=DEFAULT_BUFFER_SIZE):
+        self.threshold = threshold
+        self.path = path
+        self.size = size
+
+        self._entries = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        if entry['duration'] < self.threshold:
+            return
+
+        with self._lock:
+            self._entries.append(entry)
+
+            if self.path is None:
+                return
+
+            try:
+                # worker processes share the file; one append per entry
+                with open(self.path, 'a') as log_file:
+                    log_file.write(json.dumps(entry, sort_keys=True) + '\n')
+            except IOError as e:
+                logger.warning("Unable to write slow command log: %s", e)
+
+    def _read_entries(self):
+        """Return the last `size` entries of the log file."""
+        entries = []
+
+        for line in tail_lines(self.path, self.size):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # not written by a slow command log
+                continue
+
+        return entries
+
+    def get_slowest(self, limit):
+        """Return up to `limit` of the kept entries, slowest first."""
+        entries = None
+
+        if self.path is not None:
+            try:
+                entries = self._read_entries()
+            except IOError as e:
+                # the entries kept in memory are those of this process only
+                if e.errno != errno.ENOENT:
+                    logger.warning(
+                        "Unable to read slow command log: %s", e)
+
+        if entries is None:
+            with self._lock:
+                entries = list(self._entries)
+
+        entries.sort(key=lambda entry: entry['duration'], reverse=True)
+
+        return entries[:limit]
+
+
+def get_slow_log(bird_proxy_config):
+    """Return the slow command log of this process, or None if it is
+    disabled."""
+    global _SLOW_LOG
+
+    if not bird_proxy_config.get('SLOW_COMMAND_THRESHOLD'):
+        return None
+
+    with _SLOW_LOG_LOCK:
+        if _SLOW_LOG is None:
+            _SLOW_LOG = SlowCommandLog(
+                bird_proxy_config['SLOW_COMMAND_THRESHOLD'],
+                path=bird_proxy_config.get('SLOW_COMMAND_LOG'),
+                size=bird_proxy_config.get(
+                    'SLOW_COMMAND_BUFFER', DEFAULT_BUFFER_SIZE))
+
+        return _SLOW_LOG
@@ -0,0 +1,180 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import base64
+import binascii
+import errno
+import os
+import re
+import time
+
+DEFAULT_SPOOL_TTL = 300
+
+SPOOL_ID_REGEXP = re.compile(r'\A[0-9a-f]{32}\Z')
+
+SPOOL_FILE_SUFFIX = '.ndjson'
+
+
+class SpoolError(Exception):
+    pass
+
+
+class InvalidCursor(SpoolError):
+    pass
+
+
+class CursorExpired(SpoolError):
+    pass
+
+
+def encode_cursor(spool_id, offset):
+    return base64.urlsafe_b64encode('{}.{}'.format(spool_id, offset))
+
+
+def decode_cursor(cursor):
+    """Return the (spool id, offset) tuple of a cursor."""
+    try:
+        spool_id, offset = base64.urlsafe_b64decode(
+            str(cursor)).split('.')
+        offset = int(offset)
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise InvalidCursor("Invalid cursor")
+
+    if not SPOOL_ID_REGEXP.match(spool_id) or offset < 0:
+        raise InvalidCursor("Invalid cursor")
+
+    return spool_id, offset
+
+
+class ResultSpool(object):
+    """Spool of serialized results to be read one page at a time.
+
+    Results are written to a folder, one item per line, so that the pages
+    of a result can be served by any worker process. A cursor holds the
+    spooled result id and the file offset of the next page. Results expire
+    `ttl` seconds after they were last read.
+    """
+
+    def __init__(self, folder, ttl=DEFAULT_SPOOL_TTL):
+        self.folder = folder
+        self.ttl = ttl
+
+    def _path(self, spool_id):
+        return os.path.join(self.folder, spool_id + SPOOL_FILE_SUFFIX)
+
+    def purge(self):
+        """Remove expired results."""
+        expire_before = time.time() - self.ttl
+
+        try:
+            filenames = os.listdir(self.folder)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise SpoolError("Unable to read spool folder: {}".format(e))
+
+        for filename in filenames:
+            if not filename.endswith(SPOOL_FILE_SUFFIX):
+                continue
+
+            path = os.path.join(self.folder, filename)
+
+            try:
+                if os.stat(path).st_mtime < expire_before:
+                    os.remove(path)
+            except OSError:
+                # removed by another worker
+                pass
+
+    def write(self, lines):
+        """Spool the lines of a result, returning its id.
+
+        If iterating over `lines` raises, the partially written result is
+        removed.
+        """
+        self.purge()
+
+        try:
+            os.makedirs(self.folder)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise SpoolError("Unable to create spool folder: {}".format(e))
+
+        spool_id = binascii.hexlify(os.urandom(16))
+        path = self._path(spool_id)
+
+        try:
+            with open(path, 'wb') as spool_file:
+                for line in lines:
+                    spool_file.write(line + '\n')
+        except IOError as e:
+            self._remove(path)
+            raise SpoolError("Unable to write spool file: {}".format(e))
+        except:
+            self._remove(path)
+            raise
+
+        return spool_id
+
+    def read(self, spool_id, offset, limit):
+        """Return up to `limit` lines of a result starting at `offset`, and
+        the offset of the following lines or None if there are none left.
+        """
+        path = self._path(spool_id)
+
+        try:
+            if os.stat(path).st_mtime < time.time() - self.ttl:
+                raise CursorExpired("Cursor expired or unknown")
+
+            with open(path, 'rb') as spool_file:
+                # offsets must be at the start of a line
+                if offset > 0:
+                    spool_file.seek(offset - 1)
+                    if spool_file.read(1) != '\n':
+                        raise InvalidCursor("Invalid cursor")
+
+                lines = []
+                while len(lines) < limit:
+                    line = spool_file.readline()
+                    if not line:
+                        break
+
+                    lines.append(line.rstrip('\n'))
+
+                next_offset = spool_file.tell()
+                if not spool_file.readline():
+                    next_offset = None
+
+            # reading a result keeps it alive
+            os.utime(path, None)
+
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                raise CursorExpired("Cursor expired or unknown")
+            raise SpoolError("Unable to read spool file: {}".format(e))
+
+        return lines, next_offset
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def get_spool(bird_proxy_config):
+    return ResultSpool(
+        bird_proxy_config['RESULT_SPOOL_FOLDER'],
+        ttl=bird_proxy_config.get('RESULT_SPOOL_TTL', DEFAULT_SPOOL_TTL))
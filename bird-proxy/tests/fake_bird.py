@@ -0,0 +1,146 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+WELCOME = '0001 BIRD 1.6.3 ready.\n'
+
+PARSE_ERROR = '9001 syntax error\n'
+
+
+def to_reply(text, code='1007'):
+    """Return the reply BIRD sends on its socket for the text of a command
+    output, as `bird.BirdSocket.cmd` returns it."""
+    lines = text.splitlines()
+    if not lines:
+        return '0000 \n'
+
+    reply = ['{}-{}'.format(code, lines[0])]
+    reply.extend(' ' + line for line in lines[1:])
+    reply.append('0000 ')
+
+    return '\n'.join(reply) + '\n'
+
+
+class FakeBIRD(threading.Thread):
+    """BIRD control socket answering commands with canned replies.
+
+    `replies` maps commands to their reply, as sent on the socket, or is a
+    function returning the reply of a command. Unknown commands get a parse
+    error. Every reply is sent after `delay` seconds, `chunk_size` bytes at
+    a time if given.
+    """
+
+    def __init__(self, replies=None, delay=0.0, chunk_size=None):
+        super(FakeBIRD, self).__init__()
+        self.daemon = True
+
+        self.replies = replies if replies is not None else {}
+        self.delay = delay
+        self.chunk_size = chunk_size
+
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'bird.ctl')
+
+        # commands received, connections accepted and the most commands
+        # handled at the same time
+        self.commands = []
+        self.connections = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(64)
+
+    def config(self, **config):
+        """Return a bird-proxy config for both IP versions on this
+        socket."""
+        bird_proxy_config = {
+            'BIRD_SOCKET': self.path,
+            'BIRD6_SOCKET': self.path,
+            'BIRD_SOCKET_TIMEOUT': 5.0,
+        }
+        bird_proxy_config.update(config)
+
+        return bird_proxy_config
+
+    def stop(self):
+        self._server.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except socket.error:
+                return
+
+            handler = threading.Thread(target=self._handle, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def _reply(self, command):
+        if callable(self.replies):
+            return self.replies(command)
+
+        return self.replies.get(command, PARSE_ERROR)
+
+    def _send(self, conn, data):
+        chunk_size = self.chunk_size or len(data)
+
+        for offset in range(0, len(data), chunk_size):
+            conn.sendall(data[offset:offset + chunk_size])
+
+    def _handle(self, conn):
+        with self._lock:
+            self.connections += 1
+
+        try:
+            conn.sendall(WELCOME)
+
+            for line in iter(conn.makefile('rb').readline, ''):
+                command = line.rstrip('\n')
+
+                with self._lock:
+                    self.commands.append(command)
+                    self.running += 1
+                    self.max_running = max(self.max_running, self.running)
+
+                try:
+                    time.sleep(self.delay)
+                    self._send(conn, self._reply(command))
+                finally:
+                    with self._lock:
+                        self.running -= 1
+        except socket.error:
+            pass
+        finally:
+            conn.close()
+
+
+def start(test, **kwargs):
+    """Return a running `FakeBIRD`, stopped at the end of `test`."""
+    fake_bird = FakeBIRD(**kwargs)
+    fake_bird.start()
+    test.addCleanup(fake_bird.stop)
+
+    return fake_bird
@@ -0,0 +1,62 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+
+DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def read_data(name):
+    with open(os.path.join(DATA_FOLDER, name)) as data_file:
+        return data_file.read()
+
+
+def generate_show_route(count, detail=True):
+    """Return the reply text of a `show route` (`show route all` with
+    `detail`) of `count` prefixes with two routes each, as `bird.BirdSocket`
+    returns it."""
+    lines = []
+
+    for i in range(count):
+        prefix = '10.{}.{}.0/24'.format(i // 256 % 256, i % 256)
+        asn = 64500 + i % 7
+
+        for j in range(2):
+            peer = '193.239.116.{}'.format(10 + j)
+
+            lines.append(
+                '{:<18} via {} on eth1 [peer_{}_{} 2017-09-0{} 10:00:0{}] '
+                '{}(100) [AS{}i]'.format(
+                    prefix if j == 0 else '', peer, asn, j, 1 + i % 3, j,
+                    '* ' if j == 0 else '', asn))
+
+            if not detail:
+                continue
+
+            lines.append('\tType: BGP unicast univ')
+            lines.append('\tBGP.origin: IGP')
+            # unique paths, as on a real table
+            lines.append('\tBGP.as_path: {} {} {}'.format(34307 + j, i, asn))
+            lines.append('\tBGP.next_hop: {}'.format(peer))
+            lines.append('\tBGP.local_pref: 100')
+
+            communities = ' '.join(
+                '(34307,6000{})'.format(k) for k in range(i % 4))
+            if communities:
+                lines.append('\tBGP.community: ({},1) {}'.format(
+                    asn, communities))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,126 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import socket
+import unittest
+
+from bird_proxy.lib import bird, birdtool
+
+from tests import fake_bird, routes
+
+NOT_FOUND = 'Route not found: Network not in table\n'
+
+
+class RecordingSocket(bird.BirdSocket):
+    """`bird.BirdSocket` recording the commands sent and the replies read,
+    in order."""
+
+    def __init__(self, events, **kwargs):
+        bird.BirdSocket.__init__(self, **kwargs)
+        self.events = events
+
+    def send_cmd(self, cmd, **kwargs):
+        self.events.append(('send', cmd.split()[3]))
+        bird.BirdSocket.send_cmd(self, cmd, **kwargs)
+
+    def iter_reply(self, **kwargs):
+        self.events.append(('read',))
+        return bird.BirdSocket.iter_reply(self, **kwargs)
+
+
+class LookupPrefixesTest(unittest.TestCase):
+    """Batches of `show route for` commands run over a single connection,
+    with up to `pipeline_depth` commands sent ahead of their replies."""
+
+    def setUp(self):
+        text = routes.generate_show_route(3, detail=False).splitlines()
+        self.routes = {
+            '10.0.{}.0/24'.format(i): '\n'.join(text[2 * i:2 * i + 2])
+            for i in range(3)}
+        self.bird = fake_bird.start(self, replies=self.reply)
+
+        self.manager = birdtool.BIRDManager('ipv4', self.bird.config())
+        self.events = []
+        self.manager.pool._new_connection = lambda: RecordingSocket(
+            self.events, file=self.bird.path, timeout=5.0)
+
+    def reply(self, command):
+        prefix = command.split()[3]
+
+        if prefix == '10.0.9.0/24':
+            # the connection is lost
+            raise socket.error('closed')
+
+        if prefix not in self.routes:
+            return '8001 Network not in table\n'
+
+        return fake_bird.to_reply(self.routes[prefix])
+
+    def lookup(self, prefixes, pipeline_depth=1):
+        return [
+            (prefix, outcome, message if outcome is False else
+             [route.prefix for route in message])
+            for prefix, outcome, message, _ in self.manager.lookup_prefixes(
+                prefixes, pipeline_depth=pipeline_depth)]
+
+    def test_results_in_order(self):
+        prefixes = ['10.0.2.0/24', '10.0.5.0/24', '10.0.0.0/24']
+
+        for pipeline_depth in [0, 1, 2, 5]:
+            self.assertEqual(self.lookup(prefixes, pipeline_depth), [
+                ('10.0.2.0/24', True, ['10.0.2.0/24', '10.0.2.0/24']),
+                ('10.0.5.0/24', False, NOT_FOUND),
+                ('10.0.0.0/24', True, ['10.0.0.0/24', '10.0.0.0/24']),
+            ])
+
+        # all of them over the same connection
+        self.assertEqual(self.bird.connections, 1)
+        self.assertEqual(len(self.bird.commands), 12)
+
+    def test_pipeline_depth(self):
+        prefixes = ['10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/24']
+
+        self.lookup(prefixes, pipeline_depth=1)
+        self.assertEqual(self.events, [
+            ('send', '10.0.0.0/24'), ('read',),
+            ('send', '10.0.1.0/24'), ('read',),
+            ('send', '10.0.2.0/24'), ('read',),
+        ])
+
+        del self.events[:]
+        self.lookup(prefixes, pipeline_depth=2)
+        self.assertEqual(self.events, [
+            ('send', '10.0.0.0/24'), ('send', '10.0.1.0/24'), ('read',),
+            ('send', '10.0.2.0/24'), ('read',),
+            ('read',),
+        ])
+
+    def test_connection_lost(self):
+        results = self.lookup(
+            ['10.0.0.0/24', '10.0.9.0/24', '10.0.1.0/24'], pipeline_depth=2)
+
+        self.assertEqual(results[0][:2], ('10.0.0.0/24', True))
+        self.assertEqual(
+            [result[:2] for result in results[1:]],
+            [('10.0.9.0/24', False), ('10.0.1.0/24', False)])
+        self.assertTrue(results[1][2].startswith('Bird connection problem'))
+
+        # the next batch gets a new connection
+        self.assertEqual(self.lookup(['10.0.1.0/24'])[0][1], True)
+        self.assertEqual(self.bird.connections, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
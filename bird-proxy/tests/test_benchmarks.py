@@ -0,0 +1,112 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gc
+import os
+import resource
+import time
+import unittest
+
+from bird_proxy.lib import birdtool
+
+from tests import routes
+
+# benchmarks depend on the machine, they only run when asked for
+BENCHMARKS = os.environ.get('BIRD_PROXY_BENCHMARKS') == '1'
+
+# parsed routes per second `show route all` parsing must reach; override it
+# with BENCHMARK_ROUTES_PER_SEC on slow machines
+ROUTES_PER_SEC = int(os.environ.get('BENCHMARK_ROUTES_PER_SEC', 25000))
+
+STATM_PATH = '/proc/self/statm'
+
+
+def resident_memory():
+    """Return the resident memory of the process in bytes, after a full
+    garbage collection."""
+    gc.collect()
+
+    with open(STATM_PATH) as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+@unittest.skipUnless(BENCHMARKS, "set BIRD_PROXY_BENCHMARKS=1 to run")
+class ShowRouteBenchmark(unittest.TestCase):
+
+    def test_parse_throughput(self):
+        text = routes.generate_show_route(20000)
+        command = birdtool.ShowRouteCommand(None)
+
+        # best of three, to leave out warm up and scheduling noise
+        durations = []
+        for _ in range(3):
+            started = time.time()
+            outcome, parsed = command.parse_result((True, text))
+            durations.append(time.time() - started)
+
+        self.assertIs(outcome, True)
+        self.assertEqual(len(parsed), 40000)
+
+        routes_per_sec = len(parsed) / min(durations)
+        self.assertGreaterEqual(
+            routes_per_sec, ROUTES_PER_SEC,
+            "parsed {:.0f} routes/s, below the target of {} routes/s".format(
+                routes_per_sec, ROUTES_PER_SEC))
+
+
+@unittest.skipUnless(BENCHMARKS, "set BIRD_PROXY_BENCHMARKS=1 to run")
+@unittest.skipUnless(os.path.exists(STATM_PATH), "needs /proc/self/statm")
+class RouteMemoryBenchmark(unittest.TestCase):
+
+    def test_records_against_dicts(self):
+        # routes as parsed into dicts before records, the API output
+        text = routes.generate_show_route(20000)
+
+        before = resident_memory()
+        _, parsed = birdtool.ShowRouteCommand(None).parse_result((True, text))
+        records = resident_memory() - before
+
+        before = resident_memory()
+        dicts = [route.to_dict() for route in parsed]
+        dicts_size = resident_memory() - before
+
+        self.assertEqual(len(dicts), 40000)
+        self.assertLess(
+            records * 2, dicts_size,
+            "records take {} bytes per route, dicts {}".format(
+                records // len(parsed), dicts_size // len(dicts)))
+
+    def test_streamed_memory_is_flat(self):
+        # a streamed reply must not hold on to the values of parsed routes,
+        # such as the AS paths unique to every route
+        lines = routes.generate_show_route(100000).splitlines()
+        items = birdtool.ShowRouteCommand(None).parse_lines(iter(lines))
+
+        for _ in range(20000):
+            next(items)
+
+        before = resident_memory()
+        count = 20000 + sum(1 for _ in items)
+        growth = resident_memory() - before
+
+        self.assertEqual(count, 200000)
+        self.assertLess(
+            growth, 2 * 1024 * 1024,
+            "memory grew by {} bytes over 180000 streamed routes".format(
+                growth))
+
+
+if __name__ == '__main__':
+    unittest.main()
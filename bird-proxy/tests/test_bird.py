@@ -0,0 +1,81 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from bird_proxy.lib import bird
+
+from tests import fake_bird, routes
+
+
+class LineReaderTest(unittest.TestCase):
+    """`bird.BirdSocket` reads the same replies whatever chunks they are
+    received in and however small its buffer is."""
+
+    def setUp(self):
+        self.text = routes.generate_show_route(10)
+        self.replies = {'show route all': fake_bird.to_reply(self.text),
+                        'show status': fake_bird.to_reply('BIRD 1.6.3')}
+
+    def connect(self, bufsize=bird.BUFSIZE, **kwargs):
+        fake = fake_bird.start(self, replies=self.replies, **kwargs)
+
+        return bird.BirdSocket(file=fake.path, timeout=5.0, bufsize=bufsize)
+
+    def test_lines_split_across_chunks(self):
+        for chunk_size in [1, 3, 7, 100]:
+            conn = self.connect(chunk_size=chunk_size)
+
+            self.assertEqual(conn.cmd('show route all'),
+                             (True, self.text))
+            conn.close()
+
+    def test_buffer_grows_for_long_lines(self):
+        long_line = 'x' * 100
+        self.replies['show route all'] = fake_bird.to_reply(long_line)
+        conn = self.connect(bufsize=16, chunk_size=10)
+
+        self.assertEqual(conn.cmd('show route all'),
+                         (True, long_line + '\n'))
+        self.assertEqual(conn.cmd('show status'), (True, 'BIRD 1.6.3\n'))
+
+    def test_small_buffer(self):
+        # partial lines are moved to the front of the buffer
+        conn = self.connect(bufsize=64)
+
+        for _ in range(2):
+            self.assertEqual(conn.cmd('show route all'),
+                             (True, self.text))
+
+    def test_leftover_bytes_are_kept(self):
+        # replies to commands sent ahead arrive together; the bytes past
+        # the first reply belong to the next one
+        for chunk_size in [None, 5]:
+            conn = self.connect(bufsize=64, chunk_size=chunk_size)
+
+            for command in ['show status', 'show route all', 'show status']:
+                conn.send_cmd(command)
+
+            self.assertEqual(list(conn.iter_reply()),
+                             [('1007', 'BIRD 1.6.3')])
+            self.assertEqual(len(list(conn.iter_reply())),
+                             len(self.text.splitlines()))
+            self.assertEqual(list(conn.iter_reply()),
+                             [('1007', 'BIRD 1.6.3')])
+            self.assertTrue(conn.is_healthy())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from bird_proxy.lib import cache
+
+
+class ResultCacheTest(unittest.TestCase):
+    """`ResultCache` holds at most `max_items` routes across its results."""
+
+    def setUp(self):
+        self.cache = cache.ResultCache(
+            size=8, ttls={'ShowRouteCommand': 60}, max_items=10)
+
+    def put(self, name, count):
+        key = ('ShowRouteCommand', name)
+        self.cache.put(key, (True, range(count)))
+        return key
+
+    def test_evicts_until_items_fit(self):
+        first = self.put('first', 6)
+        second = self.put('second', 6)
+
+        self.assertIsNone(self.cache.get(first))
+        self.assertIsNotNone(self.cache.get(second))
+        self.assertEqual(self.cache.get_stats()['items'], 6)
+        self.assertEqual(self.cache.stats['evictions'], 1)
+
+    def test_skips_results_too_large(self):
+        key = self.put('full table', 11)
+
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.get_stats()['items'], 0)
+        self.assertEqual(self.cache.stats['too_large'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import unittest
+
+from bird_proxy.lib import birdtool, coalesce
+
+from tests import fake_bird, routes
+
+
+class CoalescerTest(unittest.TestCase):
+    """Callers of a key that is running wait for the result of the first
+    caller, the leader, instead of running it again."""
+
+    def setUp(self):
+        self.coalescer = coalesce.Coalescer()
+        self.release = threading.Event()
+        self.calls = []
+
+    def func(self, value):
+        self.calls.append(value)
+        self.release.wait(5.0)
+
+        if isinstance(value, Exception):
+            raise value
+
+        return value
+
+    def start(self, key, value, results, **kwargs):
+        def run():
+            try:
+                results.append(
+                    self.coalescer.run(key, self.func, value, **kwargs))
+            except Exception as e:
+                results.append(e)
+
+        caller = threading.Thread(target=run)
+        caller.start()
+        self.addCleanup(caller.join)
+        self.addCleanup(self.release.set)
+
+        return caller
+
+    def wait_for(self, name, value):
+        while self.coalescer.get_stats()[name] < value:
+            time.sleep(0.01)
+
+    def test_waiters_share_the_result(self):
+        results = []
+        callers = [self.start('key', 'leader', results)]
+        self.wait_for('in_flight', 1)
+
+        callers.extend(self.start('key', 'waiter', results)
+                       for _ in range(3))
+        self.wait_for('coalesced', 3)
+
+        self.release.set()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(results, ['leader'] * 4)
+        self.assertEqual(self.calls, ['leader'])
+        self.assertEqual(self.coalescer.get_stats(), {
+            'executions': 1, 'coalesced': 3, 'timeouts': 0, 'in_flight': 0})
+
+        # the next caller runs the function again
+        self.assertEqual(self.coalescer.run('key', self.func, 'next'), 'next')
+
+    def test_waiters_share_the_error(self):
+        error = ValueError('failed')
+        results = []
+        callers = [self.start('key', error, results)]
+        self.wait_for('in_flight', 1)
+
+        callers.append(self.start('key', 'waiter', results))
+        self.wait_for('coalesced', 1)
+
+        self.release.set()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(results, [error, error])
+
+    def test_other_keys_are_not_coalesced(self):
+        results = []
+        self.start('key', 'first', results)
+        self.wait_for('in_flight', 1)
+
+        self.start('other', 'second', results)
+        self.wait_for('in_flight', 2)
+
+        self.assertEqual(self.coalescer.get_stats()['coalesced'], 0)
+
+    def test_waiter_deadline(self):
+        results = []
+        leader = self.start('key', 'leader', results)
+        self.wait_for('in_flight', 1)
+
+        started = time.time()
+        with self.assertRaises(coalesce.DeadlineExceeded):
+            self.coalescer.run('key', self.func, 'waiter',
+                               deadline=started + 0.05)
+        self.assertLess(time.time() - started, 1.0)
+
+        # the leader is not affected
+        self.release.set()
+        leader.join()
+
+        self.assertEqual(results, ['leader'])
+        self.assertEqual(self.coalescer.get_stats()['timeouts'], 1)
+
+
+class CoalescedCommandTest(unittest.TestCase):
+    """Identical read-only commands running at the same time are sent to
+    BIRD once."""
+
+    def test_show_route(self):
+        reply = fake_bird.to_reply(routes.generate_show_route(5))
+        bird = fake_bird.start(
+            self, replies=lambda command: reply, delay=0.2)
+        manager = birdtool.BIRDManager('ipv4', bird.config())
+
+        results = []
+
+        def run():
+            results.append(manager.get_routes_information())
+
+        callers = [threading.Thread(target=run) for _ in range(4)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(len(bird.commands), 1)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(results[0][0], True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+
+from bird_proxy.lib import bird, birdtool
+
+from tests import fake_bird, routes
+
+DEADLINE_EXCEEDED = "Bird connection problem: deadline exceeded"
+
+
+class DeadlineTest(unittest.TestCase):
+    """Commands stop waiting for BIRD at the deadline of the request, well
+    before the socket timeout, and say so."""
+
+    def setUp(self):
+        reply = fake_bird.to_reply(routes.generate_show_route(10))
+        self.bird = fake_bird.start(
+            self, replies=lambda command: reply, delay=1.0)
+
+    def manager(self, deadline):
+        return birdtool.BIRDManager(
+            'ipv4', self.bird.config(BIRD_SOCKET_TIMEOUT=5.0),
+            deadline=time.time() + deadline)
+
+    def test_buffered(self):
+        # a timeout set from the deadline may fire a little before it
+        for _ in range(5):
+            started = time.time()
+            outcome, message = self.manager(0.2).get_routes_information()
+
+            self.assertLess(time.time() - started, 1.0)
+            self.assertEqual((outcome, message), (False, DEADLINE_EXCEEDED))
+
+    def test_streamed(self):
+        for _ in range(5):
+            routes = self.manager(0.2).stream_routes_information()
+
+            with self.assertRaises(birdtool.BIRDCommandError) as raised:
+                list(routes)
+
+            self.assertEqual(str(raised.exception), DEADLINE_EXCEEDED)
+
+    def test_past_deadline(self):
+        conn = bird.BirdSocket(file=self.bird.path, timeout=5.0)
+
+        self.assertEqual(conn.cmd('show route', deadline=time.time()),
+                         (False, DEADLINE_EXCEEDED))
+        self.assertEqual(self.bird.connections, 0)
+
+    def test_without_socket_timeout(self):
+        conn = bird.BirdSocket(file=self.bird.path, timeout=None)
+
+        started = time.time()
+        self.assertEqual(
+            conn.cmd('show route', deadline=time.time() + 0.2),
+            (False, DEADLINE_EXCEEDED))
+        self.assertLess(time.time() - started, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import time
+import unittest
+
+from bird_proxy.lib import birdtool
+
+from tests import fake_bird, routes
+
+PROTOCOL_REGEXP = re.compile(r'protocol (\w+)')
+
+CONFIG = """
+table T64500;
+table T64501;
+protocol bgp peer_64500 {
+    table T64500;
+}
+protocol bgp peer_64501 {
+    table T64501;
+}
+"""
+
+
+class FanoutTest(unittest.TestCase):
+    """`BIRDManager.fanout_routes_information` returns the outcome of every
+    target in the order of the targets."""
+
+    def reply(self, command):
+        protocol = PROTOCOL_REGEXP.search(command).group(1)
+
+        if protocol == 'missing':
+            return '8003 No protocols match\n'
+
+        # the first targets finish last
+        count = int(protocol.split('_')[1])
+        time.sleep(0.05 * (4 - count))
+
+        return fake_bird.to_reply(routes.generate_show_route(count))
+
+    def manager(self, **config):
+        self.bird = fake_bird.start(self, replies=self.reply)
+
+        return birdtool.BIRDManager('ipv4', self.bird.config(
+            BIRD_CONFIG_FOLDER=self.bird.folder, FANOUT_CONCURRENCY=4,
+            **config))
+
+    def test_results_in_target_order(self):
+        manager = self.manager()
+
+        results = manager.fanout_routes_information(
+            ['peer_1', 'peer_2', 'missing', 'peer_3'], 'protocol')
+
+        self.assertEqual(
+            [(target, outcome) for target, outcome, _ in results],
+            [('peer_1', True), ('peer_2', True), ('missing', False),
+             ('peer_3', True)])
+        self.assertEqual([len(results[i][2]) for i in (0, 1, 3)], [2, 4, 6])
+        self.assertEqual(results[2][2],
+                         "No protocols match: No protocols match\n")
+        self.assertEqual(
+            sorted(self.bird.commands),
+            ['show route protocol missing', 'show route protocol peer_1',
+             'show route protocol peer_2', 'show route protocol peer_3'])
+
+    def test_rejected_targets_fail_alone(self):
+        manager = self.manager(BIRD_POOL_SIZE=1, BIRD_POOL_QUEUE_SIZE=0)
+
+        # the only connection is busy
+        with manager.pool.connection():
+            results = manager.fanout_routes_information(
+                ['peer_1', 'peer_2'], 'protocol')
+
+        self.assertEqual(
+            [(target, outcome) for target, outcome, _ in results],
+            [('peer_1', False), ('peer_2', False)])
+        self.assertIn("waiting", results[0][2])
+        self.assertEqual(manager.pool.get_stats()['rejections'], 2)
+
+    def test_invalid_kind(self):
+        with self.assertRaises(birdtool.BIRDToolError):
+            self.manager().fanout_routes_information(['T1'], 'peer')
+
+    def test_targets_from_latest_config(self):
+        manager = self.manager()
+
+        with open(manager.latest_config_path(), 'w') as config_file:
+            config_file.write(CONFIG)
+
+        self.assertEqual(manager.get_fanout_targets('protocol'),
+                         ['peer_64500', 'peer_64501'])
+        # tables named again by the protocols come once
+        self.assertEqual(manager.get_fanout_targets('table'),
+                         ['T64500', 'T64501'])
+
+    def test_targets_without_config(self):
+        manager = self.manager()
+
+        with self.assertRaises(birdtool.BIRDToolError):
+            manager.get_fanout_targets('table')
+
+
+if __name__ == '__main__':
+    unittest.main()
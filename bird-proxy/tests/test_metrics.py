@@ -0,0 +1,84 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bird_proxy.lib import metrics
+
+
+class MetricsFolderTest(unittest.TestCase):
+    """Metrics of all worker processes are summed from their files."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.metrics_folder = metrics.MetricsFolder(self.folder)
+
+    def values(self, observations, received_bytes):
+        request_seconds = metrics.Histogram(
+            'bird_proxy_request_seconds', '', labels=('endpoint',))
+        received = metrics.Counter(
+            'bird_proxy_received_bytes_total', '', labels=('endpoint',))
+
+        for seconds in observations:
+            request_seconds.observe(seconds, 'routes_info')
+        received.inc(received_bytes, 'routes_info')
+
+        return {
+            request_seconds.name: request_seconds.get_values(),
+            received.name: received.get_values(),
+        }
+
+    def write_process(self, pid, values):
+        with open(os.path.join(self.folder, '{}.json'.format(pid)),
+                  'w') as metrics_file:
+            metrics_file.write(metrics._encode(values))
+
+    def test_sums_processes(self):
+        # another worker process, still running
+        self.write_process(os.getppid(), self.values([0.01, 2.0], 100))
+
+        merged = self.metrics_folder.read(self.values([0.01], 10))
+
+        counts = merged['bird_proxy_request_seconds'][('routes_info',)]
+        self.assertEqual(sum(counts[:-1]), 3)
+        self.assertAlmostEqual(counts[-1], 2.02)
+        self.assertEqual(
+            merged['bird_proxy_received_bytes_total'][('routes_info',)],
+            [110])
+
+    def test_keeps_exited_processes(self):
+        # a process that is not running anymore
+        exited_pid = os.fork()
+        if not exited_pid:
+            os._exit(0)
+        os.waitpid(exited_pid, 0)
+
+        self.write_process(exited_pid, self.values([], 5))
+        self.metrics_folder.write(self.values([], 1))
+
+        self.assertNotIn('{}.json'.format(exited_pid),
+                         os.listdir(self.folder))
+
+        merged = self.metrics_folder.read(self.values([], 2))
+        self.assertEqual(merged['bird_proxy_received_bytes_total'],
+                         {('routes_info',): [7]})
+
+
+if __name__ == '__main__':
+    unittest.main()
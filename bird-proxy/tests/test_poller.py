@@ -0,0 +1,80 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import unittest
+
+from bird_proxy.lib import poller
+
+from tests import fake_bird, routes
+
+
+class RIBPollerTest(unittest.TestCase):
+    """Only one RIB poller reads from BIRD, the others load its stored
+    snapshots."""
+
+    def setUp(self):
+        reply = fake_bird.to_reply(routes.generate_show_route(10))
+        self.bird = fake_bird.start(self, replies=lambda command: reply)
+        self.config = self.bird.config(
+            RIB_SNAPSHOT_INTERVAL=60,
+            RIB_SNAPSHOT_FOLDER=os.path.join(self.bird.folder, 'rib'))
+
+    def refresh(self, rib_poller):
+        # what the poller thread does every interval
+        snapshot = rib_poller.take_snapshot()
+
+        if snapshot is not None:
+            with rib_poller._lock:
+                rib_poller._snapshot = snapshot
+
+        return snapshot
+
+    def test_followers_load_the_leader_snapshot(self):
+        leader = poller.RIBPoller('ipv4', self.config)
+        follower = poller.RIBPoller('ipv4', self.config)
+
+        snapshot = self.refresh(leader)
+        loaded = self.refresh(follower)
+
+        self.assertTrue(leader.get_stats()['leader'])
+        self.assertFalse(follower.get_stats()['leader'])
+        self.assertEqual(loaded.value.id, snapshot.value.id)
+        self.assertEqual(loaded.value.routes, 20)
+        self.assertEqual(len(self.bird.commands), 1)
+
+        # the same snapshot is not loaded again
+        self.assertIsNone(self.refresh(follower))
+
+        self.refresh(leader)
+        self.assertNotEqual(self.refresh(follower).value.id, snapshot.value.id)
+
+    def test_leader_keeps_snapshot_it_cannot_store(self):
+        leader = poller.RIBPoller('ipv4', self.config)
+        self.refresh(leader)
+
+        # the stored snapshot can't be replaced by a file anymore
+        path = leader._path('.pickle')
+        os.remove(path)
+        os.mkdir(path)
+
+        snapshot = self.refresh(leader)
+
+        self.assertIs(leader.get_snapshot(), snapshot)
+        self.assertEqual(leader.get_stats()['store_errors'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
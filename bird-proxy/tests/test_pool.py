@@ -0,0 +1,218 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from bird_proxy.lib import birdtool, pool
+
+from tests import fake_bird, routes
+
+
+STATUS = fake_bird.to_reply('BIRD 1.6.3', code='1000')
+
+
+class BirdSocketPoolTest(unittest.TestCase):
+    """`pool.BirdSocketPool` reuses healthy connections and queues callers
+    beyond its size."""
+
+    def setUp(self):
+        self.bird = fake_bird.start(self, replies={'show status': STATUS})
+
+    def pool(self, **kwargs):
+        return pool.BirdSocketPool(self.bird.path, timeout=5.0, **kwargs)
+
+    def test_connection_is_reused(self):
+        bird_pool = self.pool()
+
+        for _ in range(3):
+            self.assertEqual(bird_pool.cmd('show status'),
+                             (True, 'BIRD 1.6.3\n'))
+
+        self.assertEqual(self.bird.connections, 1)
+        stats = bird_pool.get_stats()
+        self.assertEqual((stats['misses'], stats['hits']), (1, 2))
+        self.assertEqual((stats['open'], stats['idle']), (1, 1))
+
+    def test_unhealthy_connection_is_replaced(self):
+        # a reply with more lines than the command asked for leaves the
+        # connection out of sync with BIRD
+        self.bird.replies['show status'] = STATUS + '0000 \n'
+        bird_pool = self.pool()
+
+        bird_pool.cmd('show status')
+        time.sleep(0.05)
+        bird_pool.cmd('show status')
+
+        self.assertEqual(self.bird.connections, 2)
+        stats = bird_pool.get_stats()
+        self.assertEqual((stats['discarded'], stats['misses']), (1, 2))
+
+    def test_closed_connection_is_dropped(self):
+        bird_pool = self.pool()
+
+        conn = bird_pool.acquire()
+        conn.close()
+        bird_pool.release(conn)
+
+        self.assertEqual(bird_pool.get_stats()['open'], 0)
+        self.assertEqual(bird_pool.cmd('show status')[0], True)
+
+    def test_idle_connections_are_evicted(self):
+        bird_pool = self.pool(idle_timeout=0.05)
+
+        bird_pool.cmd('show status')
+        time.sleep(0.1)
+        bird_pool.cmd('show status')
+
+        self.assertEqual(self.bird.connections, 2)
+        self.assertEqual(bird_pool.get_stats()['evictions'], 1)
+
+    def test_wait_times_out(self):
+        bird_pool = self.pool(size=1, wait_timeout=0.05)
+        conn = bird_pool.acquire()
+
+        with self.assertRaises(pool.PoolTimeout):
+            bird_pool.acquire()
+
+        bird_pool.release(conn)
+        bird_pool.release(bird_pool.acquire())
+
+        stats = bird_pool.get_stats()
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 1))
+
+    def test_wait_ends_at_deadline(self):
+        bird_pool = self.pool(size=1)
+        conn = bird_pool.acquire()
+
+        started = time.time()
+        with self.assertRaises(pool.PoolTimeout):
+            bird_pool.acquire(deadline=started + 0.05)
+        self.assertLess(time.time() - started, 1.0)
+
+        bird_pool.release(conn)
+
+    def test_full_queue_is_rejected(self):
+        # PoolFull is answered with a 429
+        bird_pool = self.pool(size=1, queue_size=0)
+        conn = bird_pool.acquire()
+
+        with self.assertRaises(pool.PoolFull):
+            bird_pool.acquire()
+
+        bird_pool.release(conn)
+        self.assertEqual(bird_pool.get_stats()['rejections'], 1)
+
+    def test_cheap_commands_are_served_first(self):
+        bird_pool = self.pool(size=1)
+        conn = bird_pool.acquire()
+        served = []
+
+        def run(cost):
+            bird_pool.release(bird_pool.acquire(cost))
+            served.append(cost)
+
+        waiters = []
+        for cost in [pool.COST_EXPENSIVE, pool.COST_CHEAP]:
+            waiter = threading.Thread(target=run, args=(cost,))
+            waiter.start()
+            waiters.append(waiter)
+
+            while bird_pool.get_stats()['queued'] < len(waiters):
+                time.sleep(0.01)
+
+        bird_pool.release(conn)
+        for waiter in waiters:
+            waiter.join()
+
+        self.assertEqual(served, [pool.COST_CHEAP, pool.COST_EXPENSIVE])
+
+
+class SocketSlotsTest(unittest.TestCase):
+    """`pool.SocketSlots` limits hold for every holder of the slot files,
+    which are opened again by each `SocketSlots`, as in other processes."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def slots(self, queue_size=None):
+        return pool.SocketSlots(
+            self.folder, 'bird.ctl', 2, queue_size=queue_size)
+
+    def test_run_slots_are_shared(self):
+        first, second = self.slots(), self.slots()
+        held = [first.acquire(), second.acquire()]
+
+        started = time.time()
+        with self.assertRaises(pool.PoolTimeout):
+            first.acquire(give_up=started + 0.1)
+        self.assertGreaterEqual(time.time() - started, 0.1)
+
+        second.release(held.pop())
+        first.release(first.acquire(give_up=time.time() + 0.1))
+
+    def test_cheap_slot_is_kept(self):
+        slots = self.slots()
+        # released when closed, so they are kept until the end of the test
+        held = [slots.acquire(pool.COST_EXPENSIVE)]
+
+        with self.assertRaises(pool.PoolTimeout):
+            slots.acquire(pool.COST_EXPENSIVE, give_up=time.time())
+
+        held.append(slots.acquire(pool.COST_CHEAP, give_up=time.time()))
+
+    def test_full_queue_is_rejected(self):
+        slots = self.slots(queue_size=0)
+        held = [slots.acquire(), slots.acquire()]
+
+        with self.assertRaises(pool.PoolFull):
+            slots.acquire(give_up=time.time() + 10)
+
+        self.assertEqual(slots.get_stats()['rejections'], 1)
+        self.assertEqual(len(held), 2)
+
+
+class ExpensiveConcurrencyTest(unittest.TestCase):
+    """Fan-outs run no more route dumps at once than the slots they may
+    hold, so that none of them times out waiting for the cheap slot."""
+
+    def test_fanout_within_expensive_slots(self):
+        reply = fake_bird.to_reply(
+            routes.generate_show_route(2, detail=False))
+        bird = fake_bird.start(self, replies=lambda command: reply, delay=0.3)
+
+        manager = birdtool.BIRDManager('ipv4', bird.config(
+            BIRD_POOL_SIZE=4, BIRD_POOL_WAIT_TIMEOUT=0.2,
+            BIRD_SLOT_FOLDER=os.path.join(bird.folder, 'slots'),
+            FANOUT_CONCURRENCY=4))
+        self.assertEqual(manager.pool.get_size(pool.COST_EXPENSIVE), 3)
+
+        results = manager.fanout_routes_information(
+            ['T1', 'T2', 'T3', 'T4'], 'table')
+
+        self.assertEqual([(target, outcome, len(message))
+                          for target, outcome, message in results],
+                         [('T1', True, 4), ('T2', True, 4),
+                          ('T3', True, 4), ('T4', True, 4)])
+        self.assertEqual(bird.max_running, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
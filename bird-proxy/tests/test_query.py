@@ -0,0 +1,149 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from bird_proxy.lib import query
+
+
+class CompileQueryTest(unittest.TestCase):
+    """Route queries compile to valid BIRD `where` conditions."""
+
+    def assertCompiles(self, route_query, condition, ip_version='ipv4'):
+        self.assertEqual(
+            query.compile_query(route_query, ip_version), condition)
+
+    def assertInvalid(self, route_query, ip_version='ipv4'):
+        self.assertRaises(
+            query.QueryError, query.compile_query, route_query, ip_version)
+
+    def test_conditions(self):
+        self.assertCompiles(
+            {'origin_as': 64500}, '(bgp_path.last = 64500)')
+        self.assertCompiles(
+            {'origin_as': [64500, 64501]},
+            '((bgp_path.last = 64500) || (bgp_path.last = 64501))')
+        self.assertCompiles(
+            {'prefix_length': {'min': 8, 'max': 24}},
+            '(net.len >= 8 && net.len <= 24)')
+        self.assertCompiles(
+            {'peer': '2001:DB8::0:1'}, '(from = 2001:db8::1)', 'ipv6')
+
+    def test_keys_are_sorted(self):
+        self.assertCompiles(
+            {'prefix_length': 24, 'origin_as': 64500},
+            '((bgp_path.last = 64500) && (net.len = 24))')
+
+    def test_nested_queries(self):
+        self.assertCompiles(
+            {'or': [{'origin_as': 1}, {'not': {'origin_as': 2}}]},
+            '((bgp_path.last = 1) || (! (bgp_path.last = 2)))')
+        self.assertCompiles(
+            {'and': [{'origin_as': 1}, {'prefix_length': 24}]},
+            '((bgp_path.last = 1) && (net.len = 24))')
+
+    def test_community(self):
+        condition = '((34307,60000) ~ bgp_community)'
+
+        self.assertCompiles({'community': '34307:60000'}, condition)
+        self.assertCompiles({'community': [34307, 60000]}, condition)
+        self.assertCompiles({'community': [[34307, 60000]]}, condition)
+        self.assertCompiles(
+            {'community': ['34307:60000', [1, 2]]},
+            '(((34307,60000) ~ bgp_community) && ((1,2) ~ bgp_community))')
+
+    def test_invalid_community(self):
+        for community in ['34307', '34307:60000:1', '34307:65536', '-1:1',
+                          'a:b', [1, 2, 3], [1, True], [70000, 1], 1.5,
+                          {'asn': 1}, None]:
+            self.assertInvalid({'community': community})
+
+    def test_prefix_in(self):
+        self.assertCompiles(
+            {'prefix_in': ['10.0.0.0/8', '10.0.0.0/8+', '10.0.0.0/8-',
+                           '10.0.0.0/8{16,24}']},
+            '(net ~ [ 10.0.0.0/8, 10.0.0.0/8+, 10.0.0.0/8-, '
+            '10.0.0.0/8{16,24} ])')
+        self.assertCompiles(
+            {'prefix_in': ['2001:db8::/32']}, '(net ~ [ 2001:db8::/32 ])',
+            'ipv6')
+
+    def test_invalid_prefix(self):
+        for item in ['10.0.0.1/8', '10.0.0.0/33', '10.0.0.0/8{4,24}',
+                     '10.0.0.0/8{24,16}', '10.0.0.0/8{16,33}', '10.0.0.0',
+                     '256.0.0.0/8', '2001:db8::/32', 8, None]:
+            self.assertInvalid({'prefix_in': [item]})
+
+        self.assertInvalid({'prefix_in': '10.0.0.0/8'})
+        self.assertInvalid({'prefix_in': []})
+        self.assertInvalid({'prefix_in': ['10.0.0.0/8']}, 'ipv6')
+
+    def test_invalid_values(self):
+        for route_query in [{'origin_as': -1}, {'origin_as': 2 ** 32},
+                            {'origin_as': '64500'}, {'origin_as': True},
+                            {'prefix_length': 33},
+                            {'prefix_length': {'min': 8, 'len': 24}},
+                            {'prefix_length': {}}, {'peer': 'localhost'},
+                            {'peer': '2001:db8::1'}]:
+            self.assertInvalid(route_query)
+
+    def test_invalid_queries(self):
+        for route_query in [None, {}, [], 'origin_as', {'and': []},
+                            {'or': {'origin_as': 1}}, {'not': []},
+                            {'not': {}}, {'and': [{'origin_as': 1}, {}]}]:
+            self.assertInvalid(route_query)
+
+        self.assertInvalid({'origin_as': 1}, 'ipv5')
+
+    def test_unknown_operators(self):
+        for route_query in [{'xor': [{'origin_as': 1}]},
+                            {'origin_as': 1, 'net': '10.0.0.0/8'},
+                            {'not': {'bgp_path.last': 1}}]:
+            self.assertInvalid(route_query)
+
+    def test_injection(self):
+        # nothing but validated values may end up in the condition
+        for value in ['1"', '1;', '1}', '1\n', '1) || (1 = 1',
+                      '"; configure; "', '}\nconfigure']:
+            self.assertInvalid({'origin_as': value})
+            self.assertInvalid({'community': value})
+            self.assertInvalid({'community': '1:' + value})
+            self.assertInvalid({'peer': value})
+            self.assertInvalid({'peer': '10.0.0.1' + value})
+            self.assertInvalid({'prefix_in': [value]})
+            self.assertInvalid({'prefix_in': ['10.0.0.0/8' + value]})
+            self.assertInvalid({'prefix_in': ['10.0.0.0/8{16,24' + value]})
+            self.assertInvalid({value: 1})
+
+    def test_depth_limit(self):
+        route_query = {'origin_as': 1}
+        for _ in range(query.MAX_QUERY_DEPTH):
+            route_query = {'not': route_query}
+
+        query.compile_query(route_query, 'ipv4')
+
+        self.assertInvalid({'not': route_query})
+        self.assertInvalid({'and': [route_query]})
+
+    def test_deep_queries(self):
+        route_query = {'origin_as': 1}
+        for _ in range(10000):
+            route_query = {'or': [route_query]}
+
+        self.assertInvalid(route_query)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import cPickle
+import os
+import random
+import subprocess
+import sys
+import unittest
+
+from bird_proxy.lib import birdtool, rib
+
+from tests import routes
+
+
+class PrefixTrieTest(unittest.TestCase):
+    """`rib.PrefixTrie` lookups match the ones of a linear search over the
+    stored prefixes."""
+
+    def setUp(self):
+        self.random = random.Random(1)
+
+    def random_prefix(self, bits):
+        length = self.random.choice([0, 1, 7, 8, 9, 16, 23, 24, 25, bits])
+        key = self.random.getrandbits(bits) if length else 0
+
+        # few distinct high bits, so that prefixes nest
+        key &= (0xf << (bits - 4)) | ((1 << (bits - 8)) - 1)
+
+        return (key >> (bits - length)) << (bits - length), length
+
+    def covers(self, prefix, other, bits):
+        key, length = prefix
+        other_key, other_length = other
+
+        return (length <= other_length and
+                (key ^ other_key) >> (bits - length) == 0)
+
+    def check(self, bits):
+        trie = rib.PrefixTrie(bits)
+        stored = set()
+
+        for _ in range(300):
+            prefix = self.random_prefix(bits)
+            self.assertEqual(
+                trie.setdefault(prefix[0], prefix[1], prefix), prefix)
+            stored.add(prefix)
+
+        self.assertEqual(trie.size, len(stored))
+
+        for _ in range(500):
+            key, length = prefix = self.random_prefix(bits)
+            covering = sorted(
+                (other for other in stored
+                 if self.covers(other, prefix, bits)),
+                key=lambda other: other[1])
+            covered = set(other for other in stored
+                          if self.covers(prefix, other, bits))
+
+            self.assertEqual(trie.exact(key, length),
+                             prefix if prefix in stored else None)
+            self.assertEqual(trie.longest_match(key, length),
+                             covering[-1] if covering else None)
+            self.assertEqual(trie.covering(key, length), covering)
+            self.assertEqual(set(trie.covered(key, length)), covered)
+            self.assertEqual(len(trie.covered(key, length)), len(covered))
+
+    def test_ipv4(self):
+        self.check(32)
+
+    def test_ipv6(self):
+        self.check(128)
+
+    def test_setdefault_keeps_value(self):
+        trie = rib.PrefixTrie(32)
+        key, length = rib.parse_prefix('10.0.0.0/8', 'ipv4')
+
+        self.assertEqual(trie.setdefault(key, length, []), [])
+        trie.setdefault(key, length, []).append('route')
+
+        self.assertEqual(trie.exact(key, length), ['route'])
+        self.assertEqual(trie.size, 1)
+
+
+class RIBLookupTest(unittest.TestCase):
+    """`rib.RIB.lookup` returns the routes of the prefixes matching."""
+
+    def setUp(self):
+        _, self.parsed = birdtool.ShowRouteCommand(None).parse_result(
+            (True, routes.generate_show_route(3)))
+        _, covering = birdtool.ShowRouteCommand(None).parse_result(
+            (True, routes.generate_show_route(1).replace('/24', '/16')))
+
+        self.routes = {
+            '10.0.0.0/16': covering,
+            '10.0.0.0/24': self.parsed[:2],
+            '10.0.1.0/24': self.parsed[2:4],
+        }
+
+        self.snapshot = rib.RIB('ipv4')
+        self.snapshot.add_routes('master', covering + self.parsed[:4])
+        self.snapshot.complete()
+
+    def lookup(self, prefix, match=rib.MATCH_LONGEST):
+        return self.snapshot.lookup('master', prefix, match)
+
+    def test_longest_match(self):
+        self.assertEqual(self.lookup('10.0.0.1'), self.routes['10.0.0.0/24'])
+        self.assertEqual(self.lookup('10.0.1.0/25'),
+                         self.routes['10.0.1.0/24'])
+        self.assertEqual(self.lookup('10.0.2.1'), self.routes['10.0.0.0/16'])
+        self.assertEqual(self.lookup('10.0.0.0/16'),
+                         self.routes['10.0.0.0/16'])
+        self.assertEqual(self.lookup('10.0.0.0/15'), [])
+        self.assertEqual(self.lookup('10.1.0.1'), [])
+
+    def test_match_types(self):
+        self.assertEqual(self.lookup('10.0.0.1', rib.MATCH_EXACT), [])
+        self.assertEqual(self.lookup('10.0.0.0/24', rib.MATCH_EXACT),
+                         self.routes['10.0.0.0/24'])
+        self.assertEqual(self.lookup('10.0.0.1', rib.MATCH_COVERING),
+                         self.routes['10.0.0.0/16'] +
+                         self.routes['10.0.0.0/24'])
+        self.assertEqual(
+            sorted(self.lookup('10.0.0.0/8', rib.MATCH_COVERED)),
+            sorted(self.routes['10.0.0.0/16'] + self.parsed[:4]))
+
+    def test_invalid_lookups(self):
+        for prefix in ['10.0.0.0/33', '10.0.0', '2001:db8::/32', '']:
+            with self.assertRaises(rib.RIBError):
+                self.lookup(prefix)
+
+        with self.assertRaises(rib.RIBError):
+            self.lookup('10.0.0.0/8', 'nearest')
+        with self.assertRaises(rib.RIBError):
+            self.snapshot.lookup('T1', '10.0.0.0/8')
+
+
+class RIBPickleTest(unittest.TestCase):
+    """A `rib.RIB` stored by the RIB poller loads back the same."""
+
+    def test_round_trip(self):
+        _, parsed = birdtool.ShowRouteCommand(None).parse_result(
+            (True, routes.generate_show_route(50)))
+
+        previous = rib.RIB('ipv4', snapshot_id='a-1')
+        previous.add_routes('master', parsed[2:])
+        previous.complete()
+
+        snapshot = rib.RIB('ipv4', snapshot_id='a-2', previous=previous)
+        snapshot.add_routes('master', parsed)
+        snapshot.complete()
+
+        loaded = cPickle.loads(
+            cPickle.dumps(snapshot, cPickle.HIGHEST_PROTOCOL))
+
+        self.assertEqual(loaded.id, 'a-2')
+        self.assertEqual(loaded.routes, 100)
+        self.assertEqual(loaded.get_table(None).get_routes(), parsed)
+        self.assertEqual(
+            loaded.lookup('master', parsed[0].prefix),
+            snapshot.lookup('master', parsed[0].prefix))
+        self.assertEqual(
+            loaded.get_changes('a-1'), snapshot.get_changes('a-1'))
+
+
+class RouteHashTest(unittest.TestCase):
+    """`rib.route_hash` is the same in every process."""
+
+    def test_stable_across_processes(self):
+        _, parsed = birdtool.ShowRouteCommand(None).parse_result(
+            (True, routes.generate_show_route(1)))
+
+        # string hashes are randomized with -R
+        output = subprocess.check_output([
+            sys.executable, '-R', '-c',
+            'import binascii\n'
+            'from bird_proxy.lib import birdtool, rib\n'
+            'from tests import routes\n'
+            '_, parsed = birdtool.ShowRouteCommand(None).parse_result(\n'
+            '    (True, routes.generate_show_route(1)))\n'
+            'print binascii.hexlify(rib.route_hash(parsed[0]))\n'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+        self.assertEqual(output.strip(),
+                         binascii.hexlify(rib.route_hash(parsed[0])))
+        self.assertNotEqual(rib.route_hash(parsed[0]),
+                            rib.route_hash(parsed[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+
+from bird_proxy.lib import birdtool
+
+from tests import routes
+
+
+class ShowRouteParserTest(unittest.TestCase):
+    """`ShowRouteCommand` output matches the one of the original parser,
+    saved as JSON next to every captured reply."""
+
+    def assertParsedAs(self, name, fields=None):
+        expected = json.loads(routes.read_data(name + '.json'))
+
+        outcome, parsed = birdtool.ShowRouteCommand(
+            None, fields=fields).parse_result(
+            (True, routes.read_data(name + '.txt')))
+
+        self.assertIs(outcome, True)
+        self.assertEqual([route.to_dict() for route in parsed], expected)
+
+    def test_show_route(self):
+        self.assertParsedAs('show_route')
+
+    def test_show_route_all(self):
+        self.assertParsedAs('show_route_all')
+
+    def test_show_route_all_edge_cases(self):
+        self.assertParsedAs('show_route_all_edge_cases')
+
+    def test_stream_matches_parse_result(self):
+        text = routes.read_data('show_route_all.txt')
+        command = birdtool.ShowRouteCommand(None)
+
+        self.assertEqual(
+            list(command.parse_lines(iter(text.splitlines()))),
+            command.parse_result((True, text))[1])
+
+    def test_fields(self):
+        text = routes.read_data('show_route_all.txt')
+        fields = frozenset(['prefix', 'as_path'])
+
+        _, parsed = birdtool.ShowRouteCommand(
+            None, fields=fields).parse_result((True, text))
+
+        for route in parsed:
+            self.assertEqual(set(route.to_dict()), fields)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bird_proxy.lib import slowlog
+
+
+def entry(command, duration):
+    return {'command': command, 'duration': duration}
+
+
+class SlowCommandLogTest(unittest.TestCase):
+    """The slowest commands are read back from the log file shared by all
+    worker processes."""
+
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        self.path = os.path.join(folder, 'slow-commands.log')
+
+    def test_reads_other_processes(self):
+        one = slowlog.SlowCommandLog(1.0, path=self.path, size=3)
+        other = slowlog.SlowCommandLog(1.0, path=self.path, size=3)
+
+        one.record(entry('show route', 2.0))
+        other.record(entry('show protocols all', 5.0))
+        other.record(entry('show route all', 0.5))
+
+        self.assertEqual(
+            [found['command'] for found in one.get_slowest(10)],
+            ['show protocols all', 'show route'])
+
+    def test_last_entries_only(self):
+        slow_log = slowlog.SlowCommandLog(0.0, path=self.path, size=3)
+
+        for duration in range(10):
+            slow_log.record(entry('show route', duration))
+
+        self.assertEqual(
+            [found['duration'] for found in slow_log.get_slowest(2)], [9, 8])
+        self.assertEqual(len(slow_log.get_slowest(10)), 3)
+
+    def test_partial_and_invalid_lines(self):
+        with open(self.path, 'w') as log_file:
+            log_file.write('not json\n{"command": "show route", '
+                           '"duration": 3}\n{"command": "sh')
+
+        slow_log = slowlog.SlowCommandLog(0.0, path=self.path)
+
+        self.assertEqual(slow_log.get_slowest(10), [entry('show route', 3)])
+
+    def test_without_file(self):
+        slow_log = slowlog.SlowCommandLog(1.0, size=2)
+        slow_log.record(entry('show route', 2.0))
+
+        self.assertEqual(slow_log.get_slowest(10), [entry('show route', 2.0)])
+
+
+class TailLinesTest(unittest.TestCase):
+
+    def test_across_blocks(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        path = os.path.join(folder, 'lines')
+
+        lines = ['{:05d}'.format(i) * 100 for i in range(100)]
+        with open(path, 'w') as lines_file:
+            lines_file.write('\n'.join(lines) + '\n')
+
+        self.assertEqual(slowlog.tail_lines(path, 30), lines[-30:])
+        self.assertEqual(slowlog.tail_lines(path, 1000), lines)
+        self.assertEqual(slowlog.tail_lines(path, 0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
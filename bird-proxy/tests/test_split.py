@@ -0,0 +1,139 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import time
+import unittest
+
+from bird_proxy.lib import birdtool
+
+from tests import fake_bird
+
+RANGE_REGEXP = re.compile(r'net ~ \[(?:.*, )?([^ ]+)/(\d+)\+\]')
+
+ROUTE = ('{:<18} via 193.239.116.10 on eth1 [peer_64500_0 2017-09-01 '
+         '10:00:00] * (100) [AS64500i]')
+
+
+class PrefixRangeTest(unittest.TestCase):
+    """Prefix ranges are halved into `net ~ [...]` conditions covering the
+    whole address space."""
+
+    def conditions(self, prefix_ranges, ip_version):
+        return [birdtool.prefix_range_condition(prefix_range, ip_version)
+                for prefix_range in prefix_ranges]
+
+    def test_ipv4(self):
+        halves = birdtool.halve_prefix_range((0, 0, ()), 32)
+
+        self.assertEqual(self.conditions(halves, 'ipv4'), [
+            'net ~ [0.0.0.0/0, 0.0.0.0/1+]',
+            'net ~ [128.0.0.0/1+]',
+        ])
+
+    def test_ipv4_at_depth(self):
+        first, second = birdtool.halve_prefix_range((0, 0, ()), 32)
+
+        # the prefixes of the ranges split on the way stay with the first
+        # half, exactly
+        self.assertEqual(
+            self.conditions(
+                birdtool.halve_prefix_range(first, 32) +
+                birdtool.halve_prefix_range(second, 32), 'ipv4'),
+            ['net ~ [0.0.0.0/0, 0.0.0.0/1, 0.0.0.0/2+]',
+             'net ~ [64.0.0.0/2+]',
+             'net ~ [128.0.0.0/1, 128.0.0.0/2+]',
+             'net ~ [192.0.0.0/2+]'])
+
+    def test_ipv6(self):
+        first, second = birdtool.halve_prefix_range((0, 0, ()), 128)
+
+        self.assertEqual(self.conditions([first, second], 'ipv6'), [
+            'net ~ [::/0, ::/1+]',
+            'net ~ [8000::/1+]',
+        ])
+        self.assertEqual(
+            self.conditions(birdtool.halve_prefix_range(second, 128), 'ipv6'),
+            ['net ~ [8000::/1, 8000::/2+]', 'net ~ [c000::/2+]'])
+
+
+class SplitRoutesTest(unittest.TestCase):
+    """Queries BIRD refuses as too long are split until the parts fit, and
+    their routes merged in address order."""
+
+    def reply(self, command):
+        match = RANGE_REGEXP.search(command)
+
+        # only the parts of depth 2 fit
+        if match is None or int(match.group(2)) < 2:
+            return '8000 Reply too long\n'
+
+        prefix = match.group(1)
+        if prefix in self.failing:
+            return '9001 syntax error\n'
+
+        # the first parts finish last
+        time.sleep(0.1 if prefix.startswith('0.') else 0.0)
+
+        return fake_bird.to_reply(
+            ROUTE.format('{}/{}'.format(prefix, match.group(2))))
+
+    def manager(self, **config):
+        self.failing = set()
+        self.bird = fake_bird.start(self, replies=self.reply)
+
+        return birdtool.BIRDManager('ipv4', self.bird.config(**config))
+
+    def test_merges_parts(self):
+        manager = self.manager(FANOUT_CONCURRENCY=2)
+
+        outcome, routes = manager.get_routes_information(split_depth=2)
+
+        self.assertIs(outcome, True)
+        self.assertEqual(
+            [route.prefix for route in routes],
+            ['0.0.0.0/2', '64.0.0.0/2', '128.0.0.0/2', '192.0.0.0/2'])
+        # one query, two halves, four quarters
+        self.assertEqual(len(self.bird.commands), 7)
+        self.assertEqual(self.bird.max_running, 2)
+
+    def test_too_long_without_depth(self):
+        manager = self.manager()
+
+        outcome, message = manager.get_routes_information(split_depth=1)
+
+        self.assertIs(outcome, False)
+        self.assertTrue(message.startswith(birdtool.REPLY_TOO_LONG))
+
+    def test_failing_part(self):
+        manager = self.manager()
+        self.failing.add('64.0.0.0')
+
+        outcome, message = manager.get_routes_information(split_depth=2)
+
+        self.assertIs(outcome, False)
+        self.assertTrue(message.startswith("Parse error"))
+
+    def test_disabled_by_default(self):
+        manager = self.manager()
+
+        outcome, _ = manager.get_routes_information()
+
+        self.assertIs(outcome, False)
+        self.assertEqual(len(self.bird.commands), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from bird_proxy.lib import spool
+
+
+class ResultSpoolTest(unittest.TestCase):
+    """Spooled results are read back a page at a time through cursors."""
+
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+
+        self.folder = os.path.join(folder, 'spool')
+        self.spool = spool.ResultSpool(self.folder, ttl=60)
+        self.lines = ['{{"route": {}}}'.format(i) for i in range(10)]
+
+    def read_pages(self, spool_id, limit):
+        pages = []
+        offset = 0
+
+        while offset is not None:
+            page, offset = self.spool.read(spool_id, offset, limit)
+            pages.append(page)
+
+            if offset is not None:
+                # every page is read through a cursor
+                cursor = spool.encode_cursor(spool_id, offset)
+                self.assertEqual(spool.decode_cursor(cursor),
+                                 (spool_id, offset))
+
+        return pages
+
+    def test_pages(self):
+        spool_id = self.spool.write(iter(self.lines))
+
+        self.assertEqual(self.read_pages(spool_id, 4),
+                         [self.lines[:4], self.lines[4:8], self.lines[8:]])
+        # the last full page has no cursor
+        self.assertEqual(self.read_pages(spool_id, 5),
+                         [self.lines[:5], self.lines[5:]])
+        self.assertEqual(self.read_pages(spool_id, 20), [self.lines])
+
+    def test_empty_result(self):
+        spool_id = self.spool.write(iter([]))
+
+        self.assertEqual(self.spool.read(spool_id, 0, 5), ([], None))
+
+    def test_invalid_cursors(self):
+        spool_id = self.spool.write(iter(self.lines))
+
+        for cursor in ['', 'x', spool.encode_cursor('a' * 31, 0),
+                       spool.encode_cursor('A' * 32, 0),
+                       spool.encode_cursor(spool_id, -1),
+                       spool.encode_cursor(spool_id + '.0', 0),
+                       spool_id, None]:
+            with self.assertRaises(spool.InvalidCursor):
+                spool.decode_cursor(cursor)
+
+        # offsets must be at the start of a line
+        with self.assertRaises(spool.InvalidCursor):
+            self.spool.read(spool_id, 3, 5)
+
+    def test_unknown_result(self):
+        self.spool.write(iter(self.lines))
+
+        with self.assertRaises(spool.CursorExpired):
+            self.spool.read('0' * 32, 0, 5)
+
+    def test_expired_results(self):
+        spool_id = self.spool.write(iter(self.lines))
+        page, offset = self.spool.read(spool_id, 0, 5)
+
+        path = os.path.join(self.folder, spool_id + spool.SPOOL_FILE_SUFFIX)
+        expired = time.time() - 120
+        os.utime(path, (expired, expired))
+
+        with self.assertRaises(spool.CursorExpired):
+            self.spool.read(spool_id, offset, 5)
+
+        # expired results are removed when the next one is written
+        self.spool.write(iter(self.lines))
+        self.assertFalse(os.path.exists(path))
+
+    def test_reading_keeps_result_alive(self):
+        spool_id = self.spool.write(iter(self.lines))
+
+        path = os.path.join(self.folder, spool_id + spool.SPOOL_FILE_SUFFIX)
+        stale = time.time() - 50
+        os.utime(path, (stale, stale))
+
+        self.spool.read(spool_id, 0, 5)
+        self.assertGreater(os.stat(path).st_mtime, stale)
+
+    def test_failed_write_is_removed(self):
+        def lines():
+            yield 'first'
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            self.spool.write(lines())
+
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# Copyright (c) 2017 NL-ix
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from bird_proxy.lib import birdtool, pool
+
+from tests import fake_bird, routes
+
+
+class StreamTest(unittest.TestCase):
+    """Streamed commands yield the same items as buffered ones while the
+    reply is received, and leave the connection reusable only if the reply
+    was read completely."""
+
+    def setUp(self):
+        self.text = routes.generate_show_route(20)
+        self.bird = fake_bird.start(self, replies={
+            'show route all': fake_bird.to_reply(self.text),
+            'show route all table T1': '8001 Network not in table\n',
+        }, chunk_size=50)
+        self.pool = pool.BirdSocketPool(self.bird.path, timeout=5.0)
+        self.command = birdtool.ShowRouteCommand(self.pool)
+
+    def test_stream_matches_parse_result(self):
+        self.assertEqual(
+            list(self.command.iter_items('show route all')),
+            self.command.parse_result((True, self.text))[1])
+        self.assertEqual(self.command.run('show route all'),
+                         self.command.parse_result((True, self.text)))
+
+    def test_items_are_yielded_while_received(self):
+        items = self.command.iter_items('show route all')
+        first = next(items)
+
+        # the connection is held until the reply is consumed
+        self.assertEqual(self.pool.get_stats()['in_use'], 1)
+        self.assertEqual(first.prefix, '10.0.0.0/24')
+        self.assertEqual(len(list(items)), 39)
+        self.assertEqual(self.pool.get_stats()['in_use'], 0)
+
+    def test_bird_error(self):
+        with self.assertRaises(birdtool.BIRDCommandError) as raised:
+            list(self.command.iter_items('show route all table T1'))
+
+        self.assertEqual(raised.exception.code, '8001')
+        self.assertEqual(str(raised.exception),
+                         'Route not found: Network not in table')
+        self.assertEqual(self.command.run('show route all table T1'),
+                         (False, 'Route not found: Network not in table\n'))
+
+        # the error ended the reply, the connection is still in sync
+        self.assertEqual(len(list(self.command.iter_items('show route all'))),
+                         40)
+        self.assertEqual(self.bird.connections, 1)
+
+    def test_abandoned_stream_closes_connection(self):
+        items = self.command.iter_items('show route all')
+        next(items)
+        items.close()
+
+        stats = self.pool.get_stats()
+        self.assertEqual((stats['open'], stats['discarded']), (0, 1))
+
+        self.assertEqual(len(list(self.command.iter_items('show route all'))),
+                         40)
+        self.assertEqual(self.bird.connections, 2)
+
+    def test_spontaneous_output(self):
+        # lines prefixed with `+` are not newline terminated
+        records = [('1007', 'a'), ('+', 'b'), ('+', 'c'), ('1007', 'd'),
+                   ('+', 'e')]
+
+        self.assertEqual(list(self.command.iter_record_lines(records)),
+                         ['a', 'bcd', 'e'])
+
+
+if __name__ == '__main__':
+    unittest.main()
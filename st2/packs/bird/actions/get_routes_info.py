@@ -28,7 +28,8 @@ class GetRoutesInfo(Action):
     def run(self, router_id, ip_version, store_results, ttl=None,
             forwarding_table=False, prefix=None,
             table=None, fltr=None, where=None, detail=False,
-            export_mode=None, export_protocol=None, protocol=None):
+            export_mode=None, export_protocol=None, protocol=None,
+            page_size=None, fields=None, query=None):
 
         try:
             config = self.config['bird_servers'][router_id]
@@ -43,7 +44,9 @@ class GetRoutesInfo(Action):
             'where': where,
             'detail': detail,
             'export_mode': export_mode,
-            'export_protocol': protocol
+            'export_protocol': protocol,
+            'fields': fields,
+            'query': json.dumps(query) if query is not None else None
         }
 
         dest_host = config.get('host')
@@ -55,7 +58,8 @@ class GetRoutesInfo(Action):
                                      listen_web_port,
                                      api_token,
                                      ip_version,
-                                     command_parameters).execute()
+                                     command_parameters,
+                                     page_size=page_size).execute()
         except BIRDProxyError as e:
             return (False, str(e))
 
@@ -110,7 +110,7 @@ class SessionsInfoRequest(BIRDProxyRequest):
 class RoutesInfoRequest(BIRDProxyRequest):
 
     def __init__(self, dest_host, listen_web_port,
-                 api_token, ip_version, command_parameters):
+                 api_token, ip_version, command_parameters, page_size=None):
         super(RoutesInfoRequest, self).__init__(dest_host,
                                                 listen_web_port,
                                                 api_token)
@@ -119,15 +119,10 @@ class RoutesInfoRequest(BIRDProxyRequest):
         self.url = 'routesinfo'
         self.command_parameters = command_parameters
 
-    def execute(self):
-
-        data = {
-            'api_token': self.api_token,
-            'ip_version': self.ip_version
-        }
-
-        data.update(self.command_parameters)
+        # when set, routes are retrieved in pages of this many routes
+        self.page_size = page_size
 
+    def _post(self, data):
         url = "{}/{}".format(self.base_url, self.url)
         try:
             r = requests.post(url, data=data)
@@ -136,3 +131,50 @@ class RoutesInfoRequest(BIRDProxyRequest):
                 "Error in the BIRD routes info retrieval: {}".format(e))
 
         return self._parse_response(r)
+
+    def iter_pages(self):
+        """Yield the responses of the pages of routes, following the cursor
+        of each page until the last one or a failed one."""
+        data = {
+            'api_token': self.api_token,
+            'ip_version': self.ip_version,
+            'limit': self.page_size
+        }
+
+        data.update(self.command_parameters)
+
+        while True:
+            resp_data = self._post(data)
+            yield resp_data
+
+            cursor = resp_data.get('cursor')
+            if not resp_data.get('outcome') or cursor is None:
+                return
+
+            data = {
+                'api_token': self.api_token,
+                'limit': self.page_size,
+                'cursor': cursor
+            }
+
+    def execute(self):
+
+        if self.page_size:
+            routes = []
+
+            for resp_data in self.iter_pages():
+                if not resp_data.get('outcome'):
+                    return resp_data
+
+                routes.extend(resp_data.get('message'))
+
+            return {'outcome': True, 'message': routes}
+
+        data = {
+            'api_token': self.api_token,
+            'ip_version': self.ip_version
+        }
+
+        data.update(self.command_parameters)
+
+        return self._post(data)